@@ -3,11 +3,15 @@
 block_cipher = None
 
 
-a = Analysis(['texture_viewer.py'],
+a = Analysis(['launcher.py'],
              pathex=['.'],
              binaries=[],
              datas=[('app.ico', 'ico')],
-             hiddenimports=[],
+             hiddenimports=[
+                 # imported lazily, invisible to the analysis
+                 'OpenGL.GL', 'PySide2.QtNetwork', 'numpy', 'PIL.Image',
+                 'PIL.TgaImagePlugin', 'PIL.PngImagePlugin', 'PIL.JpegImagePlugin',
+                 'PIL.TiffImagePlugin', 'PIL.BmpImagePlugin', 'PIL.DdsImagePlugin'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
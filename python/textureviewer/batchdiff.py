@@ -0,0 +1,108 @@
+# batch comparison of two image trees, for texture regression checks
+# every worker decodes one pair at a time and compares it in bands of rows,
+# so memory stays at a few images per process whatever the tree size
+import os
+import sys
+import json
+import filecmp
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from startup import lazy_import
+np = lazy_import("numpy")
+# Pillow, only for the difference images
+Image = lazy_import("PIL.Image")
+from imagediff import TDiffMetrics, diff_pixels
+# decoders only, the workers never load Qt widgets or OpenGL
+from imagedecode import SUPPORTED_IMAGES, decode_image
+
+
+# difference images are |a - b| times this, 8-bit rgb
+DIFF_IMAGE_GAIN = 16.0
+
+
+def relative_images(root):
+	# supported images under root, as paths relative to it
+	root = Path(root)
+	suffixes = {"." + s for s in SUPPORTED_IMAGES}
+	images = []
+	for folder, _, files in os.walk(root):
+		images.extend(
+			Path(folder, f).relative_to(root) for f in sorted(files) if Path(f).suffix.upper() in suffixes)
+	return images
+
+
+def _diff(job):
+	# runs in a worker, returns a report entry
+	rel, file_a, file_b, diff_path, threshold = job
+	entry = {"path": rel}
+	try:
+		if filecmp.cmp(file_a, file_b, shallow=False):
+			# same bytes, nothing to decode
+			entry.update(TDiffMetrics(0.0, 0.0, 0.0).as_dict())
+			return entry
+		a = decode_image(file_a, max_size=sys.maxsize)
+		b = decode_image(file_b, max_size=sys.maxsize)
+		image = None
+		on_band = None
+		if diff_path is not None:
+			w, h = a.size
+			image = np.zeros((h, w, 3), np.uint8)
+
+			def on_band(y0, d):
+				image[y0:y0 + d.shape[0]] = np.clip(d[..., :3] * (DIFF_IMAGE_GAIN * 255.0), 0.0, 255.0)
+		metrics = diff_pixels(a.pixels, b.pixels, threshold, on_band)
+		entry.update(metrics.as_dict())
+		if image is not None and metrics.max_error > threshold:
+			os.makedirs(os.path.dirname(diff_path), exist_ok=True)
+			Image.fromarray(image, "RGB").save(diff_path)
+			entry["diff"] = diff_path
+	except Exception as e:
+		entry["error"] = f"{type(e).__name__}: {e}"
+	return entry
+
+
+def diff_trees(src_a, src_b, report=None, diff_dir=None, threshold=0.0, jobs=None):
+	# compares the images src_a and src_b have in common, writes the json
+	# report (stdout without a path) and returns the number of changed,
+	# failed and unmatched files
+	files_a = set(relative_images(src_a))
+	files_b = set(relative_images(src_b))
+	common = sorted(files_a & files_b)
+	tasks = [
+		(
+			rel.as_posix(), str(Path(src_a, rel)), str(Path(src_b, rel)),
+			str(Path(diff_dir, rel).with_name(rel.stem + "_diff.png")) if diff_dir else None,
+			threshold)
+		for rel in common
+	]
+	entries = []
+	jobs = jobs or os.cpu_count() or 1
+	with ProcessPoolExecutor(jobs) as pool:
+		# chunks keep the per file overhead of the pool low
+		chunksize = max(1, len(tasks) // (jobs * 4))
+		for entry in pool.map(_diff, tasks, chunksize=chunksize):
+			entries.append(entry)
+			if "error" in entry:
+				print(f"{entry['path']}: {entry['error']}", file=sys.stderr)
+			elif entry["max_error"] > threshold:
+				print(f"{entry['path']}: psnr {entry['psnr']} max error {entry['max_error']:.4g}", file=sys.stderr)
+	changed = sum(1 for e in entries if "error" not in e and e["max_error"] > threshold)
+	failed = sum(1 for e in entries if "error" in e)
+	result = {
+		"a": str(src_a),
+		"b": str(src_b),
+		"threshold": threshold,
+		"compared": len(entries),
+		"changed": changed,
+		"failed": failed,
+		"only_a": sorted(p.as_posix() for p in files_a - files_b),
+		"only_b": sorted(p.as_posix() for p in files_b - files_a),
+		"files": entries,
+	}
+	text = json.dumps(result, indent=1)
+	if report:
+		with open(report, "w") as f:
+			f.write(text)
+	else:
+		print(text)
+	return changed + failed + len(result["only_a"]) + len(result["only_b"])
@@ -0,0 +1,262 @@
+# DirectDraw Surface reader
+# parses the header and the mip chain of block compressed surfaces so they
+# can be uploaded to the gpu as they are stored
+import struct
+from rawimage import TRawImage, map_file
+
+
+DDS_MAGIC = b"DDS "
+DDSD_MIPMAPCOUNT = 0x20000
+DDSCAPS2_CUBEMAP = 0x200
+DDSCAPS2_CUBEMAP_ALLFACES = 0xFC00
+DDSCAPS2_VOLUME = 0x200000
+DDS_RESOURCE_MISC_TEXTURECUBE = 0x4
+DDPF_ALPHAPIXELS = 0x1
+DDPF_FOURCC = 0x4
+DDPF_RGB = 0x40
+DDPF_LUMINANCE = 0x20000
+
+# OpenGL compressed internal formats
+GL_COMPRESSED_RGBA_S3TC_DXT1_EXT = 0x83F1
+GL_COMPRESSED_RGBA_S3TC_DXT3_EXT = 0x83F2
+GL_COMPRESSED_RGBA_S3TC_DXT5_EXT = 0x83F3
+GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT1_EXT = 0x8C4D
+GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT3_EXT = 0x8C4E
+GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT5_EXT = 0x8C4F
+GL_COMPRESSED_RED_RGTC1 = 0x8DBB
+GL_COMPRESSED_SIGNED_RED_RGTC1 = 0x8DBC
+GL_COMPRESSED_RG_RGTC2 = 0x8DBD
+GL_COMPRESSED_SIGNED_RG_RGTC2 = 0x8DBE
+GL_COMPRESSED_RGBA_BPTC_UNORM = 0x8E8C
+GL_COMPRESSED_SRGB_ALPHA_BPTC_UNORM = 0x8E8D
+GL_COMPRESSED_RGB_BPTC_SIGNED_FLOAT = 0x8E8E
+GL_COMPRESSED_RGB_BPTC_UNSIGNED_FLOAT = 0x8E8F
+
+# name, gl internal format, bytes per 4x4 block
+FOURCC_FORMATS = {
+	b"DXT1": ("BC1", GL_COMPRESSED_RGBA_S3TC_DXT1_EXT, 8),
+	b"DXT2": ("BC2", GL_COMPRESSED_RGBA_S3TC_DXT3_EXT, 16),
+	b"DXT3": ("BC2", GL_COMPRESSED_RGBA_S3TC_DXT3_EXT, 16),
+	b"DXT4": ("BC3", GL_COMPRESSED_RGBA_S3TC_DXT5_EXT, 16),
+	b"DXT5": ("BC3", GL_COMPRESSED_RGBA_S3TC_DXT5_EXT, 16),
+	b"ATI1": ("BC4", GL_COMPRESSED_RED_RGTC1, 8),
+	b"BC4U": ("BC4", GL_COMPRESSED_RED_RGTC1, 8),
+	b"BC4S": ("BC4 snorm", GL_COMPRESSED_SIGNED_RED_RGTC1, 8),
+	b"ATI2": ("BC5", GL_COMPRESSED_RG_RGTC2, 16),
+	b"BC5U": ("BC5", GL_COMPRESSED_RG_RGTC2, 16),
+	b"BC5S": ("BC5 snorm", GL_COMPRESSED_SIGNED_RG_RGTC2, 16),
+}
+
+# DXGI_FORMAT value: name, gl internal format, bytes per 4x4 block
+DXGI_FORMATS = {
+	70: ("BC1", GL_COMPRESSED_RGBA_S3TC_DXT1_EXT, 8),
+	71: ("BC1", GL_COMPRESSED_RGBA_S3TC_DXT1_EXT, 8),
+	72: ("BC1 srgb", GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT1_EXT, 8),
+	73: ("BC2", GL_COMPRESSED_RGBA_S3TC_DXT3_EXT, 16),
+	74: ("BC2", GL_COMPRESSED_RGBA_S3TC_DXT3_EXT, 16),
+	75: ("BC2 srgb", GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT3_EXT, 16),
+	76: ("BC3", GL_COMPRESSED_RGBA_S3TC_DXT5_EXT, 16),
+	77: ("BC3", GL_COMPRESSED_RGBA_S3TC_DXT5_EXT, 16),
+	78: ("BC3 srgb", GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT5_EXT, 16),
+	79: ("BC4", GL_COMPRESSED_RED_RGTC1, 8),
+	80: ("BC4", GL_COMPRESSED_RED_RGTC1, 8),
+	81: ("BC4 snorm", GL_COMPRESSED_SIGNED_RED_RGTC1, 8),
+	82: ("BC5", GL_COMPRESSED_RG_RGTC2, 16),
+	83: ("BC5", GL_COMPRESSED_RG_RGTC2, 16),
+	84: ("BC5 snorm", GL_COMPRESSED_SIGNED_RG_RGTC2, 16),
+	94: ("BC6H", GL_COMPRESSED_RGB_BPTC_UNSIGNED_FLOAT, 16),
+	95: ("BC6H", GL_COMPRESSED_RGB_BPTC_UNSIGNED_FLOAT, 16),
+	96: ("BC6H sf16", GL_COMPRESSED_RGB_BPTC_SIGNED_FLOAT, 16),
+	97: ("BC7", GL_COMPRESSED_RGBA_BPTC_UNORM, 16),
+	98: ("BC7", GL_COMPRESSED_RGBA_BPTC_UNORM, 16),
+	99: ("BC7 srgb", GL_COMPRESSED_SRGB_ALPHA_BPTC_UNORM, 16),
+}
+
+# uncompressed DXGI_FORMAT value: layout, bytes per pixel
+DXGI_LAYOUTS = {
+	28: ("RGBA", 4),
+	29: ("RGBA", 4),
+	61: ("L", 1),
+	87: ("BGRA", 4),
+	88: ("BGRX", 4),
+	91: ("BGRA", 4),
+}
+
+# legacy pixel format: bits, r, g, b, a masks -> layout
+MASK_LAYOUTS = {
+	(32, 0xFF, 0xFF00, 0xFF0000, 0xFF000000): "RGBA",
+	(32, 0xFF, 0xFF00, 0xFF0000, 0): "RGBX",
+	(32, 0xFF0000, 0xFF00, 0xFF, 0xFF000000): "BGRA",
+	(32, 0xFF0000, 0xFF00, 0xFF, 0): "BGRX",
+	(24, 0xFF0000, 0xFF00, 0xFF, 0): "BGR",
+	(24, 0xFF, 0xFF00, 0xFF0000, 0): "RGB",
+	(8, 0xFF, 0, 0, 0): "L",
+}
+
+# any of the extensions enables the format, None means core in GL 3.0
+FORMAT_EXTENSIONS = {
+	GL_COMPRESSED_RGBA_S3TC_DXT1_EXT: ("GL_EXT_texture_compression_s3tc",),
+	GL_COMPRESSED_RGBA_S3TC_DXT3_EXT: ("GL_EXT_texture_compression_s3tc",),
+	GL_COMPRESSED_RGBA_S3TC_DXT5_EXT: ("GL_EXT_texture_compression_s3tc",),
+	GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT1_EXT: ("GL_EXT_texture_sRGB", "GL_EXT_texture_compression_s3tc_srgb"),
+	GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT3_EXT: ("GL_EXT_texture_sRGB", "GL_EXT_texture_compression_s3tc_srgb"),
+	GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT5_EXT: ("GL_EXT_texture_sRGB", "GL_EXT_texture_compression_s3tc_srgb"),
+	GL_COMPRESSED_RED_RGTC1: None,
+	GL_COMPRESSED_SIGNED_RED_RGTC1: None,
+	GL_COMPRESSED_RG_RGTC2: None,
+	GL_COMPRESSED_SIGNED_RG_RGTC2: None,
+	GL_COMPRESSED_RGBA_BPTC_UNORM: ("GL_ARB_texture_compression_bptc", "GL_EXT_texture_compression_bptc"),
+	GL_COMPRESSED_SRGB_ALPHA_BPTC_UNORM: ("GL_ARB_texture_compression_bptc", "GL_EXT_texture_compression_bptc"),
+	GL_COMPRESSED_RGB_BPTC_SIGNED_FLOAT: ("GL_ARB_texture_compression_bptc", "GL_EXT_texture_compression_bptc"),
+	GL_COMPRESSED_RGB_BPTC_UNSIGNED_FLOAT: ("GL_ARB_texture_compression_bptc", "GL_EXT_texture_compression_bptc"),
+}
+
+
+class TDDSImage:
+	def __init__(self, data, size, name, internal_format, mips, layers=(), cube=False):
+		# mapped file, mips are (width, height, offset, nbytes) into it
+		self.data = data
+		self.size = size
+		self.name = name
+		self.internal_format = internal_format
+		self.mips = mips
+		# mips of every array layer or cube face, empty for one surface
+		self.layers = layers
+		self.cube = cube
+
+	@property
+	def nbytes(self):
+		return sum(m[3] for m in self.mips)
+
+	def surface(self, layer):
+		# one layer or face as a single surface image
+		return TDDSImage(self.data, self.size, self.name, self.internal_format, self.layers[layer])
+
+
+def supported_formats(has_extension):
+	# gl internal formats the context can sample natively
+	formats = set()
+	for internal_format, extensions in FORMAT_EXTENSIONS.items():
+		if extensions is None or any(has_extension(e) for e in extensions):
+			formats.add(internal_format)
+	return frozenset(formats)
+
+
+def _raw_chain(data, offset, size, bpp, mip_count):
+	# levels below the surface at offset, and the end of its chain, every
+	# level of a layer is stored before the next layer
+	mips = []
+	w, h = size
+	end = offset + size[0] * bpp * h
+	for _ in range(mip_count - 1):
+		if w == 1 and h == 1:
+			break
+		w, h = max(1, w // 2), max(1, h // 2)
+		if end + w * h * bpp > len(data):
+			break
+		mips.append((w, h, end))
+		end += w * h * bpp
+	return tuple(mips), end
+
+
+def _read_raw(data, offset, size, layout, bpp, mip_count=1, layer_count=1, cube=False):
+	# every surface and the complete levels stored after each one
+	pitch = size[0] * bpp
+	layers = []
+	for _ in range(layer_count):
+		if offset + pitch * size[1] > len(data):
+			break
+		mips, end = _raw_chain(data, offset, size, bpp, mip_count)
+		layers.append((offset, mips))
+		offset = end
+	if not layers:
+		return None
+	# before _complete, which drops the layers of a single surface
+	first, mips = layers[0]
+	layers, cube = _complete(layers, cube)
+	return TRawImage(data, first, size, pitch, bpp, layout, False, mips, tuple(layers), cube)
+
+
+def _complete(layers, cube):
+	# one surface needs no layers, a truncated cube is shown as an array
+	if len(layers) == 1:
+		return (), False
+	return layers, cube and len(layers) % 6 == 0
+
+
+def _layer_count(data, caps2, dx10):
+	# surfaces in the file, cube faces times array size, and the cube flag
+	cube = bool(caps2 & DDSCAPS2_CUBEMAP)
+	faces = bin(caps2 & DDSCAPS2_CUBEMAP_ALLFACES).count("1") if cube else 1
+	array_size = 1
+	if dx10:
+		misc, array_size = struct.unpack_from("<2I", data, 136)
+		if misc & DDS_RESOURCE_MISC_TEXTURECUBE:
+			cube, faces = True, 6
+	return max(1, faces) * max(1, array_size), cube and faces == 6
+
+
+def read_dds(filename):
+	# block compressed surfaces are returned as TDDSImage, plain 8-bit ones
+	# as TRawImage over the mapped file, None for anything else
+	data = map_file(filename)
+	if len(data) < 128 or data[:4] != DDS_MAGIC:
+		return None
+	flags, height, width = struct.unpack_from("<3I", data, 8)
+	mip_count, = struct.unpack_from("<I", data, 28)
+	pf_flags, fourcc, bits = struct.unpack_from("<I4sI", data, 80)
+	masks = struct.unpack_from("<4I", data, 92)
+	caps2, = struct.unpack_from("<I", data, 112)
+	if not flags & DDSD_MIPMAPCOUNT:
+		mip_count = 1
+	mip_count = max(1, mip_count)
+	# the first slice of a volume is shown as it is
+	dx10 = fourcc == b"DX10" and pf_flags & DDPF_FOURCC and len(data) >= 148
+	layer_count, cube = _layer_count(data, caps2, dx10) if not caps2 & DDSCAPS2_VOLUME else (1, False)
+	if not pf_flags & DDPF_FOURCC:
+		if not pf_flags & (DDPF_RGB | DDPF_LUMINANCE):
+			return None
+		if not pf_flags & DDPF_ALPHAPIXELS:
+			masks = masks[:3] + (0,)
+		layout = MASK_LAYOUTS.get((bits,) + masks)
+		if layout is None:
+			return None
+		return _read_raw(data, 128, (width, height), layout, bits // 8, mip_count, layer_count, cube)
+	offset = 128
+	if fourcc == b"DX10":
+		if len(data) < 148:
+			return None
+		dxgi_format, = struct.unpack_from("<I", data, 128)
+		offset = 148
+		if dxgi_format in DXGI_LAYOUTS:
+			return _read_raw(data, offset, (width, height), *DXGI_LAYOUTS[dxgi_format], mip_count, layer_count, cube)
+		fmt = DXGI_FORMATS.get(dxgi_format)
+	else:
+		fmt = FOURCC_FORMATS.get(fourcc)
+	if fmt is None:
+		return None
+
+	name, internal_format, block_size = fmt
+	# every surface, complete levels only
+	layers = []
+	for _ in range(layer_count):
+		mips = []
+		w, h = width, height
+		for _ in range(mip_count):
+			nbytes = max(1, (w + 3) // 4) * max(1, (h + 3) // 4) * block_size
+			if offset + nbytes > len(data):
+				break
+			mips.append((w, h, offset, nbytes))
+			offset += nbytes
+			if w == 1 and h == 1:
+				break
+			w, h = max(1, w // 2), max(1, h // 2)
+		# the next layer starts after the whole chain, a short one ends the file
+		if not mips or (layers and len(mips) < len(layers[0])):
+			break
+		layers.append(mips)
+	if not layers:
+		return None
+	first = layers[0]
+	layers, cube = _complete(layers, cube)
+	return TDDSImage(data, (width, height), name, internal_format, first, tuple(layers), cube)
@@ -0,0 +1,424 @@
+# gl side of the images
+# shaders of the viewport and the thumbnailer, programs and textures made
+# from decoded images, with a current context
+import ctypes
+from time import perf_counter
+from array import array
+from PySide2.QtGui import QMatrix4x4
+from PySide2.QtGui import QVector4D
+from PySide2.QtGui import QOpenGLShader
+from PySide2.QtGui import QOpenGLShaderProgram
+from PySide2.QtGui import QOpenGLTexture
+from PySide2.QtGui import QImage
+from startup import lazy_import
+GL = lazy_import("OpenGL.GL")
+from dds import TDDSImage
+from programcache import program_cache, program_key
+from imagedecode import PIXEL_FORMATS, GL_TEXTURE_2D, GL_TEXTURE_CUBE_MAP, GL_TEXTURE_CUBE_MAP_POSITIVE_X
+
+
+# tonemap operators of the fragment shader
+TONEMAP_NONE = 0
+TONEMAP_REINHARD = 1
+TONEMAP_ACES = 2
+TONEMAP_NAMES = ("Clamp", "Reinhard", "ACES")
+# display gamma of linear, floating point images
+DEFAULT_GAMMA = 2.2
+
+
+def buffer_address(data):
+	# address of a bytes-like object, without copying it
+	if isinstance(data, bytes):
+		return ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p).value
+	return ctypes.addressof(ctypes.c_char.from_buffer(data))
+
+
+# quad, 3 position | 2 texture coord
+QUAD_INDICES = array('I', [0, 1, 3, 1, 2, 3])
+QUAD_VERTICES = array('f', [
+	 1.0,  1.0, 0.0, 1.0, 1.0,  # top right
+	 1.0, -1.0, 0.0, 1.0, 0.0,  # bottom right
+	-1.0, -1.0, 0.0, 0.0, 0.0,  # bottom left
+	-1.0,  1.0, 0.0, 0.0, 1.0   # top left
+])
+
+# shader code (OpenGL ES)
+# texture
+VS_TEXTURE = """
+attribute highp vec3 Pos;
+attribute highp vec2 UV;
+uniform highp vec4 Scale;
+uniform highp vec4 Tile;
+uniform highp float Flip;
+uniform highp float FlipB;
+varying highp vec2 oUV;
+varying highp vec2 oUVB;
+varying highp vec2 oPos;
+void main() {
+	// image space, origin top left, Tile is offset and size in it
+	highp vec2 uv = vec2(UV.x, 1.0 - UV.y);
+	highp vec2 p = Tile.xy + uv * Tile.zw;
+	// Flip is 1 for textures stored bottom to top
+	oUV = vec2(uv.x, mix(uv.y, 1.0 - uv.y, Flip));
+	// the compared texture spans the whole image, also under a tile
+	oUVB = vec2(p.x, mix(p.y, 1.0 - p.y, FlipB));
+	oPos = p;
+	// Scale.xy is the zoom, Scale.zw the pan offset, both in clip space
+	gl_Position = vec4((vec2(p.x, 1.0 - p.y) * 2.0 - 1.0) * Scale.xy + Scale.zw, 0.0, 1.0);
+}
+"""
+FS_TEXTURE = """
+varying highp vec2 oUV;
+varying highp vec2 oUVB;
+varying highp vec2 oPos;
+uniform sampler2D Texture;
+uniform sampler2D TextureB;
+uniform samplerCube Cube;
+uniform highp mat4 Channels;
+uniform highp mat4 Source;
+uniform highp vec4 Add;
+uniform highp mat4 SourceB;
+uniform highp vec4 AddB;
+// x is the mode, 0 A, 1 split at y, 2 B, 3 difference times z
+uniform highp vec4 Compare;
+// x exposure scale, y 1 / gamma, z tonemap, 0 clamp, 1 reinhard, 2 aces
+uniform highp vec4 Tone;
+// x 0 the 2D texture, 1 cube face y, 2 the unfolded cube
+uniform highp vec4 Layout;
+highp vec3 CubeDir(highp float face, highp vec2 uv) {
+	// inverse of the face selection of the gl spec, uv as the rows are stored
+	highp vec2 c = uv * 2.0 - 1.0;
+	if (face < 0.5)
+		return vec3(1.0, -c.y, -c.x);
+	if (face < 1.5)
+		return vec3(-1.0, -c.y, c.x);
+	if (face < 2.5)
+		return vec3(c.x, 1.0, c.y);
+	if (face < 3.5)
+		return vec3(c.x, -1.0, -c.y);
+	if (face < 4.5)
+		return vec3(c.x, -c.y, 1.0);
+	return vec3(-c.x, -c.y, -1.0);
+}
+void main() {
+	// Source and Add map the stored channels to rgba
+	highp vec4 color;
+	if (Layout.x > 0.5) {
+		highp float face = Layout.y;
+		highp vec2 uv = oUV;
+		if (Layout.x > 1.5) {
+			// horizontal cross, -X +Z +X -Z in the middle row, +Y above and -Y below +Z
+			highp vec2 cell = floor(oUV * vec2(4.0, 3.0));
+			uv = fract(oUV * vec2(4.0, 3.0));
+			face = -1.0;
+			if (cell.y == 1.0)
+				face = cell.x < 0.5 ? 1.0 : cell.x < 1.5 ? 4.0 : cell.x < 2.5 ? 0.0 : 5.0;
+			else if (cell.x == 1.0)
+				face = cell.y < 0.5 ? 2.0 : 3.0;
+			if (face < 0.0)
+				discard;
+		}
+		color = textureCube(Cube, CubeDir(face, uv)) * Source + Add;
+	} else
+		color = texture2D(Texture, oUV) * Source + Add;
+	if (Compare.x > 0.5) {
+		highp vec4 colorB = texture2D(TextureB, oUVB) * SourceB + AddB;
+		if (Compare.x < 1.5)
+			color = oPos.x < Compare.y ? color : colorB;
+		else if (Compare.x < 2.5)
+			color = colorB;
+		else
+			color = abs(color - colorB) * Compare.z;
+	}
+	highp vec3 c = max(color.rgb * Tone.x, 0.0);
+	if (Tone.z > 1.5)
+		c = clamp(c * (2.51 * c + 0.03) / (c * (2.43 * c + 0.59) + 0.14), 0.0, 1.0);
+	else if (Tone.z > 0.5)
+		c = c / (1.0 + c);
+	color.rgb = pow(c, vec3(Tone.y));
+	gl_FragColor = color * Channels;
+	gl_FragColor.a += (1.0 - Channels[3][3]);
+}
+"""
+# background
+VS_GRID = """
+attribute highp vec3 Pos;
+void main() {
+	gl_Position = vec4(Pos, 1.0);
+}
+"""
+FS_GRID = """
+uniform highp vec4 Color1;
+uniform highp vec4 Color2;
+uniform highp vec4 Height;
+void main() {
+	highp vec2 a = floor((Height.xy - gl_FragCoord.xy) / 64.0);
+	highp float even = mod(a.x + a.y, 2.0);
+	highp vec3 c = mix(Color1.rgb, Color2.rgb, even);
+	gl_FragColor = vec4(c, 1);
+}
+"""
+
+
+def tone_values(exposure, gamma, tonemap, linear):
+	# Tone uniform, exposure in stops, gamma only encodes linear data
+	return 2.0 ** exposure, 1.0 / gamma if linear else 1.0, float(tonemap), 0.0
+
+
+def source_uniforms(source):
+	# Source and Add uniforms of one of the SOURCE_* mappings
+	matrix, add = source
+	return QMatrix4x4(*matrix), QVector4D(*add)
+
+
+def channels_matrix(r, g, b, a):
+	# Channels uniform for the channel toggles, a single channel shows as grey
+	r, g, b, a = float(r), float(g), float(b), float(a)
+	s = r + g + b
+	if s > 1.1:
+		return QMatrix4x4(
+			r, 0, 0, 0,
+			0, g, 0, 0,
+			0, 0, b, 0,
+			0, 0, 0, a
+		)
+	elif s < 0.1:
+		return QMatrix4x4(
+			0, 0, 0, 0,
+			0, 0, 0, 0,
+			0, 0, 0, 0,
+			a, a, a, 0
+		)
+	elif a:
+		return QMatrix4x4(
+			r, 0, 0, 0,
+			0, g, 0, 0,
+			0, 0, b, 0,
+			0, 0, 0, a
+		)
+	else:
+		return QMatrix4x4(
+			r, r, r, 0,
+			g, g, g, 0,
+			b, b, b, 0,
+			0, 0, 0, a
+
+		)
+
+
+def create_shader(type_: QOpenGLShader.ShaderType, source):
+	shader = QOpenGLShader(type_)
+	r = shader.compileSourceCode(source)
+	if not r:
+		print(shader.log())
+	return shader
+
+
+def create_program(context, vs_source, fs_source, attributes, gl_info=None):
+	# with gl_info the linked binary is looked up in and stored to the
+	# program cache, sources are compiled only when it misses or is rejected
+	start = perf_counter()
+	program = QOpenGLShaderProgram(context)
+	cached = gl_info is not None and program.create() and program_cache.supported()
+	if cached:
+		key = program_key(gl_info, vs_source, fs_source, attributes)
+		# link picks up a program the binary already linked
+		if program_cache.load(program.programId(), key) and program.link():
+			program_cache.add_hit(perf_counter() - start)
+			return program
+		program_cache.prepare(program.programId())
+	program.addShader(create_shader(QOpenGLShader.Vertex, vs_source))
+	program.addShader(create_shader(QOpenGLShader.Fragment, fs_source))
+	# attribute location
+	for location, name in enumerate(attributes):
+		program.bindAttributeLocation(name, location)
+	# link program
+	r = program.link()
+	if not r:
+		print(program.log())
+	elif cached:
+		program_cache.store(program.programId(), key)
+	program_cache.add_compile(perf_counter() - start)
+	return program
+
+
+def create_texture(image, pbo=0):
+	# texture with a full mip chain, from a TPixels or a QImage, levels the
+	# file has are uploaded as they are, the others are made on the gpu
+	texture = QOpenGLTexture(QOpenGLTexture.Target2D)
+	texture.create()
+	if isinstance(image, QImage):
+		texture.bind()
+		texture.setData(image, QOpenGLTexture.GenerateMipMaps)
+	elif image.mips:
+		texture.setSize(*image.size)
+		texture.setMipLevels(len(image.mips) + 1)
+		texture.bind()
+		upload_pixels(image, pbo)
+		for level, mip in enumerate(image.mips, 1):
+			upload_pixels(mip, pbo, level)
+		GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAX_LEVEL, len(image.mips))
+	else:
+		texture.setSize(*image.size)
+		texture.setMipLevels(texture.maximumMipLevels())
+		texture.bind()
+		upload_pixels(image, pbo)
+		texture.generateMipMaps()
+	texture.setMinMagFilters(QOpenGLTexture.LinearMipMapLinear, QOpenGLTexture.Linear)
+	# clamp, tiles must not bleed into each other
+	texture.setWrapMode(QOpenGLTexture.DirectionS, QOpenGLTexture.ClampToEdge)
+	texture.setWrapMode(QOpenGLTexture.DirectionT, QOpenGLTexture.ClampToEdge)
+	texture.release()
+	return texture
+
+
+def upload_pixels(pixels, pbo=0, level=0, update=False, target=GL_TEXTURE_2D):
+	# one level of the bound texture straight from the packed buffer,
+	# update writes into the existing storage instead of allocating it
+	internal, fmt, type_, swap, _ = PIXEL_FORMATS[pixels.mode]
+	w, h = pixels.size
+	address = buffer_address(pixels.data) + pixels.offset
+	# describe padded rows instead of repacking them
+	row = w * pixels.bpp
+	if pixels.pitch == row:
+		GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+	elif pixels.pitch == (row + 3) // 4 * 4:
+		GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 4)
+	else:
+		GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+		GL.glPixelStorei(GL.GL_UNPACK_ROW_LENGTH, pixels.pitch // pixels.bpp)
+	if swap:
+		GL.glPixelStorei(GL.GL_UNPACK_SWAP_BYTES, GL.GL_TRUE)
+	if pbo:
+		GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, pbo)
+		# orphan the previous storage, the driver may still be reading it
+		GL.glBufferData(GL.GL_PIXEL_UNPACK_BUFFER, pixels.span, None, GL.GL_STREAM_DRAW)
+		ptr = GL.glMapBufferRange(
+			GL.GL_PIXEL_UNPACK_BUFFER, 0, pixels.span,
+			GL.GL_MAP_WRITE_BIT | GL.GL_MAP_INVALIDATE_BUFFER_BIT)
+		ctypes.memmove(ptr, address, pixels.span)
+		GL.glUnmapBuffer(GL.GL_PIXEL_UNPACK_BUFFER)
+		tex_image(level, internal, w, h, fmt, type_, ctypes.c_void_p(0), update, target)
+		GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+	else:
+		tex_image(level, internal, w, h, fmt, type_, ctypes.c_void_p(address), update, target)
+	if swap:
+		GL.glPixelStorei(GL.GL_UNPACK_SWAP_BYTES, GL.GL_FALSE)
+	GL.glPixelStorei(GL.GL_UNPACK_ROW_LENGTH, 0)
+	GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 4)
+
+
+def tex_image(level, internal, w, h, fmt, type_, pointer, update=False, target=GL_TEXTURE_2D):
+	if update:
+		GL.glTexSubImage2D(target, level, 0, 0, w, h, fmt, type_, pointer)
+	else:
+		GL.glTexImage2D(target, level, internal, w, h, 0, fmt, type_, pointer)
+
+
+def update_texture(texture, pixels, pbo=0):
+	# new pixels of the same storage layout, the texture object is kept
+	texture.bind()
+	upload_pixels(pixels, pbo, 0, True)
+	if pixels.mips:
+		for level, mip in enumerate(pixels.mips, 1):
+			upload_pixels(mip, pbo, level, True)
+	else:
+		texture.generateMipMaps()
+	texture.release()
+
+
+def create_compressed_texture(dds):
+	texture = QOpenGLTexture(QOpenGLTexture.Target2D)
+	texture.create()
+	# size and levels for bookkeeping, storage comes from the blocks
+	texture.setSize(*dds.size)
+	texture.setMipLevels(len(dds.mips))
+	texture.bind()
+	address = buffer_address(dds.data)
+	for level, (w, h, offset, nbytes) in enumerate(dds.mips):
+		GL.glCompressedTexImage2D(
+			GL.GL_TEXTURE_2D, level, dds.internal_format, w, h, 0, nbytes, ctypes.c_void_p(address + offset))
+	# a partial chain is complete up to its last level
+	GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAX_LEVEL, len(dds.mips) - 1)
+	if len(dds.mips) > 1:
+		texture.setMinMagFilters(QOpenGLTexture.LinearMipMapLinear, QOpenGLTexture.Linear)
+	else:
+		texture.setMinMagFilters(QOpenGLTexture.Linear, QOpenGLTexture.Linear)
+	texture.setWrapMode(QOpenGLTexture.DirectionS, QOpenGLTexture.ClampToEdge)
+	texture.setWrapMode(QOpenGLTexture.DirectionT, QOpenGLTexture.ClampToEdge)
+	texture.release()
+	return texture
+
+
+def create_cube_texture(faces, pbo=0):
+	# cube map of six TPixels or TDDSImage, in GL_TEXTURE_CUBE_MAP_POSITIVE_X order
+	texture = QOpenGLTexture(QOpenGLTexture.TargetCubeMap)
+	texture.create()
+	texture.setSize(*faces[0].size)
+	texture.bind()
+	if isinstance(faces[0], TDDSImage):
+		levels = len(faces[0].mips)
+		for face, dds in enumerate(faces):
+			address = buffer_address(dds.data)
+			for level, (w, h, offset, nbytes) in enumerate(dds.mips):
+				GL.glCompressedTexImage2D(
+					GL_TEXTURE_CUBE_MAP_POSITIVE_X + face, level, dds.internal_format, w, h, 0, nbytes,
+					ctypes.c_void_p(address + offset))
+	else:
+		levels = len(faces[0].mips) + 1
+		for face, pixels in enumerate(faces):
+			target = GL_TEXTURE_CUBE_MAP_POSITIVE_X + face
+			upload_pixels(pixels, pbo, 0, target=target)
+			for level, mip in enumerate(pixels.mips, 1):
+				upload_pixels(mip, pbo, level, target=target)
+		if levels == 1:
+			GL.glGenerateMipmap(GL_TEXTURE_CUBE_MAP)
+			levels = 0
+	if levels:
+		GL.glTexParameteri(GL_TEXTURE_CUBE_MAP, GL.GL_TEXTURE_MAX_LEVEL, levels - 1)
+	if levels == 1:
+		texture.setMinMagFilters(QOpenGLTexture.Linear, QOpenGLTexture.Linear)
+	else:
+		texture.setMinMagFilters(QOpenGLTexture.LinearMipMapLinear, QOpenGLTexture.Linear)
+	texture.setWrapMode(QOpenGLTexture.DirectionS, QOpenGLTexture.ClampToEdge)
+	texture.setWrapMode(QOpenGLTexture.DirectionT, QOpenGLTexture.ClampToEdge)
+	texture.release()
+	return texture
+
+
+def texture_nbytes(data, texture):
+	# gpu storage of the texture made from data, file mips or a full chain
+	if data.surfaces:
+		return texture.nbytes
+	if data.compressed is not None:
+		return data.compressed.nbytes
+	if data.pixels is not None:
+		return data.pixels.nbytes * 4 // 3
+	return texture.width() * texture.height() * 4 * 4 // 3
+
+
+class TLayeredTexture:
+	# every layer of an array, or every cube of a cube array, is uploaded
+	# once, showing another one only binds it
+	def __init__(self, textures, cube, nbytes):
+		self.textures = textures
+		self.cube = cube
+		self.nbytes = nbytes
+
+	def width(self):
+		return self.textures[0].width()
+
+	def destroy(self):
+		for texture in self.textures:
+			texture.destroy()
+
+
+def create_layered_texture(surfaces, cube, pbo=0):
+	if cube:
+		textures = [create_cube_texture(surfaces[i:i + 6], pbo) for i in range(0, len(surfaces), 6)]
+	else:
+		textures = [
+			create_compressed_texture(s) if isinstance(s, TDDSImage) else create_texture(s, pbo)
+			for s in surfaces]
+	nbytes = sum(s.nbytes if isinstance(s, TDDSImage) else s.nbytes * 4 // 3 for s in surfaces)
+	return TLayeredTexture(textures, cube, nbytes)
@@ -0,0 +1,242 @@
+# floating point image readers
+# Radiance RGBE and scanline OpenEXR files are decoded with numpy into
+# half or single float arrays, the values are never clamped or requantized
+import zlib
+import struct
+from pathlib import Path
+from startup import lazy_import
+np = lazy_import("numpy")
+from rawimage import map_file
+
+
+# largest finite half float, brighter RGBE files are kept in 32-bit floats
+HALF_MAX = 65504.0
+
+EXR_MAGIC = 20000630
+# version flags of tiled, deep and multi-part files
+EXR_UNSUPPORTED = 0x200 | 0x800 | 0x1000
+# compression: name, scanlines per chunk, only the ones decoded here
+EXR_COMPRESSIONS = {
+	0: ("none", 1),
+	1: ("rle", 1),
+	2: ("zips", 1),
+	3: ("zip", 16),
+}
+EXR_COMPRESSION_NAMES = ("none", "rle", "zips", "zip", "piz", "pxr24", "b44", "b44a", "dwaa", "dwab")
+# pixel type: numpy dtype
+EXR_TYPES = {
+	0: "<u4",
+	1: "<f2",
+	2: "<f4",
+}
+
+
+class TFloatImage:
+	def __init__(self, array, name):
+		# array is height x width x channels, float16 or float32, top to bottom
+		self.array = array
+		self.name = name
+
+	@property
+	def size(self):
+		return self.array.shape[1], self.array.shape[0]
+
+
+def read_hdr(filename):
+	with open(filename, "rb") as f:
+		data = f.read()
+	if not data.startswith((b"#?RADIANCE", b"#?RGBE")):
+		raise OSError("not a Radiance file")
+	# header lines up to an empty one, then the resolution line
+	end = data.find(b"\n\n")
+	if end < 0:
+		raise OSError("truncated Radiance header")
+	pos = data.find(b"\n", end + 2)
+	resolution = data[end + 2:pos].split()
+	if len(resolution) != 4 or resolution[0] not in (b"-Y", b"+Y") or resolution[2] != b"+X":
+		raise OSError("unsupported Radiance orientation")
+	h, w = int(resolution[1]), int(resolution[3])
+	pos += 1
+	if 8 <= w < 0x8000 and data[pos:pos + 2] == b"\x02\x02":
+		rgbe = _read_rgbe_rle(data, pos, w, h)
+	else:
+		if len(data) < pos + w * h * 4:
+			raise OSError("truncated Radiance data")
+		rgbe = np.frombuffer(data, np.uint8, w * h * 4, pos).reshape(h, w, 4)
+	if resolution[0] == b"+Y":
+		rgbe = rgbe[::-1]
+	# mantissas scaled by the shared exponent, 0 is black
+	e = rgbe[..., 3].astype(np.int32)
+	scale = np.where(e > 0, np.ldexp(np.float32(1.0), e - 136), np.float32(0.0)).astype(np.float32)
+	rgb = (rgbe[..., :3] + np.float32(0.5)) * scale[..., None]
+	if float(rgb.max(initial=0.0)) <= HALF_MAX:
+		rgb = rgb.astype(np.float16)
+	return TFloatImage(rgb, "HDR")
+
+
+def _read_rgbe_rle(data, pos, w, h):
+	# adaptive run length scanlines, each holds the four channel planes
+	planes = bytearray(h * 4 * w)
+	for y in range(h):
+		if data[pos:pos + 2] != b"\x02\x02" or (data[pos + 2] << 8 | data[pos + 3]) != w:
+			raise OSError("bad Radiance scanline")
+		pos += 4
+		for c in range(4):
+			x = (y * 4 + c) * w
+			end = x + w
+			while x < end:
+				n = data[pos]
+				if n > 128:
+					n -= 128
+					planes[x:x + n] = data[pos + 1:pos + 2] * n
+					pos += 2
+				else:
+					planes[x:x + n] = data[pos + 1:pos + 1 + n]
+					pos += 1 + n
+				if not n:
+					raise OSError("bad Radiance run")
+				x += n
+	return np.frombuffer(planes, np.uint8).reshape(h, 4, w).transpose(0, 2, 1)
+
+
+def _exr_attributes(data):
+	# name: (type, bytes) up to the null byte ending the header
+	attributes = {}
+	pos = 8
+	while data[pos]:
+		end = data.find(b"\0", pos)
+		name = data[pos:end].decode("latin-1")
+		pos = end + 1
+		end = data.find(b"\0", pos)
+		type_ = data[pos:end].decode("latin-1")
+		size, = struct.unpack_from("<i", data, end + 1)
+		pos = end + 5
+		attributes[name] = (type_, data[pos:pos + size])
+		pos += size
+	return attributes, pos + 1
+
+
+def _exr_channels(value):
+	# name, pixel type, x sampling, y sampling, in file order
+	channels = []
+	pos = 0
+	while value[pos]:
+		end = value.index(b"\0", pos)
+		name = value[pos:end].decode("latin-1")
+		pixel_type, x_sampling, y_sampling = struct.unpack_from("<i4xii", value, end + 1)
+		channels.append((name, pixel_type, x_sampling, y_sampling))
+		pos = end + 17
+	return channels
+
+
+def _exr_rle(raw, size):
+	out = bytearray()
+	pos = 0
+	while pos < len(raw) and len(out) < size:
+		n = raw[pos]
+		if n > 127:
+			n = 256 - n
+			out += raw[pos + 1:pos + 1 + n]
+			pos += 1 + n
+		else:
+			out += raw[pos + 1:pos + 2] * (n + 1)
+			pos += 2
+	return bytes(out)
+
+
+def _exr_uncompress(raw, compression, size):
+	# zip and rle share the byte predictor and the split into two halves
+	if compression == 1:
+		t = _exr_rle(raw, size)
+	else:
+		t = zlib.decompress(raw)
+	if len(t) != size:
+		raise OSError("bad EXR chunk")
+	d = np.frombuffer(t, np.uint8).copy()
+	d[1:] -= 128
+	d = np.cumsum(d, dtype=np.uint8)
+	out = np.empty_like(d)
+	half = (size + 1) // 2
+	out[0::2] = d[:half]
+	out[1::2] = d[half:]
+	return out
+
+
+def read_exr(filename):
+	data = map_file(filename)
+	if len(data) < 8:
+		raise OSError("not an OpenEXR file")
+	magic, version = struct.unpack_from("<ii", data, 0)
+	if magic != EXR_MAGIC:
+		raise OSError("not an OpenEXR file")
+	if version & EXR_UNSUPPORTED:
+		raise OSError("tiled, deep and multi-part OpenEXR files are not supported")
+	attributes, pos = _exr_attributes(data)
+	compression = attributes["compression"][1][0]
+	if compression not in EXR_COMPRESSIONS:
+		name = EXR_COMPRESSION_NAMES[compression] if compression < len(EXR_COMPRESSION_NAMES) else compression
+		raise OSError(f"OpenEXR {name} compression is not supported")
+	name, chunk_lines = EXR_COMPRESSIONS[compression]
+	x0, y0, x1, y1 = struct.unpack_from("<4i", attributes["dataWindow"][1])
+	w, h = x1 - x0 + 1, y1 - y0 + 1
+	channels = _exr_channels(attributes["channels"][1])
+
+	# byte offset of every channel in a scanline, channels are stored sorted
+	offsets = {}
+	line_size = 0
+	for channel, pixel_type, x_sampling, y_sampling in channels:
+		offsets[channel] = line_size
+		line_size += w * np.dtype(EXR_TYPES[pixel_type]).itemsize
+		if (x_sampling, y_sampling) != (1, 1):
+			raise OSError("subsampled OpenEXR channels are not supported")
+	types = {c[0]: c[1] for c in channels}
+	names = [c[0] for c in channels]
+	if all(c in types for c in "RGB"):
+		picked = [c for c in "RGBA" if c in types]
+	elif "Y" in types:
+		picked = ["Y"]
+	else:
+		picked = names[:1]
+	dtype = np.float16 if all(types[c] == 1 for c in picked) else np.float32
+	array = np.empty((h, w, len(picked)), dtype)
+
+	chunks = (h + chunk_lines - 1) // chunk_lines
+	table = struct.unpack_from(f"<{chunks}Q", data, pos)
+	for offset in table:
+		y, size = struct.unpack_from("<ii", data, offset)
+		row = y - y0
+		lines = min(chunk_lines, h - row)
+		expected = line_size * lines
+		raw = data[offset + 8:offset + 8 + size]
+		# chunks that did not get smaller are stored as they are
+		block = raw if size >= expected else _exr_uncompress(raw, compression, expected)
+		for i, channel in enumerate(picked):
+			source = np.ndarray(
+				(lines, w), EXR_TYPES[types[channel]], buffer=block, offset=offsets[channel],
+				strides=(line_size, np.dtype(EXR_TYPES[types[channel]]).itemsize))
+			array[row:row + lines, :, i] = source
+	return TFloatImage(array, f"EXR {name}")
+
+
+FLOAT_READERS = {
+	".HDR": read_hdr,
+	".EXR": read_exr,
+}
+
+
+def read_float(filename):
+	# None when the suffix is not a floating point format
+	reader = FLOAT_READERS.get(Path(filename).suffix.upper())
+	if reader is None:
+		return None
+	return reader(filename)
+
+
+def preview(array, size):
+	# 8-bit rgb of about size x size for thumbnails, reinhard and gamma 2.2
+	step = max(1, max(array.shape[:2]) // size)
+	a = array[::step, ::step].astype(np.float32)
+	rgb = a[..., :3] if a.shape[2] >= 3 else np.repeat(a[..., :1], 3, axis=2)
+	rgb = np.nan_to_num(np.maximum(rgb, 0.0))
+	rgb = (rgb / (1.0 + rgb)) ** (1.0 / 2.2) * 255.0 + 0.5
+	return np.ascontiguousarray(rgb.astype(np.uint8))
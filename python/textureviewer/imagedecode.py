@@ -0,0 +1,596 @@
+# image formats and their decoders
+# a file becomes a TImageData of packed pixels, a mapping of the file, block
+# compressed surfaces or a tile source; no widgets and no gl calls, the
+# batch workers import this and not the viewer
+import io
+import math
+import mmap
+import struct
+import threading
+from pathlib import Path
+from startup import lazy_import, open_image
+# Pillow
+Image = lazy_import("PIL.Image")
+np = lazy_import("numpy")
+# DirectDraw Surface
+from dds import TDDSImage, read_dds
+from dds import GL_COMPRESSED_RED_RGTC1, GL_COMPRESSED_SIGNED_RED_RGTC1
+# memory mapped uncompressed images
+from rawimage import read_raw
+# floating point images
+from hdrimage import FLOAT_READERS, read_float
+
+
+SUPPORTED_IMAGES = ["TGA", "PNG", "JPG", "JPEG", "TIF", "TIFF", "BMP", "DDS", "HDR", "EXR"]
+# images larger than this are drawn from tiles paged in on demand
+TILED_LIMIT = 8192
+TILE_SIZE = 512
+# size of the whole-image texture drawn under the tiles
+OVERVIEW_SIZE = 1024
+# images this large get a reduced preview painted before the full decode
+PREVIEW_MIN_SIZE = 4096
+PREVIEW_SIZE = 1024
+# thumbnail cache resolutions a preview can start from, the batch
+# thumbnailer's and the folder grid's
+PREVIEW_THUMBNAILS = (256, 128)
+# bytes of a mapping read in between cancellation checks
+READ_IN_CHUNK = 16 << 20
+
+# texel to rgba mapping applied in the shader, matrix rows are source
+# channels, then what is added; plain numbers so the decode and diff workers
+# never load Qt, gltexture.source_uniforms makes the uniforms
+SOURCE_RGBA = ((
+	1, 0, 0, 0,
+	0, 1, 0, 0,
+	0, 0, 1, 0,
+	0, 0, 0, 1
+), (0, 0, 0, 0))
+SOURCE_L = ((
+	1, 1, 1, 0,
+	0, 0, 0, 0,
+	0, 0, 0, 0,
+	0, 0, 0, 0
+), (0, 0, 0, 1))
+SOURCE_LA = ((
+	1, 1, 1, 0,
+	0, 0, 0, 1,
+	0, 0, 0, 0,
+	0, 0, 0, 0
+), (0, 0, 0, 0))
+# 32-bit int holding 16-bit values, gl normalizes by 2^31 - 1
+_I16 = 2147483647.0 / 65535.0
+SOURCE_I = ((
+	_I16, _I16, _I16, 0,
+	0, 0, 0, 0,
+	0, 0, 0, 0,
+	0, 0, 0, 0
+), (0, 0, 0, 1))
+
+# OpenGL enums of the tables below, usable before OpenGL.GL is loaded
+GL_RED = 0x1903
+GL_RG = 0x8227
+GL_RGB = 0x1907
+GL_RGBA = 0x1908
+GL_BGR = 0x80E0
+GL_BGRA = 0x80E1
+GL_R8 = 0x8229
+GL_RG8 = 0x822B
+GL_RGB8 = 0x8051
+GL_RGBA8 = 0x8058
+GL_R16 = 0x822A
+GL_R32F = 0x822E
+GL_R16F = 0x822D
+GL_RGB16F = 0x881B
+GL_RGBA16F = 0x881A
+GL_RGB32F = 0x8815
+GL_RGBA32F = 0x8814
+GL_UNSIGNED_BYTE = 0x1401
+GL_UNSIGNED_SHORT = 0x1403
+GL_INT = 0x1404
+GL_FLOAT = 0x1406
+GL_HALF_FLOAT = 0x140B
+GL_NEAREST = 0x2600
+GL_TEXTURE_2D = 0x0DE1
+GL_TEXTURE_CUBE_MAP = 0x8513
+GL_TEXTURE_CUBE_MAP_POSITIVE_X = 0x8515
+GL_LINEAR = 0x2601
+# Pillow mode or raw layout: internal format, format, type, swap bytes, source mapping
+PIXEL_FORMATS = {
+	"L": (GL_R8, GL_RED, GL_UNSIGNED_BYTE, False, SOURCE_L),
+	"LA": (GL_RG8, GL_RG, GL_UNSIGNED_BYTE, False, SOURCE_LA),
+	"RGB": (GL_RGB8, GL_RGB, GL_UNSIGNED_BYTE, False, SOURCE_RGBA),
+	"RGBA": (GL_RGBA8, GL_RGBA, GL_UNSIGNED_BYTE, False, SOURCE_RGBA),
+	"RGBX": (GL_RGB8, GL_RGBA, GL_UNSIGNED_BYTE, False, SOURCE_RGBA),
+	"BGR": (GL_RGB8, GL_BGR, GL_UNSIGNED_BYTE, False, SOURCE_RGBA),
+	"BGRA": (GL_RGBA8, GL_BGRA, GL_UNSIGNED_BYTE, False, SOURCE_RGBA),
+	"BGRX": (GL_RGB8, GL_BGRA, GL_UNSIGNED_BYTE, False, SOURCE_RGBA),
+	"I;16": (GL_R16, GL_RED, GL_UNSIGNED_SHORT, False, SOURCE_L),
+	"I;16B": (GL_R16, GL_RED, GL_UNSIGNED_SHORT, True, SOURCE_L),
+	"I": (GL_R32F, GL_RED, GL_INT, False, SOURCE_I),
+	"F": (GL_R32F, GL_RED, GL_FLOAT, False, SOURCE_L),
+	"L;16F": (GL_R16F, GL_RED, GL_HALF_FLOAT, False, SOURCE_L),
+	"RGB;16F": (GL_RGB16F, GL_RGB, GL_HALF_FLOAT, False, SOURCE_RGBA),
+	"RGBA;16F": (GL_RGBA16F, GL_RGBA, GL_HALF_FLOAT, False, SOURCE_RGBA),
+	"RGB;32F": (GL_RGB32F, GL_RGB, GL_FLOAT, False, SOURCE_RGBA),
+	"RGBA;32F": (GL_RGBA32F, GL_RGBA, GL_FLOAT, False, SOURCE_RGBA),
+}
+# channels, bytes per channel of a float array: TPixels mode
+FLOAT_LAYOUTS = {
+	(1, 2): "L;16F",
+	(3, 2): "RGB;16F",
+	(4, 2): "RGBA;16F",
+	(1, 4): "F",
+	(3, 4): "RGB;32F",
+	(4, 4): "RGBA;32F",
+}
+# TPixels mode: struct format of one texel, channel names in memory order
+TEXEL_FORMATS = {
+	"L": ("B", "L"),
+	"LA": ("2B", "LA"),
+	"RGB": ("3B", "RGB"),
+	"RGBA": ("4B", "RGBA"),
+	"RGBX": ("4B", "RGBX"),
+	"BGR": ("3B", "BGR"),
+	"BGRA": ("4B", "BGRA"),
+	"BGRX": ("4B", "BGRX"),
+	"I;16": ("<H", "L"),
+	"I;16B": (">H", "L"),
+	"I": ("=i", "L"),
+	"F": ("=f", "L"),
+	"L;16F": ("=e", "L"),
+	"RGB;16F": ("=3e", "RGB"),
+	"RGBA;16F": ("=4e", "RGBA"),
+	"RGB;32F": ("=3f", "RGB"),
+	"RGBA;32F": ("=4f", "RGBA"),
+}
+# raw layout: Pillow mode, rawmode
+RAW_MODES = {
+	"L": ("L", "L"),
+	"RGB": ("RGB", "RGB"),
+	"RGBA": ("RGBA", "RGBA"),
+	"RGBX": ("RGB", "RGBX"),
+	"BGR": ("RGB", "BGR"),
+	"BGRA": ("RGBA", "BGRA"),
+	"BGRX": ("RGB", "BGRX"),
+}
+COMPRESSED_SOURCES = {
+	GL_COMPRESSED_RED_RGTC1: SOURCE_L,
+	GL_COMPRESSED_SIGNED_RED_RGTC1: SOURCE_L,
+}
+
+
+class TPixels:
+	# rows in one of PIXEL_FORMATS, packed and top to bottom unless told
+	# otherwise, data may be a mapped file with the rows at offset
+	def __init__(self, data, size, mode, offset=0, pitch=None, bpp=None, flip=False, mips=(), path=None):
+		self.data = data
+		self.size = size
+		self.mode = mode
+		self.offset = offset
+		self.bpp = bpp if bpp is not None else len(data) // max(1, size[0] * size[1])
+		self.pitch = pitch if pitch is not None else size[0] * self.bpp
+		# rows stored bottom to top
+		self.flip = flip
+		# TPixels of the levels below this one when the file has them
+		self.mips = mips
+		# file data is a mapping of, None for decoded pixels
+		self.path = path
+
+	def detached(self):
+		# the same layout without the mapping, whatever reads it later goes
+		# to the file, which can then be rewritten while the image is shown
+		if self.path is None:
+			return self
+		return TPixels(
+			None, self.size, self.mode, self.offset, self.pitch, self.bpp, self.flip,
+			tuple(m.detached() for m in self.mips), self.path)
+
+	def read(self):
+		# the rows of a detached mapping read into memory of their own, one
+		# read of the file that is then closed
+		with open(self.path, "rb") as f:
+			f.seek(self.offset)
+			data = f.read(self.span)
+		return TPixels(data, self.size, self.mode, 0, self.pitch, self.bpp, self.flip)
+
+	@property
+	def nbytes(self):
+		return self.pitch * self.size[1]
+
+	@property
+	def span(self):
+		# bytes from the first to the end of the last row
+		return self.pitch * (self.size[1] - 1) + self.size[0] * self.bpp
+
+
+class TTexelReader:
+	# source values of single texels, everything per image is precomputed
+	# so a read is one unpack_from on the retained buffer, detached pixels
+	# are read() into one first
+	def __init__(self, pixels):
+		fmt, names = TEXEL_FORMATS[pixels.mode]
+		self._struct = struct.Struct(fmt)
+		self._data = pixels.data
+		self._offset = pixels.offset
+		self._pitch = pixels.pitch
+		self._bpp = pixels.bpp
+		self._flip = pixels.flip
+		self.size = pixels.size
+		self.float = fmt[-1] in "ef"
+		# name and index in the unpacked tuple, shown in RGBA order, X is padding
+		self.channels = tuple(sorted(
+			((n, i) for i, n in enumerate(names) if n != "X"), key=lambda c: "RGBLA".index(c[0])))
+
+	def read(self, x, y):
+		# x, y in image space, top left origin
+		if self._flip:
+			y = self.size[1] - 1 - y
+		offset = self._offset + y * self._pitch + x * self._bpp
+		return self._struct.unpack_from(self._data, offset)
+
+
+def uploadable(pim):
+	# converts modes the gpu can not take as they are
+	if pim.mode in PIXEL_FORMATS:
+		return pim
+	if pim.mode == "1":
+		return pim.convert("L")
+	if "A" in pim.getbands() or "transparency" in pim.info:
+		return pim.convert("RGBA")
+	return pim.convert("RGB")
+
+
+def pixels_from_pil(pim):
+	# one packed copy of the decoded image, no 8-bit truncation
+	return TPixels(pim.tobytes(), pim.size, pim.mode)
+
+
+def array_pixels(a):
+	# TPixels over a float array, height x width x channels
+	a = np.ascontiguousarray(a)
+	h, w, channels = a.shape
+	mode = FLOAT_LAYOUTS[(channels, a.itemsize)]
+	return TPixels(memoryview(a).cast("B"), (w, h), mode, bpp=channels * a.itemsize)
+
+
+def array_region(a):
+	# region(box, factor) of a float array, reduced by keeping every factor-th texel
+	def region(box, factor):
+		x0, y0, x1, y1 = box
+		return array_pixels(a[y0:y1:factor, x0:x1:factor])
+	return region
+
+
+def pil_region(pim):
+	# region(box, factor) of a decoded image, reduced by factor
+	# the tile tasks of one image run on several pool threads and Pillow does
+	# not promise that one image can be read from all of them at once, so
+	# each source reads under its own lock; sources of other images still
+	# run in parallel
+	lock = threading.Lock()
+
+	def region(box, factor):
+		with lock:
+			if factor > 1:
+				return pim.reduce(factor, box=box)
+			return pim.crop(box)
+	return region
+
+
+def read_in(data, cancelled=lambda: False):
+	# faults in every page of a mapping, so a later copy from it, the upload
+	# on the gui thread, reads memory and not the disk; False when cancelled
+	if hasattr(mmap, "MADV_WILLNEED"):
+		data.madvise(mmap.MADV_WILLNEED)
+	view = memoryview(data)
+	try:
+		for start in range(0, len(view), READ_IN_CHUNK):
+			if cancelled():
+				return False
+			# one byte of each page is enough to map it
+			sum(view[start:start + READ_IN_CHUNK:mmap.PAGESIZE])
+	finally:
+		view.release()
+	return True
+
+
+def raw_region(raw, filename):
+	# region(box, factor) of a mapped image, only the rows of box are decoded;
+	# the file is mapped for the read only, tiles never keep it open
+	mode, rawmode = RAW_MODES[raw.layout]
+	orientation = -1 if raw.bottom_up else 1
+
+	def region(box, factor):
+		x0, y0, x1, y1 = box
+		start, end = raw.rows(y0, y1)
+		with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+			view = memoryview(data)[start:end]
+			band = Image.frombuffer(mode, (raw.size[0], y1 - y0), view, "raw", rawmode, raw.pitch, orientation)
+			if factor > 1:
+				image = band.reduce(factor, box=(x0, 0, x1, y1 - y0))
+			else:
+				image = band.crop((x0, 0, x1, y1 - y0))
+			# the mapping can only close without exports
+			del band
+			view.release()
+		return image
+	return region
+
+
+def raw_overview(raw, filename, factor, cancelled):
+	# reduced copy of a mapped image, built band by band
+	w, h = raw.size
+	region = raw_region(raw, filename)
+	overview = Image.new(RAW_MODES[raw.layout][0], ((w + factor - 1) // factor, (h + factor - 1) // factor))
+	band = factor * max(1, 256 // factor)
+	for y in range(0, h, band):
+		if cancelled():
+			return None
+		overview.paste(region((0, y, w, min(h, y + band)), factor), (0, y // factor))
+	return overview
+
+
+class TTileSource:
+	# image cut into TILE_SIZE tiles, level n is reduced by 2^n
+	def __init__(self, size, nbytes, region, pixels=None):
+		self.size = size
+		self.nbytes = nbytes
+		self._region = region
+		# full resolution TPixels when the source is a mapped file
+		self.pixels = pixels
+
+	def level(self, screen_width, overview_width):
+		# pyramid level for an image drawn screen_width pixels wide
+		# None when the overview is sharp enough
+		if overview_width >= screen_width:
+			return None
+		texels = self.size[0] / max(screen_width, 1.0)
+		return max(0, int(math.floor(math.log2(max(texels, 1.0)))))
+
+	def rect(self, level, tx, ty):
+		span = TILE_SIZE << level
+		w, h = self.size
+		return tx * span, ty * span, min(w, (tx + 1) * span), min(h, (ty + 1) * span)
+
+	def visible(self, level, u0, v0, u1, v1):
+		# tiles intersecting the normalized image rect
+		span = TILE_SIZE << level
+		w, h = self.size
+		x0, x1 = int(u0 * w) // span, min(int(math.ceil(u1 * w / span)), int(math.ceil(w / span)))
+		y0, y1 = int(v0 * h) // span, min(int(math.ceil(v1 * h / span)), int(math.ceil(h / span)))
+		return [(tx, ty) for ty in range(y0, y1) for tx in range(x0, x1)]
+
+	def tile(self, level, tx, ty):
+		region = self._region(self.rect(level, tx, ty), 1 << level)
+		return region if isinstance(region, TPixels) else pixels_from_pil(region)
+
+
+class TImageData:
+	def __init__(
+			self, filename, image, info, key=None, size=None,
+			tiles=None, compressed=None, pixels=None, source=SOURCE_RGBA, linear=False,
+			surfaces=(), cube=False):
+		self.filename = filename
+		# QImage, only for file icons
+		self.image = image
+		self.info = info
+		self.key = key
+		if size is None:
+			if compressed is not None:
+				size = compressed.size
+			elif pixels is not None:
+				size = pixels.size
+			else:
+				size = (image.width(), image.height()) if image is not None else (1, 1)
+		self.size = size
+		self.tiles = tiles
+		# drawn from tiles, pixels are only an overview
+		self.tiled = tiles is not None
+		# block compressed surface uploaded as it is
+		self.compressed = compressed
+		self.pixels = pixels
+		self.source = source
+		# scene referred floats, display gamma and tonemapping apply
+		self.linear = linear
+		self.flip = pixels.flip if pixels is not None else False
+		# every array layer or cube face, TPixels or TDDSImage, the first is
+		# pixels or compressed, empty for a single surface
+		self.surfaces = surfaces
+		self.cube = cube
+		self.layers = max(1, len(surfaces) // 6 if cube else len(surfaces))
+		# mip levels of the texture, the missing ones of a file are made on the gpu
+		if compressed is not None:
+			self.levels = len(compressed.mips)
+		elif tiles is not None:
+			self.levels = 1
+		elif pixels is not None and pixels.mips:
+			self.levels = len(pixels.mips) + 1
+		else:
+			self.levels = int(math.log2(max(1, *size))) + 1
+		# layout of the texture storage, equal ones can be updated in place
+		self.storage = None
+		if pixels is not None and tiles is None and not surfaces:
+			self.storage = (pixels.mode, pixels.size, len(pixels.mips))
+		# reduced stand-in shown until the full decode arrives
+		self.preview = False
+		# inspector source of a header without pixels, detached from the file
+		self.texels_only = None
+
+	@property
+	def loaded(self):
+		return self.image is not None or self.compressed is not None or self.pixels is not None
+
+	@property
+	def nbytes(self):
+		nbytes = self.image.width() * self.image.height() * 4 if self.image is not None else 0
+		if self.pixels is not None:
+			nbytes += self.pixels.nbytes
+		if self.tiles is not None:
+			nbytes += self.tiles.nbytes
+		if self.compressed is not None:
+			nbytes += len(self.compressed.data)
+		return nbytes
+
+	@property
+	def texels(self):
+		# full resolution source for the pixel inspector, or None
+		if self.preview:
+			return None
+		if self.tiles is not None:
+			return self.tiles.pixels
+		if self.pixels is None:
+			return self.texels_only
+		return self.pixels
+
+	@property
+	def mapped(self):
+		# pixels are a mapping of the file, read in by the decode task, mapping
+		# it again finds the pages cached and does not hold the file open
+		if self.compressed is not None:
+			return isinstance(self.compressed.data, mmap.mmap)
+		return not self.tiled and self.pixels is not None and self.pixels.path is not None
+
+	def read_in(self, cancelled=lambda: False):
+		# reads the mapped file in, see read_in; every surface shares the mapping
+		data = self.compressed.data if self.compressed is not None else self.pixels.data
+		return read_in(data, cancelled) if isinstance(data, mmap.mmap) else True
+
+	def header(self):
+		# same image without pixel data, mapped files cost nothing to keep
+		# mapped surfaces stay only as their layout for the inspector, block
+		# compressed ones not at all, the file is not held open
+		surfaces = tuple(s.detached() if isinstance(s, TPixels) else None for s in self.surfaces)
+		header = TImageData(
+			self.filename, None, self.info, self.key, self.size, source=self.source, linear=self.linear,
+			surfaces=surfaces, cube=self.cube)
+		header.levels = self.levels
+		header.tiled = self.tiled
+		header.flip = self.flip
+		header.storage = self.storage
+		if not self.tiled and self.pixels is not None and self.pixels.path is not None:
+			header.texels_only = self.pixels.detached()
+		return header
+
+
+def decode_image(filename, cancelled=lambda: False, max_size=TILED_LIMIT, compressed_formats=frozenset()):
+	# returns None when the request was cancelled between decode stages
+	suffix = Path(filename).suffix.upper()
+	if suffix == ".DDS":
+		# block compressed surfaces the gpu samples natively skip Pillow
+		raw = read_dds(filename)
+		if isinstance(raw, TDDSImage):
+			dds, raw = raw, None
+			if dds.internal_format in compressed_formats and max(dds.size) <= max_size:
+				info = f"DDS - {dds.size} - {dds.name}{layers_info(dds)} "
+				source = COMPRESSED_SOURCES.get(dds.internal_format, SOURCE_RGBA)
+				surfaces = tuple(dds.surface(i) for i in range(len(dds.layers)))
+				return TImageData(
+					filename, None, info, compressed=dds, source=source, surfaces=surfaces, cube=dds.cube)
+	elif suffix in FLOAT_READERS:
+		return decode_float(filename, read_float(filename), max_size)
+	else:
+		raw = read_raw(filename)
+	if raw is not None:
+		return decode_raw(filename, raw, cancelled, max_size)
+	if cancelled():
+		return None
+
+	pim = open_image(filename)
+	info = f"{pim.format} - {pim.size} - {pim.mode} "
+	if cancelled():
+		return None
+	pim.load()
+	if cancelled():
+		return None
+	pim = uploadable(pim)
+	source = PIXEL_FORMATS[pim.mode][4]
+	if max(pim.size) > max_size:
+		# keep the source for tiles, upload only an overview
+		overview = pim.reduce(int(math.ceil(max(pim.size) / OVERVIEW_SIZE)))
+		nbytes = pim.size[0] * pim.size[1] * len(pim.getbands())
+		return TImageData(
+			filename, None, info, size=pim.size, tiles=TTileSource(pim.size, nbytes, pil_region(pim)),
+			pixels=pixels_from_pil(overview), source=source)
+	pixels = pixels_from_pil(pim)
+	# the packed copy is all that is kept
+	pim.close()
+	return TImageData(filename, None, info, pixels=pixels, source=source)
+
+
+def decode_preview(filename, thumbnails=None):
+	# reduced TImageData of a large image standing in for the full one, its
+	# size is the full size so the view does not move when it is replaced;
+	# a cached thumbnail, then the jpeg decoder at 1/8 scale, None when the
+	# image is small or there is no cheap way; mapped files get none, their
+	# load is a mapping or the overview a preview would read the file for
+	suffix = Path(filename).suffix.upper()
+	if suffix == ".DDS" or suffix in FLOAT_READERS or read_raw(filename) is not None:
+		return None
+	pim = open_image(filename)
+	size, name = pim.size, f"{pim.format} - {pim.size} - {pim.mode}"
+	if max(size) < PREVIEW_MIN_SIZE:
+		pim.close()
+		return None
+	preview = None
+	if thumbnails is not None:
+		for resolution in PREVIEW_THUMBNAILS:
+			thumbnail = thumbnails.get(filename, resolution)
+			if thumbnail is not None:
+				with Image.open(io.BytesIO(thumbnail.data)) as thumb:
+					preview = pixels_from_pil(thumb.convert("RGBA"))
+				break
+	if preview is None and pim.format == "JPEG":
+		# scaled idct, only a fraction of the texels is ever computed
+		pim.draft(pim.mode, (PREVIEW_SIZE, PREVIEW_SIZE))
+		preview = pixels_from_pil(uploadable(pim))
+	pim.close()
+	if preview is None:
+		return None
+	data = TImageData(
+		filename, None, f"{name} preview ", size=size, pixels=preview, source=PIXEL_FORMATS[preview.mode][4])
+	data.preview = True
+	return data
+
+
+def layers_info(image):
+	# cube and array part of the status text of a TDDSImage or TRawImage
+	if image.cube:
+		return " cube" if len(image.layers) == 6 else f" cube array {len(image.layers) // 6}"
+	return f" array {len(image.layers)}" if image.layers else ""
+
+
+def decode_raw(filename, raw, cancelled, max_size):
+	# the mapped file is uploaded as it is, no decode
+	info = f"{Path(filename).suffix[1:].upper()} - {raw.size} - {raw.layout}{layers_info(raw)} mapped "
+	source = PIXEL_FORMATS[raw.layout][4]
+
+	def surface(offset, mips):
+		mips = tuple(
+			TPixels(raw.data, (w, h), raw.layout, mip, w * raw.bpp, raw.bpp, raw.bottom_up, path=filename)
+			for w, h, mip in mips)
+		return TPixels(
+			raw.data, raw.size, raw.layout, offset, raw.pitch, raw.bpp, raw.bottom_up, mips, filename)
+	pixels = surface(raw.offset, raw.mips)
+	if max(raw.size) > max_size:
+		overview = raw_overview(raw, filename, int(math.ceil(max(raw.size) / OVERVIEW_SIZE)), cancelled)
+		if overview is None:
+			return None
+		tiles = TTileSource(raw.size, raw.nbytes, raw_region(raw, filename), pixels.detached())
+		return TImageData(
+			filename, None, info, size=raw.size, tiles=tiles, pixels=pixels_from_pil(overview), source=source)
+	surfaces = tuple(surface(*layer) for layer in raw.layers)
+	return TImageData(filename, None, info, pixels=pixels, source=source, surfaces=surfaces, cube=raw.cube)
+
+
+def decode_float(filename, image, max_size):
+	# half and single floats are uploaded as they are, no 8-bit conversion
+	pixels = array_pixels(image.array)
+	info = f"{image.name} - {image.size} - {pixels.mode} "
+	source = PIXEL_FORMATS[pixels.mode][4]
+	if max(image.size) > max_size:
+		factor = int(math.ceil(max(image.size) / OVERVIEW_SIZE))
+		tiles = TTileSource(image.size, pixels.nbytes, array_region(image.array), pixels)
+		return TImageData(
+			filename, None, info, size=image.size, tiles=tiles,
+			pixels=array_pixels(image.array[::factor, ::factor]), source=source, linear=True)
+	return TImageData(filename, None, info, pixels=pixels, source=source, linear=True)
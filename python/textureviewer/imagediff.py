@@ -0,0 +1,104 @@
+# difference metrics of two images
+# both images are viewed as numpy arrays of their retained pixels and
+# compared in bands of rows, memory stays bounded whatever the image size
+import math
+from startup import lazy_import
+np = lazy_import("numpy")
+
+
+# rows compared at once, a band of a 16k wide image is 64 MB of float32
+DIFF_BAND_ROWS = 256
+# TPixels mode: numpy dtype of one channel, channel names in memory order, full scale
+DIFF_MODES = {
+	"L": ("u1", "L", 255.0),
+	"LA": ("u1", "LA", 255.0),
+	"RGB": ("u1", "RGB", 255.0),
+	"RGBA": ("u1", "RGBA", 255.0),
+	"RGBX": ("u1", "RGBX", 255.0),
+	"BGR": ("u1", "BGR", 255.0),
+	"BGRA": ("u1", "BGRA", 255.0),
+	"BGRX": ("u1", "BGRX", 255.0),
+	"I;16": ("<u2", "L", 65535.0),
+	"I;16B": (">u2", "L", 65535.0),
+	# Pillow keeps 16-bit files in 32-bit ints
+	"I": ("=i4", "L", 65535.0),
+	"F": ("=f4", "L", 1.0),
+	"L;16F": ("=f2", "L", 1.0),
+	"RGB;16F": ("=f2", "RGB", 1.0),
+	"RGBA;16F": ("=f2", "RGBA", 1.0),
+	"RGB;32F": ("=f4", "RGB", 1.0),
+	"RGBA;32F": ("=f4", "RGBA", 1.0),
+}
+
+
+class TDiffMetrics:
+	def __init__(self, mse, max_error, changed):
+		# values normalised to 0..1, changed is the fraction of texels
+		self.mse = mse
+		self.max_error = max_error
+		self.changed = changed
+
+	@property
+	def psnr(self):
+		# dB, infinite for identical images
+		return math.inf if self.mse <= 0.0 else 10.0 * math.log10(1.0 / self.mse)
+
+	def as_dict(self):
+		return {
+			"psnr": None if math.isinf(self.psnr) else round(self.psnr, 3),
+			"mse": self.mse,
+			"max_error": self.max_error,
+			"changed": self.changed,
+		}
+
+	def __str__(self):
+		psnr = "inf" if math.isinf(self.psnr) else f"{self.psnr:.2f}"
+		return f"PSNR {psnr} dB | max error {self.max_error:.4g} ({self.max_error * 255.0:.1f}/255) | changed {self.changed * 100.0:.2f}% "
+
+
+def rgba_band(pixels, y0, y1):
+	# rows y0..y1 of a TPixels as float32 rgba, top to bottom, missing
+	# colour channels repeat luminance and missing alpha is opaque
+	dtype, names, scale = DIFF_MODES[pixels.mode]
+	dtype = np.dtype(dtype)
+	w, h = pixels.size
+	first = h - y1 if pixels.flip else y0
+	a = np.ndarray(
+		(y1 - y0, w, pixels.bpp // dtype.itemsize), dtype, buffer=pixels.data,
+		offset=pixels.offset + first * pixels.pitch, strides=(pixels.pitch, pixels.bpp, dtype.itemsize))
+	if pixels.flip:
+		a = a[::-1]
+	band = np.empty((y1 - y0, w, 4), np.float32)
+	for c, name in enumerate("RGBA"):
+		i = names.find(name)
+		if i < 0 and name != "A":
+			i = names.find("L")
+		if i < 0:
+			band[..., c] = 1.0
+		else:
+			np.multiply(a[..., i], 1.0 / scale, out=band[..., c], casting="unsafe")
+	return band
+
+
+def diff_pixels(a, b, threshold=0.0, on_band=None):
+	# TDiffMetrics of two TPixels of the same size, on_band gets the first
+	# row and the absolute difference of every band, for diff images
+	if a.size != b.size:
+		raise ValueError(f"sizes differ, {a.size} and {b.size}")
+	w, h = a.size
+	sse = 0.0
+	max_error = 0.0
+	changed = 0
+	for y0 in range(0, h, DIFF_BAND_ROWS):
+		y1 = min(h, y0 + DIFF_BAND_ROWS)
+		d = rgba_band(a, y0, y1)
+		np.subtract(d, rgba_band(b, y0, y1), out=d)
+		np.abs(d, out=d)
+		sse += float(np.square(d).sum(dtype=np.float64))
+		worst = d.max(axis=2)
+		max_error = max(max_error, float(worst.max()))
+		changed += int(np.count_nonzero(worst > threshold))
+		if on_band is not None:
+			on_band(y0, d)
+	n = max(1, w * h)
+	return TDiffMetrics(sse / (n * 4), max_error, changed / n)
@@ -0,0 +1,192 @@
+# per channel statistics and histograms
+# 8-bit images go through one Pillow histogram pass, 16-bit and float ones
+# through numpy views of the retained pixels, nothing is looped per pixel;
+# no Qt, the batch thumbnailer's workers use it too
+import copy
+import math
+# loaded with the first statistics, not at startup
+from startup import lazy_import, open_image
+np = lazy_import("numpy")
+# Pillow
+Image = lazy_import("PIL.Image")
+
+
+# float histograms are built from a strided sample of about this many texels
+HISTOGRAM_SAMPLES = 4 * 1024 * 1024
+HISTOGRAM_BINS = 256
+
+# TPixels mode: Pillow mode, rawmode for the 8-bit layouts
+BYTE_MODES = {
+	"L": ("L", "L"),
+	"LA": ("LA", "LA"),
+	"RGB": ("RGB", "RGB"),
+	"RGBA": ("RGBA", "RGBA"),
+	"RGBX": ("RGB", "RGBX"),
+	"BGR": ("RGB", "BGR"),
+	"BGRA": ("RGBA", "BGRA"),
+	"BGRX": ("RGB", "BGRX"),
+}
+# TPixels mode: numpy dtype of the single channel layouts
+ARRAY_MODES = {
+	"I;16": "<u2",
+	"I;16B": ">u2",
+	"I": "=i4",
+	"F": "=f4",
+}
+# TPixels mode: numpy dtype, channel names of the float layouts
+FLOAT_MODES = {
+	"L;16F": ("=f2", "L"),
+	"RGB;16F": ("=f2", "RGB"),
+	"RGBA;16F": ("=f2", "RGBA"),
+	"RGB;32F": ("=f4", "RGB"),
+	"RGBA;32F": ("=f4", "RGBA"),
+}
+# channel names of a height x width x channels float array
+FLOAT_NAMES = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+
+
+class TChannelStats:
+	def __init__(self, name, low, high, mean, histogram, lo=0.0, hi=255.0, full=255.0):
+		# values in source units, histogram bins span lo..hi, full is the
+		# value of full intensity, 1.0 for floats
+		self.name = name
+		self.min = low
+		self.max = high
+		self.mean = mean
+		self.histogram = histogram
+		self.lo = lo
+		self.hi = hi
+		self.full = full
+
+
+class TImageStats:
+	def __init__(self, channels, nan=0, inf=0, overview=False):
+		self.channels = channels
+		self.nan = nan
+		self.inf = inf
+		# computed on the overview of a tiled image
+		self.overview = overview
+
+	@property
+	def alpha_used(self):
+		for c in self.channels:
+			if c.name == "A":
+				# an opaque float alpha is exactly 1.0, hi only spans the histogram
+				return c.min < c.full
+		return False
+
+	def summary(self):
+		# what the thumbnail cache keeps, json without the histograms
+		return {
+			"channels": [{"name": c.name, "min": c.min, "max": c.max, "mean": c.mean} for c in self.channels],
+			"nan": self.nan, "inf": self.inf, "alpha_used": self.alpha_used, "overview": self.overview,
+		}
+
+
+def histogram_stats(pim):
+	# 8-bit Pillow image, min, max and mean come from the histogram itself
+	n = max(1, pim.size[0] * pim.size[1])
+	hist = pim.histogram()
+	channels = []
+	for i, name in enumerate(pim.getbands()):
+		h = hist[i * 256:(i + 1) * 256]
+		used = [v for v, c in enumerate(h) if c]
+		low, high = (used[0], used[-1]) if used else (0, 0)
+		mean = sum(v * c for v, c in enumerate(h)) / n
+		channels.append(TChannelStats(name, low, high, mean, h))
+	return TImageStats(channels)
+
+
+def array_stats(a, name="L"):
+	# 2D array of one channel, may be a strided view of a mapped file
+	nan = inf = 0
+	values = a
+	if a.dtype.kind == "f":
+		finite = np.isfinite(a)
+		bad = a.size - int(np.count_nonzero(finite))
+		if bad:
+			nan = int(np.count_nonzero(np.isnan(a)))
+			inf = bad - nan
+			values = a[finite]
+	if values.size:
+		low, high = float(values.min()), float(values.max())
+		mean = float(values.mean(dtype=np.float64))
+	else:
+		low = high = mean = 0.0
+	step = max(1, int(math.sqrt(a.size / HISTOGRAM_SAMPLES)))
+	sample = a[::step, ::step] if a.ndim == 2 else a
+	if nan or inf:
+		sample = sample[np.isfinite(sample)]
+	hi = high if high > low else low + 1.0
+	h, _ = np.histogram(sample, HISTOGRAM_BINS, (low, hi))
+	full = 1.0 if a.dtype.kind == "f" else float(np.iinfo(a.dtype).max)
+	return TImageStats([TChannelStats(name, low, high, mean, h.tolist(), low, hi, full)], nan, inf)
+
+
+def channels_stats(a, names):
+	# height x width x channels array, may be a strided view
+	per_channel = [array_stats(a[..., i], name) for i, name in enumerate(names)]
+	return TImageStats(
+		[s.channels[0] for s in per_channel], sum(s.nan for s in per_channel), sum(s.inf for s in per_channel))
+
+
+def float_stats(array):
+	# array of a TFloatImage
+	return channels_stats(array, FLOAT_NAMES[array.shape[2]])
+
+
+def pixels_stats(pixels):
+	# statistics of a TPixels, the pixel data is viewed, not copied
+	w, h = pixels.size
+	if pixels.mode in ARRAY_MODES:
+		dtype = np.dtype(ARRAY_MODES[pixels.mode])
+		a = np.ndarray(
+			(h, w), dtype, buffer=pixels.data, offset=pixels.offset, strides=(pixels.pitch, pixels.bpp))
+		return array_stats(a)
+	if pixels.mode in FLOAT_MODES:
+		dtype, names = FLOAT_MODES[pixels.mode]
+		dtype = np.dtype(dtype)
+		a = np.ndarray(
+			(h, w, len(names)), dtype, buffer=pixels.data, offset=pixels.offset,
+			strides=(pixels.pitch, pixels.bpp, dtype.itemsize))
+		return channels_stats(a, names)
+	mode, rawmode = BYTE_MODES[pixels.mode]
+	data = memoryview(pixels.data)[pixels.offset:pixels.offset + pixels.nbytes]
+	return histogram_stats(Image.frombuffer(mode, (w, h), data, "raw", rawmode, pixels.pitch, 1))
+
+
+def file_pixels(pixels):
+	# TPixels detached from a mapped file, its rows are read for the task
+	# only, the file is not held open while the image is shown
+	with open(pixels.path, "rb") as f:
+		f.seek(pixels.offset)
+		data = f.read(pixels.nbytes)
+	read = copy.copy(pixels)
+	read.data = data
+	read.offset = 0
+	return read
+
+
+def pil_stats(pim):
+	if pim.mode in ("I;16", "I;16B", "I", "F"):
+		return array_stats(np.asarray(pim))
+	if pim.mode not in ("L", "LA", "RGB", "RGBA"):
+		pim = pim.convert("RGBA" if "A" in pim.getbands() else "RGB")
+	return histogram_stats(pim)
+
+
+def file_stats(filename):
+	# for images without cpu pixels, block compressed ones
+	with open_image(filename) as pim:
+		pim.load()
+		return pil_stats(pim)
+
+
+def image_stats(filename, pixels=None):
+	# pixels of a decode, detached ones of a mapped file, or None for the
+	# images only Pillow reads
+	if pixels is None:
+		return file_stats(filename)
+	if pixels.data is None:
+		pixels = file_pixels(pixels)
+	return pixels_stats(pixels)
@@ -0,0 +1,29 @@
+# entry point of the executable
+# files go to a running viewer when there is one, Qt, OpenGL and Pillow
+# are imported only when this process has to show them itself
+import sys
+import multiprocessing
+from startup import profile
+from resident import forward
+
+
+def main(argv):
+	# only plain file lists are forwarded, anything else needs the full viewer
+	if "--profile-startup" in argv:
+		# before the viewer is imported, so its imports are timed too
+		profile.enable()
+	new_window = "--new-window" in argv
+	paths = [a for a in argv if a != "--new-window"]
+	if paths and not any(p.startswith("-") for p in paths) and forward(paths, new_window):
+		return 0
+	profile.begin("import texture_viewer")
+	import texture_viewer
+	profile.end("import texture_viewer")
+	return texture_viewer.main(argv)
+
+
+if __name__ == '__main__':
+	# first, in the frozen exe the pool workers of --thumbnails and --diff
+	# start this script again and must not get to the argument parser
+	multiprocessing.freeze_support()
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,118 @@
+# persistent cache of linked shader programs
+# binaries from glGetProgramBinary, one file per program keyed by the shader
+# sources and the driver, a rejected binary falls back to compiling
+import os
+import struct
+import ctypes
+import hashlib
+from os.path import join
+from startup import lazy_import, user_cache_dir
+# PyOpenGL, the program binary entry points are not wrapped by Qt
+GL = lazy_import("OpenGL.GL")
+
+
+PROGRAM_CACHE = user_cache_dir("programs")
+
+GL_PROGRAM_BINARY_RETRIEVABLE_HINT = 0x8257
+GL_PROGRAM_BINARY_LENGTH = 0x8741
+GL_NUM_PROGRAM_BINARY_FORMATS = 0x87FE
+GL_LINK_STATUS = 0x8B82
+
+
+def program_key(gl_info, vs_source, fs_source, attributes):
+	# drivers only take back binaries of the same vendor, renderer and version
+	h = hashlib.blake2b(digest_size=20)
+	for part in (gl_info, vs_source, fs_source, ",".join(attributes)):
+		h.update(part.encode())
+		h.update(b"\0")
+	return h.hexdigest()
+
+
+class TProgramCache:
+	def __init__(self, root=PROGRAM_CACHE):
+		self.root = root
+		# programs loaded from a binary and compiled from source, with the
+		# time spent on each, rejected binaries count as compiles too
+		self.hits = 0
+		self.compiles = 0
+		self.rejected = 0
+		self.hit_time = 0.0
+		self.compile_time = 0.0
+		self._supported = None
+		# cleared when the folder can not be written, programs still link
+		self._writable = True
+
+	def supported(self):
+		# needs a current context, GL 4.1, ES 3.0 or ARB_get_program_binary
+		if self._supported is None:
+			try:
+				self._supported = bool(GL.glGetProgramBinary) and bool(GL.glProgramBinary) and \
+					int(GL.glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS)) > 0
+			except Exception:
+				self._supported = False
+		return self._supported
+
+	def load(self, program_id, key):
+		# True when the driver linked program_id from the stored binary
+		try:
+			with open(join(self.root, key + ".bin"), "rb") as f:
+				data = f.read()
+		except OSError:
+			return False
+		if len(data) <= 4:
+			return False
+		binary_format, = struct.unpack_from("<I", data)
+		try:
+			GL.glProgramBinary(program_id, binary_format, data[4:], len(data) - 4)
+			linked = bool(GL.glGetProgramiv(program_id, GL_LINK_STATUS))
+		except Exception:
+			linked = False
+		if not linked:
+			# driver update or a broken file, replaced by the next store
+			self.rejected += 1
+		return linked
+
+	def prepare(self, program_id):
+		# before linking, some drivers only keep a binary when asked to
+		GL.glProgramParameteri(program_id, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL.GL_TRUE)
+
+	def store(self, program_id, key):
+		if not self._writable:
+			return
+		try:
+			size = int(GL.glGetProgramiv(program_id, GL_PROGRAM_BINARY_LENGTH))
+			if size <= 0:
+				return
+			length = (ctypes.c_int * 1)()
+			binary_format = (ctypes.c_uint * 1)()
+			binary = ctypes.create_string_buffer(size)
+			GL.glGetProgramBinary(program_id, size, length, binary_format, binary)
+			os.makedirs(self.root, exist_ok=True)
+			# written aside and renamed, other processes never see half a file
+			path = join(self.root, key + ".bin")
+			temp = f"{path}.{os.getpid()}"
+			with open(temp, "wb") as f:
+				f.write(struct.pack("<I", binary_format[0]))
+				f.write(binary.raw[:length[0]])
+			os.replace(temp, path)
+		except OSError as e:
+			# read-only or full, compiled from source again next time
+			print(f"program cache disabled, {type(e).__name__}: {e}", flush=True)
+			self._writable = False
+		except Exception as e:
+			print(f"{type(e).__name__}:\n", e, flush=True)
+
+	def add_hit(self, seconds):
+		self.hits += 1
+		self.hit_time += seconds
+
+	def add_compile(self, seconds):
+		self.compiles += 1
+		self.compile_time += seconds
+
+	def __str__(self):
+		return "programs {} cached {:.1f} ms | {} compiled {:.1f} ms".format(
+			self.hits, self.hit_time * 1000.0, self.compiles, self.compile_time * 1000.0)
+
+
+program_cache = TProgramCache()
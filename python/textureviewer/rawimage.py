@@ -0,0 +1,116 @@
+# uncompressed image readers
+# the file is memory mapped and the pixel payload is described in place,
+# nothing is decoded or copied here
+import os
+import mmap
+import struct
+from pathlib import Path
+
+
+class TRawImage:
+	def __init__(self, data, offset, size, pitch, bpp, layout, bottom_up, mips=(), layers=(), cube=False):
+		# data is the mapping, rows start at offset and are pitch bytes apart
+		self.data = data
+		self.offset = offset
+		self.size = size
+		self.pitch = pitch
+		self.bpp = bpp
+		# channel order in memory: L, RGB, RGBA, RGBX, BGR, BGRA, BGRX
+		self.layout = layout
+		self.bottom_up = bottom_up
+		# (width, height, offset) of the packed levels below this one
+		self.mips = mips
+		# (offset, mips) of every array layer or cube face, empty for one
+		self.layers = layers
+		self.cube = cube
+
+	@property
+	def nbytes(self):
+		return self.pitch * self.size[1]
+
+	def rows(self, y0, y1):
+		# byte range holding image rows y0..y1 (top to bottom order)
+		h = self.size[1]
+		if self.bottom_up:
+			y0, y1 = h - y1, h - y0
+		return self.offset + y0 * self.pitch, self.offset + y1 * self.pitch
+
+
+def map_file(filename):
+	# copy on write, so ctypes can take the address of the read only data
+	with open(filename, "rb") as f:
+		if os.fstat(f.fileno()).st_size == 0:
+			return b""
+		return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+
+def _check(data, offset, pitch, height):
+	return offset + pitch * height <= len(data)
+
+
+def read_tga(filename):
+	data = map_file(filename)
+	if len(data) < 18:
+		return None
+	id_len, cmap_type, image_type = struct.unpack_from("<3B", data, 0)
+	cmap_len, cmap_bits = struct.unpack_from("<HB", data, 5)
+	width, height, bpp, descriptor = struct.unpack_from("<2H2B", data, 12)
+	# right to left rows are not worth a fast path
+	if descriptor & 0x10 or not width or not height:
+		return None
+	if image_type == 2 and bpp == 24:
+		layout = "BGR"
+	elif image_type == 2 and bpp == 32:
+		layout = "BGRA"
+	elif image_type == 3 and bpp == 8:
+		layout = "L"
+	else:
+		return None
+	offset = 18 + id_len + (cmap_len * ((cmap_bits + 7) // 8) if cmap_type else 0)
+	pitch = width * bpp // 8
+	if not _check(data, offset, pitch, height):
+		return None
+	return TRawImage(data, offset, (width, height), pitch, bpp // 8, layout, not descriptor & 0x20)
+
+
+def read_bmp(filename):
+	data = map_file(filename)
+	if len(data) < 54 or data[:2] != b"BM":
+		return None
+	offset, = struct.unpack_from("<I", data, 10)
+	header_size, width, height, _, bpp, compression = struct.unpack_from("<IiiHHI", data, 14)
+	if header_size < 40 or width <= 0 or not height:
+		return None
+	if compression == 0 and bpp == 24:
+		layout = "BGR"
+	elif compression == 0 and bpp == 32:
+		# the fourth byte is unused in BI_RGB
+		layout = "BGRX"
+	elif compression in (3, 6) and bpp == 32:
+		# masks follow a plain info header or live inside V4/V5 headers
+		masks = struct.unpack_from("<4I", data, 14 + 40) if len(data) >= 14 + 56 else (0, 0, 0, 0)
+		if header_size < 56 and compression == 3:
+			masks = masks[:3] + (0,)
+		if masks[:3] != (0xFF0000, 0xFF00, 0xFF):
+			return None
+		layout = "BGRA" if masks[3] == 0xFF000000 else "BGRX"
+	else:
+		return None
+	pitch = (width * bpp + 31) // 32 * 4
+	if not _check(data, offset, pitch, abs(height)):
+		return None
+	return TRawImage(data, offset, (width, abs(height)), pitch, bpp // 8, layout, height > 0)
+
+
+READERS = {
+	".TGA": read_tga,
+	".BMP": read_bmp,
+}
+
+
+def read_raw(filename):
+	# None when the file is not a plain uncompressed layout
+	reader = READERS.get(Path(filename).suffix.upper())
+	if reader is None:
+		return None
+	return reader(filename)
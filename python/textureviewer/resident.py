@@ -0,0 +1,59 @@
+# single instance support, standard library only
+# a running viewer listens on a local socket (a named pipe on Windows),
+# later launches send it their files and exit before importing Qt
+import os
+import sys
+import socket
+import getpass
+import tempfile
+
+
+# first line of a message, the file paths follow one per line
+COMMAND_OPEN = "open"
+COMMAND_NEW = "new"
+CONNECT_TIMEOUT = 0.5
+
+
+def server_name():
+	# one server per user, QLocalServer takes the same name
+	try:
+		user = getpass.getuser()
+	except Exception:
+		user = "user"
+	name = f"texture_viewer-{user}"
+	if sys.platform == "win32":
+		return name
+	# an absolute path, Qt and Python must agree on the temp folder
+	return os.path.join(tempfile.gettempdir(), name)
+
+
+def message(paths, new_window=False):
+	lines = [COMMAND_NEW if new_window else COMMAND_OPEN]
+	lines.extend(os.path.abspath(p) for p in paths)
+	return "\n".join(lines).encode("utf-8")
+
+
+def parse_message(data):
+	# command, paths
+	lines = [line for line in data.decode("utf-8", "replace").split("\n") if line]
+	if not lines or lines[0] not in (COMMAND_OPEN, COMMAND_NEW):
+		return None, []
+	return lines[0], lines[1:]
+
+
+def forward(paths, new_window=False):
+	# True when a running viewer took the files
+	data = message(paths, new_window)
+	name = server_name()
+	try:
+		if sys.platform == "win32":
+			with open("\\\\.\\pipe\\" + name, "wb", buffering=0) as pipe:
+				pipe.write(data)
+		else:
+			with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+				s.settimeout(CONNECT_TIMEOUT)
+				s.connect(name)
+				s.sendall(data)
+	except OSError:
+		return False
+	return True
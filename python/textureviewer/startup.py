@@ -0,0 +1,152 @@
+# startup helpers, standard library only
+# lazily imported modules, Pillow restricted to the plugin of one format and
+# the timing breakdown printed by --profile-startup
+import os
+import sys
+import builtins
+import tempfile
+import threading
+import importlib
+from time import perf_counter
+from pathlib import Path
+
+
+# largest image Pillow decodes, tiled images are held whole in memory,
+# 32k square is four TILED_LIMIT textures across and 4 GB of rgba
+IMAGE_PIXEL_LIMIT = 32768 * 32768
+# suffix: Pillow plugin module, its image file class
+PIL_PLUGINS = {
+	"TGA": ("TgaImagePlugin", "TgaImageFile"),
+	"PNG": ("PngImagePlugin", "PngImageFile"),
+	"JPG": ("JpegImagePlugin", "JpegImageFile"),
+	"JPEG": ("JpegImagePlugin", "JpegImageFile"),
+	"TIF": ("TiffImagePlugin", "TiffImageFile"),
+	"TIFF": ("TiffImagePlugin", "TiffImageFile"),
+	"BMP": ("BmpImagePlugin", "BmpImageFile"),
+	"DDS": ("DdsImagePlugin", "DdsImageFile"),
+}
+
+
+class TStartupProfile:
+	def __init__(self):
+		self.start = perf_counter()
+		self.enabled = False
+		self.imports = []
+		self.phases = []
+		self.marks = []
+		self._open = {}
+		self._reported = False
+		self._local = threading.local()
+
+	def enable(self):
+		# times the first import of every module from here on, nested
+		# imports are part of the outermost one
+		if self.enabled:
+			return
+		self.enabled = True
+		original = builtins.__import__
+		local = self._local
+
+		def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+			if level or name in sys.modules or getattr(local, "depth", 0):
+				return original(name, globals, locals, fromlist, level)
+			local.depth = 1
+			start = perf_counter()
+			try:
+				return original(name, globals, locals, fromlist, level)
+			finally:
+				local.depth = 0
+				self.imports.append((name, perf_counter() - start))
+		builtins.__import__ = timed_import
+
+	def begin(self, name):
+		if self.enabled:
+			self._open[name] = perf_counter()
+
+	def end(self, name):
+		start = self._open.pop(name, None)
+		if start is not None:
+			self.phases.append((name, perf_counter() - start))
+
+	def mark(self, name):
+		# first time something happened, since the process started
+		if self.enabled and name not in (m[0] for m in self.marks):
+			self.marks.append((name, perf_counter() - self.start))
+
+	def report(self):
+		# once, to stderr or a file in the temp folder for the windowed exe
+		if not self.enabled or self._reported:
+			return
+		self._reported = True
+		lines = ["startup profile, ms"]
+		lines.extend(f"  import {name:<40} {t * 1000.0:8.1f}" for name, t in self.imports)
+		lines.extend(f"  {name:<47} {t * 1000.0:8.1f}" for name, t in self.phases)
+		lines.extend(f"  at {name:<44} {t * 1000.0:8.1f}" for name, t in self.marks)
+		text = "\n".join(lines) + "\n"
+		if sys.stderr is not None:
+			sys.stderr.write(text)
+			sys.stderr.flush()
+		else:
+			with open(os.path.join(tempfile.gettempdir(), "texture_viewer_startup.txt"), "w") as f:
+				f.write(text)
+
+
+profile = TStartupProfile()
+
+
+class TLazyModule:
+	# stands in for a module until the first attribute access
+	def __init__(self, name):
+		self.__dict__["_name"] = name
+		self.__dict__["_module"] = None
+
+	def __getattr__(self, attr):
+		module = self.__dict__["_module"]
+		if module is None:
+			name = self.__dict__["_name"]
+			profile.begin(f"lazy {name}")
+			module = importlib.import_module(name)
+			profile.end(f"lazy {name}")
+			self.__dict__["_module"] = module
+		return getattr(module, attr)
+
+
+def lazy_import(name):
+	return TLazyModule(name)
+
+
+def user_cache_dir(name):
+	# per user cache folder, not made here; next to the scripts would be the
+	# temp folder of the one-file exe or a read-only install
+	if sys.platform == "win32":
+		base = os.environ.get("LOCALAPPDATA") or os.path.join(Path.home(), "AppData", "Local")
+	elif sys.platform == "darwin":
+		base = os.path.join(Path.home(), "Library", "Caches")
+	else:
+		base = os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache")
+	return os.path.join(base, "TextureViewer", name)
+
+
+def open_image(filename, max_pixels=IMAGE_PIXEL_LIMIT):
+	# Image.open imports the bmp, gif, jpeg, ppm and png plugins before it
+	# looks at the file and every other one when those fail; the suffix's
+	# plugin is imported alone and its image class opens the file
+	from PIL import Image
+	# the check is made here, Pillow's would refuse every image worth tiling
+	Image.MAX_IMAGE_PIXELS = None
+	pim = None
+	plugin = PIL_PLUGINS.get(Path(filename).suffix[1:].upper())
+	if plugin is not None:
+		module = importlib.import_module("PIL." + plugin[0])
+		try:
+			pim = getattr(module, plugin[1])(filename)
+		except (OSError, SyntaxError):
+			# misnamed file, a plugin rejects a file with SyntaxError
+			pass
+	if pim is None:
+		pim = Image.open(filename)
+	w, h = pim.size
+	if w * h > max_pixels:
+		pim.close()
+		raise OSError(f"{w} x {h} is over the limit of {max_pixels} texels")
+	return pim
@@ -0,0 +1,201 @@
+# statistics panel of the viewer window
+# computed on the global pool behind the decodes, kept per file version
+from collections import OrderedDict
+from PySide2.QtCore import Qt
+from PySide2.QtCore import Signal
+from PySide2.QtCore import QObject
+from PySide2.QtCore import QRunnable
+from PySide2.QtCore import QThreadPool
+from PySide2.QtCore import QPointF
+from PySide2.QtGui import QColor
+from PySide2.QtGui import QPainter
+from PySide2.QtGui import QPainterPath
+from PySide2.QtWidgets import QWidget
+from PySide2.QtWidgets import QLabel
+from PySide2.QtWidgets import QVBoxLayout
+from imagestats import image_stats
+from imagedecode import decode_image
+
+
+# statistics of this many files are kept, keyed by file version
+STATS_CACHE_ITEMS = 64
+CHANNEL_COLORS = {
+	"R": QColor(230, 60, 60),
+	"G": QColor(60, 200, 60),
+	"B": QColor(70, 110, 240),
+	"A": QColor(160, 160, 160),
+	"L": QColor(220, 220, 220),
+}
+
+
+class TStatsSignals(QObject):
+	# file key, TImageStats or None
+	computed = Signal(object, object)
+
+
+class TStatsTask(QRunnable):
+	def __init__(self, key, filename, pixels, overview, is_wanted, decode=False):
+		super(TStatsTask, self).__init__()
+		self.signals = TStatsSignals()
+		self._key = key
+		self._filename = filename
+		# the task keeps the pixels alive until it is done
+		self._pixels = pixels
+		self._overview = overview
+		self._is_wanted = is_wanted
+		# the pixels are gone, the file is decoded again
+		self._decode = decode
+
+	def run(self):
+		# computed is always emitted, the panel waits for it
+		stats = None
+		cancelled = lambda: not self._is_wanted(self._key)
+		try:
+			if not cancelled():
+				stats = self.__stats(cancelled)
+		except Exception as e:
+			print(f"{type(e).__name__}:\n", e, flush=True)
+		finally:
+			self._pixels = None
+			self.signals.computed.emit(self._key, stats)
+
+	def __stats(self, cancelled):
+		pixels, overview = self._pixels, self._overview
+		if self._decode:
+			data = decode_image(self._filename, cancelled)
+			if data is None:
+				return None
+			pixels = data.pixels if data.pixels is not None else data.texels_only
+			overview = data.tiled
+		stats = image_stats(self._filename, pixels)
+		stats.overview = overview
+		return stats
+
+
+class THistogram(QWidget):
+	def __init__(self, parent=None):
+		super(THistogram, self).__init__(parent)
+		self.setMinimumSize(256, 96)
+		self._stats = None
+
+	def set_stats(self, stats):
+		self._stats = stats
+		self.update()
+
+	# @override
+	def paintEvent(self, event):
+		painter = QPainter(self)
+		painter.fillRect(self.rect(), QColor(40, 40, 40))
+		if self._stats is None:
+			return
+		painter.setRenderHint(QPainter.Antialiasing)
+		w, h = self.width(), self.height()
+		for c in self._stats.channels:
+			if not c.histogram:
+				continue
+			# the tallest bin of each channel fills the height
+			top = max(c.histogram) or 1
+			step = w / len(c.histogram)
+			path = QPainterPath(QPointF(0, h))
+			for i, count in enumerate(c.histogram):
+				path.lineTo(QPointF(i * step, h - count / top * (h - 2)))
+			path.lineTo(QPointF(w, h))
+			color = CHANNEL_COLORS.get(c.name, CHANNEL_COLORS["L"])
+			painter.setPen(color)
+			fill = QColor(color)
+			fill.setAlpha(60)
+			painter.setBrush(fill)
+			painter.drawPath(path)
+
+
+class TStatsPanel(QWidget):
+	def __init__(self, parent=None):
+		super(TStatsPanel, self).__init__(parent)
+		self._cache = OrderedDict()
+		self._wanted = None
+		self._inflight = set()
+		# nothing is computed while the dock is hidden, the shown image is
+		# remembered by key and file only, its pixels are not kept for it
+		self._active = False
+		self._deferred = None
+		self._pool = QThreadPool.globalInstance()
+
+		layout = QVBoxLayout(self)
+		self._histogram = THistogram(self)
+		layout.addWidget(self._histogram)
+		self._text = QLabel(self)
+		self._text.setTextInteractionFlags(Qt.TextSelectableByMouse)
+		self._text.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+		layout.addWidget(self._text)
+		layout.addStretch()
+		self.setLayout(layout)
+
+	def set_image(self, data):
+		# TImageData on screen, statistics follow in the background
+		self._wanted = data.key if data is not None else None
+		if self._wanted is None:
+			self.__show(None)
+			return
+		self._deferred = None
+		stats = self._cache.get(self._wanted)
+		if stats is not None:
+			self._cache.move_to_end(self._wanted)
+			self.__show(stats)
+			return
+		if not self._active:
+			self.__show(None)
+			self._deferred = (data.key, data.filename)
+			return
+		# the overview of a tiled image is enough for a histogram
+		pixels = data.pixels if data.pixels is not None else data.texels_only
+		self.__compute(data.key, TStatsTask(data.key, data.filename, pixels, data.tiled, self.__is_wanted))
+
+	def set_active(self, active):
+		# visibility of the dock, the image shown while it was hidden is
+		# decoded again for its statistics
+		self._active = active
+		if active and self._deferred is not None:
+			key, filename = self._deferred
+			self._deferred = None
+			self.__compute(key, TStatsTask(key, filename, None, False, self.__is_wanted, decode=True))
+
+	def __compute(self, key, task):
+		self._text.setText("computing...")
+		self._histogram.set_stats(None)
+		if key in self._inflight:
+			return
+		self._inflight.add(key)
+		task.signals.computed.connect(self.__slot_computed)
+		# behind the decodes
+		self._pool.start(task, -1)
+
+	def __is_wanted(self, key):
+		return key == self._wanted
+
+	def __slot_computed(self, key, stats):
+		self._inflight.discard(key)
+		if stats is None:
+			if key == self._wanted:
+				self.__show(None)
+			return
+		self._cache[key] = stats
+		while len(self._cache) > STATS_CACHE_ITEMS:
+			self._cache.popitem(last=False)
+		if key == self._wanted:
+			self.__show(stats)
+
+	def __show(self, stats):
+		self._histogram.set_stats(stats)
+		if stats is None:
+			self._text.setText("")
+			return
+		lines = ["channel    min       max       mean"]
+		for c in stats.channels:
+			lines.append(f"{c.name:<7} {c.min:>9.6g} {c.max:>9.6g} {c.mean:>10.6g}")
+		if any(c.name == "A" for c in stats.channels):
+			lines.append("alpha used" if stats.alpha_used else "alpha unused (opaque)")
+		if stats.nan or stats.inf:
+			lines.append(f"NaN {stats.nan}  Inf {stats.inf}")
+		if stats.overview:
+			lines.append("from the overview")
+		self._text.setText("<pre>" + "\n".join(lines) + "</pre>")
@@ -0,0 +1,107 @@
+# header parsing of the mapped readers, on synthetic files
+# standard library only: python -m pytest test_readers.py
+import os
+import struct
+import tempfile
+import unittest
+from dds import read_dds, TDDSImage, DDSD_MIPMAPCOUNT, DDSCAPS2_CUBEMAP, DDSCAPS2_CUBEMAP_ALLFACES
+from dds import DDPF_RGB, DDPF_ALPHAPIXELS, DDPF_FOURCC
+from rawimage import read_tga, TRawImage
+
+
+def dds_header(width, height, mip_count=0, caps2=0, fourcc=b"\0\0\0\0", bits=32, masks=None, dx10=None):
+	# 128 byte header, a 20 byte DX10 one after it when dx10 is (format, array size)
+	header = bytearray(128)
+	header[:4] = b"DDS "
+	flags = DDSD_MIPMAPCOUNT if mip_count else 0
+	struct.pack_into("<4I", header, 4, 124, flags, height, width)
+	struct.pack_into("<I", header, 28, mip_count)
+	if dx10 is not None or fourcc != b"\0\0\0\0":
+		struct.pack_into("<2I4s", header, 76, 32, DDPF_FOURCC, b"DX10" if dx10 is not None else fourcc)
+	else:
+		struct.pack_into("<2I4sI", header, 76, 32, DDPF_RGB | DDPF_ALPHAPIXELS, fourcc, bits)
+		struct.pack_into("<4I", header, 92, *(masks or (0xFF0000, 0xFF00, 0xFF, 0xFF000000)))
+	struct.pack_into("<I", header, 112, caps2)
+	if dx10 is not None:
+		dxgi_format, array_size = dx10
+		header += struct.pack("<5I", dxgi_format, 3, 0, array_size, 0)
+	return bytes(header)
+
+
+def tga_header(width, height, bpp, top_down=False):
+	descriptor = (0x20 if top_down else 0) | (8 if bpp == 32 else 0)
+	return struct.pack("<3B", 0, 0, 2) + bytes(9) + struct.pack("<2H2B", width, height, bpp, descriptor)
+
+
+class TReaderTest(unittest.TestCase):
+	def setUp(self):
+		self._dir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self._dir.cleanup()
+
+	def write(self, name, data):
+		path = os.path.join(self._dir.name, name)
+		with open(path, "wb") as f:
+			f.write(data)
+		return path
+
+	def test_dds_single(self):
+		image = read_dds(self.write("a.dds", dds_header(4, 4) + bytes(4 * 4 * 4)))
+		self.assertIsInstance(image, TRawImage)
+		self.assertEqual((image.size, image.layout, image.offset), ((4, 4), "BGRA", 128))
+		self.assertEqual((image.mips, image.layers, image.cube), ((), (), False))
+
+	def test_dds_mipped(self):
+		image = read_dds(self.write("a.dds", dds_header(4, 4, 3) + bytes(64 + 16 + 4)))
+		self.assertEqual(image.mips, ((2, 2, 192), (1, 1, 208)))
+		self.assertEqual(image.layers, ())
+
+	def test_dds_cube(self):
+		caps2 = DDSCAPS2_CUBEMAP | DDSCAPS2_CUBEMAP_ALLFACES
+		image = read_dds(self.write("a.dds", dds_header(4, 4, caps2=caps2) + bytes(6 * 64)))
+		self.assertTrue(image.cube)
+		self.assertEqual([offset for offset, _ in image.layers], [128 + i * 64 for i in range(6)])
+
+	def test_dds_truncated_cube(self):
+		# four faces stored, shown as an array
+		caps2 = DDSCAPS2_CUBEMAP | DDSCAPS2_CUBEMAP_ALLFACES
+		image = read_dds(self.write("a.dds", dds_header(4, 4, caps2=caps2) + bytes(4 * 64)))
+		self.assertFalse(image.cube)
+		self.assertEqual(len(image.layers), 4)
+
+	def test_dds_compressed_single(self):
+		image = read_dds(self.write("a.dds", dds_header(8, 8, fourcc=b"DXT1") + bytes(4 * 8)))
+		self.assertIsInstance(image, TDDSImage)
+		self.assertEqual((image.mips, image.layers), ([(8, 8, 128, 32)], ()))
+
+	def test_dds_dx10_array(self):
+		# three BC1 layers of 4x4 with two levels each
+		data = dds_header(4, 4, 2, dx10=(71, 3)) + bytes(3 * (8 + 8))
+		image = read_dds(self.write("a.dds", data))
+		self.assertIsInstance(image, TDDSImage)
+		self.assertFalse(image.cube)
+		self.assertEqual(len(image.layers), 3)
+		self.assertEqual(image.layers[1], [(4, 4, 164, 8), (2, 2, 172, 8)])
+
+	def test_dds_dx10_uncompressed(self):
+		image = read_dds(self.write("a.dds", dds_header(2, 2, dx10=(87, 1)) + bytes(2 * 2 * 4)))
+		self.assertEqual((image.layout, image.offset, image.layers), ("BGRA", 148, ()))
+
+	def test_dds_truncated(self):
+		self.assertIsNone(read_dds(self.write("a.dds", dds_header(4, 4) + bytes(10))))
+
+	def test_tga(self):
+		image = read_tga(self.write("a.tga", tga_header(2, 3, 32) + bytes(2 * 3 * 4)))
+		self.assertEqual((image.size, image.layout, image.offset, image.pitch), ((2, 3), "BGRA", 18, 8))
+		self.assertTrue(image.bottom_up)
+		self.assertEqual(image.rows(0, 1), (18 + 2 * 8, 18 + 3 * 8))
+		image = read_tga(self.write("b.tga", tga_header(2, 2, 24, top_down=True) + bytes(2 * 2 * 3)))
+		self.assertEqual((image.layout, image.bottom_up), ("BGR", False))
+
+	def test_tga_truncated(self):
+		self.assertIsNone(read_tga(self.write("a.tga", tga_header(4, 4, 32) + bytes(10))))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,23 +1,35 @@
+import os
 import sys
 import ctypes
-from array import array
+import argparse
+import struct
+from time import perf_counter
+from collections import OrderedDict
 from pathlib import Path
 from subprocess import run
 from os.path import join, dirname, realpath
 from PySide2.QtCore import Qt
 from PySide2.QtCore import QFileInfo
 from PySide2.QtCore import Signal
+from PySide2.QtCore import QObject
+from PySide2.QtCore import QRunnable
+from PySide2.QtCore import QThreadPool
+from PySide2.QtCore import QTimer
+from PySide2.QtCore import QFileSystemWatcher
 from PySide2.QtGui import QMouseEvent
 from PySide2.QtGui import QColor
 from PySide2.QtGui import QVector4D
+from PySide2.QtGui import QKeySequence
 from PySide2.QtGui import QOpenGLFunctions
+from PySide2.QtGui import QOpenGLContext
+from PySide2.QtGui import QOffscreenSurface
 from PySide2.QtGui import QSurfaceFormat
-from PySide2.QtGui import QOpenGLTexture
-from PySide2.QtGui import QOpenGLShader
-from PySide2.QtGui import QOpenGLShaderProgram
 from PySide2.QtGui import QOpenGLVertexArrayObject
 from PySide2.QtGui import QOpenGLBuffer
 from PySide2.QtGui import QMatrix4x4
+from PySide2.QtGui import QPainter
+from PySide2.QtGui import QOpenGLTimerQuery
+from PySide2.QtGui import QIcon
 from PySide2.QtWidgets import QFileIconProvider
 from PySide2.QtWidgets import QApplication
 from PySide2.QtWidgets import QMainWindow
@@ -29,44 +41,625 @@ from PySide2.QtWidgets import QLabel
 from PySide2.QtWidgets import QColorDialog
 from PySide2.QtWidgets import QOpenGLWidget
 from PySide2.QtWidgets import QStatusBar
-from OpenGL import GL
-# Pillow
-from PIL import Image, UnidentifiedImageError
-from PIL.ImageQt import ImageQt
+from PySide2.QtWidgets import QShortcut
+from PySide2.QtWidgets import QDockWidget
+from PySide2.QtWidgets import QSystemTrayIcon
+from PySide2.QtWidgets import QMenu
+from PySide2.QtWidgets import QComboBox
+from PySide2.QtWidgets import QFileDialog
+from PySide2.QtWidgets import QDoubleSpinBox
+from PySide2.QtWidgets import QSpinBox
+# heavy modules are loaded on first use, the window shows first
+from startup import profile, lazy_import
+QtNetwork = lazy_import("PySide2.QtNetwork")
+GL = lazy_import("OpenGL.GL")
+# DirectDraw Surface
+from dds import supported_formats
+# decoders of every supported format
+from imagedecode import SUPPORTED_IMAGES, TILED_LIMIT
+from imagedecode import SOURCE_RGBA, GL_LINEAR, GL_NEAREST, GL_TEXTURE_2D, GL_TEXTURE_CUBE_MAP
+from imagedecode import TPixels, TTexelReader, TImageData, decode_image, decode_preview
+# shaders, programs and textures
+from gltexture import TONEMAP_NONE, TONEMAP_NAMES, DEFAULT_GAMMA, QUAD_INDICES, QUAD_VERTICES
+from gltexture import VS_TEXTURE, FS_TEXTURE, VS_GRID, FS_GRID, tone_values, channels_matrix, source_uniforms
+from gltexture import TLayeredTexture, create_program, create_texture, create_compressed_texture
+from gltexture import create_layered_texture, update_texture, texture_nbytes
+# single instance
+from resident import server_name, parse_message, forward, COMMAND_NEW
+# folder thumbnails, the grid is imported when it is first shown
+from thumbcache import THUMBNAIL_CACHE, TThumbnailCache
+from programcache import program_cache
+# channel statistics
+from statspanel import TStatsPanel
+# a/b comparison metrics
+from imagediff import diff_pixels
+
+
+# default video memory budget of the texture cache
+VRAM_BUDGET = 512 * 1024 * 1024
+# quiet time after the last write before a changed file is reloaded, ms
+RELOAD_DELAY = 300
+# zoom limits, smallest image width on screen and largest texel in pixels
+ZOOM_MIN_WIDTH = 16
+ZOOM_MAX_TEXEL = 64
+ZOOM_STEP = 1.25
+# a/b comparison modes of the viewport, in the order of the window's combo box
+COMPARE_OFF = 0
+COMPARE_SPLIT = 1
+COMPARE_FLICKER = 2
+COMPARE_DIFFERENCE = 3
+COMPARE_AMPLIFIED = 4
+COMPARE_GAIN = 16.0
+COMPARE_NAMES = ("Off", "Split", "Flicker", "Difference", f"Difference x{COMPARE_GAIN:g}")
+# mode of the fragment shader and difference gain of each comparison mode
+COMPARE_SHADER = {
+	COMPARE_OFF: (0.0, 1.0),
+	COMPARE_SPLIT: (1.0, 1.0),
+	COMPARE_FLICKER: (0.0, 1.0),
+	COMPARE_DIFFERENCE: (3.0, 1.0),
+	COMPARE_AMPLIFIED: (3.0, COMPARE_GAIN),
+}
+# ms each image is shown in flicker mode
+FLICKER_INTERVAL = 500
+# cube faces in GL_TEXTURE_CUBE_MAP_POSITIVE_X order, FACE_CROSS unfolds all six
+CUBE_FACES = ("+X", "-X", "+Y", "-Y", "+Z", "-Z")
+FACE_CROSS = 6
+# decoded neighbours kept in memory while browsing a folder
+PREFETCH_BUDGET = 512 * 1024 * 1024
+PREFETCH_NEIGHBOURS = 2
+# video memory of the tiles of a viewport
+TILE_BUDGET = 256 * 1024 * 1024
+
+
+def texture_key(filename):
+	# identifies a file version
+	st = os.stat(filename)
+	return str(Path(filename).resolve()), st.st_mtime_ns, st.st_size
+
+
+def folder_images(filename):
+	# supported images next to filename, sorted by name
+	folder = Path(filename).parent
+	try:
+		entries = [e for e in os.scandir(folder) if e.is_file()]
+	except OSError:
+		return []
+	files = [e.path for e in entries if Path(e.name).suffix[1:].upper() in SUPPORTED_IMAGES]
+	files.sort(key=lambda f: Path(f).name.lower())
+	return files
+
+
+class TTextureCache:
+	# gpu resident textures, least recently used are destroyed first
+	# textures are destroyed here, the owner's context must be current
+	def __init__(self, budget=VRAM_BUDGET):
+		self.budget = budget
+		self.used = 0
+		self._items = OrderedDict()
+		# key: number of viewports showing it, never evicted
+		self._pins = {}
+
+	def __contains__(self, key):
+		return key in self._items
+
+	def get(self, key):
+		item = self._items.get(key)
+		if item is None:
+			return None
+		self._items.move_to_end(key)
+		return item
+
+	def put(self, key, texture, data, nbytes=None):
+		if nbytes is None:
+			# rgba8 with a full mip chain
+			nbytes = texture.width() * texture.height() * 4 * 4 // 3
+		self._items[key] = (texture, data, nbytes)
+		self._items.move_to_end(key)
+		self.used += nbytes
+		self.evict()
+
+	def keys(self):
+		return list(self._items)
+
+	def __len__(self):
+		return len(self._items)
+
+	def take(self, key):
+		# removes the entry without destroying its texture
+		item = self._items.pop(key, None)
+		if item is not None:
+			self.used -= item[2]
+		return item
+
+	def discard(self, key):
+		item = self.take(key)
+		if item is not None:
+			item[0].destroy()
+
+	def pin(self, key):
+		self._pins[key] = self._pins.get(key, 0) + 1
+
+	def unpin(self, key):
+		n = self._pins.pop(key, 0) - 1
+		if n > 0:
+			self._pins[key] = n
+
+	def pins(self, key):
+		return self._pins.get(key, 0)
+
+	def evict(self):
+		# textures on screen are pinned, the most recent one is kept too
+		for key in list(self._items):
+			if self.used <= self.budget or len(self._items) <= 1:
+				break
+			if key in self._pins:
+				continue
+			texture, _, nbytes = self._items.pop(key)
+			texture.destroy()
+			self.used -= nbytes
+
+	def clear(self):
+		for texture, _, _ in self._items.values():
+			texture.destroy()
+		self._items.clear()
+		self.used = 0
+
+
+class TMemoryUsage:
+	def __init__(self, cpu, gpu, cpu_budget, gpu_budget, items):
+		# bytes held in cpu buffers and gpu storage, items is name: bytes
+		self.cpu = cpu
+		self.gpu = gpu
+		self.cpu_budget = cpu_budget
+		self.gpu_budget = gpu_budget
+		self.items = items
+
+	def add(self, other):
+		# another part of the same process, items are summed by name
+		self.cpu += other.cpu
+		self.gpu += other.gpu
+		self.cpu_budget += other.cpu_budget
+		self.gpu_budget += other.gpu_budget
+		for name, nbytes in other.items.items():
+			self.items[name] = self.items.get(name, 0) + nbytes
+
+	def as_dict(self):
+		return {
+			"cpu": self.cpu,
+			"gpu": self.gpu,
+			"cpu_budget": self.cpu_budget,
+			"gpu_budget": self.gpu_budget,
+			**self.items,
+		}
+
+	def __str__(self):
+		mb = 1.0 / (1024 * 1024)
+		return "CPU {:.0f}/{:.0f} MB | GPU {:.0f}/{:.0f} MB ".format(
+			self.cpu * mb, self.cpu_budget * mb, self.gpu * mb, self.gpu_budget * mb)
+
+
+class TImageCache:
+	# decoded cpu images, least recently used are dropped first
+	def __init__(self, budget=PREFETCH_BUDGET):
+		self.budget = budget
+		self.used = 0
+		self._items = OrderedDict()
+		# owner: key, bytes of the shown images the viewports keep outside
+		# of the cache, the inspector's pixels or a tile source
+		self._held = {}
+
+	def __contains__(self, key):
+		return key in self._items
+
+	def get(self, key):
+		data = self._items.get(key)
+		if data is not None:
+			self._items.move_to_end(key)
+		return data
+
+	def discard(self, key):
+		data = self._items.pop(key, None)
+		if data is not None:
+			self.used -= data.nbytes
+
+	def discard_file(self, path):
+		# every cached version of the file at path
+		for key in [key for key in self._items if key[0] == path]:
+			self.discard(key)
+
+	def put(self, key, data):
+		if key in self._items:
+			self.used -= self._items.pop(key).nbytes
+		self._items[key] = data
+		self.used += data.nbytes
+		self.evict()
+
+	def __len__(self):
+		return len(self._items)
+
+	def hold(self, owner, key, nbytes):
+		# counted against the budget while the cache has no entry of key
+		if nbytes:
+			self._held[owner] = (key, nbytes)
+		else:
+			self._held.pop(owner, None)
+		self.evict()
+
+	def held(self, owner=None):
+		# bytes held outside of the cache, by owner or by all of them
+		return sum(
+			nbytes for o, (key, nbytes) in self._held.items()
+			if (owner is None or o is owner) and key not in self._items)
+
+	def evict(self):
+		while self.used + self.held() > self.budget and len(self._items) > 1:
+			_, old = self._items.popitem(last=False)
+			self.used -= old.nbytes
+
+
+class TDecodeSignals(QObject):
+	# key, image data or None when cancelled
+	decoded = Signal(object, object)
+	# key, reduced image data ahead of decoded
+	previewed = Signal(object, object)
+
+
+class TDecodeTask(QRunnable):
+	def __init__(
+			self, filename, key, is_wanted, max_size=TILED_LIMIT, compressed_formats=frozenset(),
+			progressive=False, thumbnails=None):
+		super(TDecodeTask, self).__init__()
+		self.signals = TDecodeSignals()
+		self._filename = filename
+		self._key = key
+		self._is_wanted = is_wanted
+		self._max_size = max_size
+		self._compressed_formats = compressed_formats
+		# preview first, thumbnails is the cache it may come from
+		self._progressive = progressive
+		self._thumbnails = thumbnails
+
+	def run(self):
+		# decoded is always emitted, the viewport waits for it to leave the
+		# in flight set, any error of a reader or of Pillow is the result
+		data = None
+		try:
+			if self._progressive and self._is_wanted(self._key):
+				try:
+					preview = decode_preview(self._filename, self._thumbnails)
+				except Exception:
+					# the full decode reports it
+					preview = None
+				if preview is not None:
+					self.signals.previewed.emit(self._key, preview)
+			# superseded while waiting in the queue
+			if self._is_wanted(self._key):
+				cancelled = lambda: not self._is_wanted(self._key)
+				data = decode_image(self._filename, cancelled, self._max_size, self._compressed_formats)
+				# the upload copies from the mapping on the gui thread, its
+				# pages are read here and not there
+				if data is not None and data.mapped and not data.read_in(cancelled):
+					data = None
+		except Exception as e:
+			print(f"{type(e).__name__}:\n", e, flush=True)
+			data = TImageData(self._filename, None, f"{type(e).__name__}: {e} ")
+		finally:
+			if data is not None:
+				data.key = self._key
+			self.signals.decoded.emit(self._key, data)
+
+
+class TTileTask(QRunnable):
+	def __init__(self, source, key, is_wanted):
+		super(TTileTask, self).__init__()
+		self.signals = TDecodeSignals()
+		self._source = source
+		self._key = key
+		self._is_wanted = is_wanted
+
+	def run(self):
+		# key is image key, level, tx, ty
+		image = None
+		try:
+			if self._is_wanted(self._key):
+				image = self._source.tile(*self._key[1:])
+		except Exception as e:
+			# the overview stays, the tile is asked for again when it is drawn
+			print(f"{type(e).__name__}:\n", e, flush=True)
+		finally:
+			self.signals.decoded.emit(self._key, image)
+
+
+class TTexelsTask(QRunnable):
+	def __init__(self, pixels, is_wanted):
+		super(TTexelsTask, self).__init__()
+		self.signals = TDecodeSignals()
+		self._pixels = pixels
+		self._is_wanted = is_wanted
+
+	def run(self):
+		# detached pixels, their rows read from the file or None
+		pixels = None
+		try:
+			if self._is_wanted(self._pixels):
+				pixels = self._pixels.read()
+		except Exception as e:
+			# the inspector shows coordinates only
+			print(f"{type(e).__name__}:\n", e, flush=True)
+		finally:
+			self.signals.decoded.emit(self._pixels, pixels)
+
+
+class TCompareSignals(QObject):
+	# key pair, TDiffMetrics or error text, None when cancelled
+	compared = Signal(object, object)
+
+
+class TCompareTask(QRunnable):
+	def __init__(self, filename_a, filename_b, key, is_wanted):
+		super(TCompareTask, self).__init__()
+		self.signals = TCompareSignals()
+		self._filenames = (filename_a, filename_b)
+		self._key = key
+		self._is_wanted = is_wanted
+
+	def run(self):
+		# both files at full resolution, block compressed ones through Pillow
+		# compared is always emitted, the viewport waits for it, any error of
+		# a reader, of Pillow or of the diff is the result
+		result = None
+		cancelled = lambda: not self._is_wanted(self._key)
+		try:
+			if not cancelled():
+				a, b = (decode_image(f, cancelled, sys.maxsize) for f in self._filenames)
+				if a is not None and b is not None:
+					result = diff_pixels(a.pixels, b.pixels)
+		except Exception as e:
+			result = f"{type(e).__name__}: {e} "
+		finally:
+			self.signals.compared.emit(self._key, result)
+
+
+class TSharedResources(QObject):
+	# gl objects and caches of the viewports of a process, whose contexts
+	# share one group (AA_ShareOpenGLContexts); programs and quad buffers are
+	# made by the first viewport and dropped with the last, cached textures
+	# are made in the global share context, which outlives every viewport
+	# key, image data or None, of the decodes started by any viewport
+	decoded = Signal(object, object)
+	previewed = Signal(object, object)
+
+	def __init__(self, vram_budget=VRAM_BUDGET, prefetch_budget=PREFETCH_BUDGET):
+		super(TSharedResources, self).__init__()
+		self.textures = TTextureCache(vram_budget)
+		self.images = TImageCache(prefetch_budget)
+		self.inflight = set()
+		# replaced, never changed in place, the pool threads iterate it
+		self.viewports = ()
+		# viewport the uniforms of the shared programs were last set for
+		self.uniforms = None
+		self._objects = None
+		self._refs = 0
+		self._surface = None
+		self._thumbnails = None
+
+	def attach(self, viewport):
+		self.viewports += (viewport,)
+
+	def detach(self, viewport):
+		self.viewports = tuple(v for v in self.viewports if v is not viewport)
+		if self.uniforms is viewport:
+			self.uniforms = None
+
+	def memory_usage(self):
+		# TMemoryUsage of the shared caches, with the pixels the viewports
+		# keep of their shown images, counted against the same cpu budget
+		held = self.images.held()
+		items = {
+			"cpu_images": self.images.used,
+			"cpu_image_count": len(self.images),
+			"cpu_held": held,
+			"gpu_textures": self.textures.used,
+			"gpu_texture_count": len(self.textures),
+		}
+		return TMemoryUsage(
+			self.images.used + held, self.textures.used, self.images.budget, self.textures.budget, items)
+
+	def is_wanted(self, key):
+		# called from the pool threads
+		return any(viewport.wants(key) for viewport in self.viewports)
+
+	def thumbnails(self):
+		# previews of large images come from the thumbnail cache when they
+		# can, opened with the first of them
+		if self._thumbnails is None:
+			self._thumbnails = TThumbnailCache(THUMBNAIL_CACHE)
+		return self._thumbnails
+
+	def acquire(self, context, gl_info):
+		# texture program, grid program, vertex and index buffer of the quad,
+		# a viewport's context is current
+		if not self._refs:
+			profile.begin("programs")
+			# parented to a context that lives as long as they are used
+			parent = QOpenGLContext.globalShareContext() or context
+			program = create_program(parent, VS_TEXTURE, FS_TEXTURE, ("Pos", "UV"), gl_info)
+			program_bg = create_program(parent, VS_GRID, FS_GRID, ("Pos",), gl_info)
+			profile.end("programs")
+			vbo = QOpenGLBuffer(QOpenGLBuffer.VertexBuffer)
+			vbo.create()
+			vbo.setUsagePattern(QOpenGLBuffer.StaticDraw)
+			vbo.bind()
+			vbo.allocate(QUAD_VERTICES.tobytes(), QUAD_VERTICES.itemsize * len(QUAD_VERTICES))
+			vbo.release()
+			ibo = QOpenGLBuffer(QOpenGLBuffer.IndexBuffer)
+			ibo.create()
+			ibo.setUsagePattern(QOpenGLBuffer.StaticDraw)
+			ibo.bind()
+			ibo.allocate(QUAD_INDICES.tobytes(), QUAD_INDICES.itemsize * len(QUAD_INDICES))
+			ibo.release()
+			self._objects = (program, program_bg, vbo, ibo)
+		self._refs += 1
+		return self._objects
+
+	def release(self):
+		# a viewport's context is current, the last one frees everything
+		self._refs -= 1
+		if self._refs:
+			return
+		program, program_bg, vbo, ibo = self._objects
+		self._objects = None
+		program.deleteLater()
+		program_bg.deleteLater()
+		vbo.destroy()
+		ibo.destroy()
+		self.textures.clear()
+		self.uniforms = None
+
+	def begin_upload(self):
+		# makes the global share context current for textures the cache
+		# keeps, False when there is none and the caller's context is used
+		share = QOpenGLContext.globalShareContext()
+		if share is None:
+			return False
+		if self._surface is None:
+			self._surface = QOffscreenSurface()
+			self._surface.setFormat(share.format())
+			self._surface.create()
+		return share.makeCurrent(self._surface)
+
+	def end_upload(self, viewport):
+		# the new texture is complete before another context samples it
+		GL.glFlush()
+		viewport.makeCurrent()
 
 
 class TGLViewport(QOpenGLWidget, QOpenGLFunctions):
-	def __init__(self, parent=None):
+	infoChanged = Signal(str)
+	# text of the memory held in cpu buffers and gpu storage
+	memoryChanged = Signal(str)
+	# a/b metrics of the compared pair
+	compareChanged = Signal(str)
+	# TImageData about to be shown
+	imageChanged = Signal(object)
+	# texel under the cursor, empty when outside of the image
+	pixelChanged = Signal(str)
+
+	def __init__(self, parent=None, vram_budget=VRAM_BUDGET, prefetch_budget=PREFETCH_BUDGET, resources=None):
 		QOpenGLWidget.__init__(self, parent)
 		QOpenGLFunctions.__init__(self)
 		self.setMinimumSize(32, 32)
 
 		self.info = ""
-		self._supported_images = ["TGA", "PNG", "JPG", "JPEG", "TIF", "TIFF", "BMP", "DDS"]
+		self._supported_images = SUPPORTED_IMAGES
 
-		# indices
-		indices = [0, 1, 3, 1, 2, 3]
-		self._indices = array('I', indices)
+		# caches, decodes and gl objects, shared with the other viewports of
+		# the application or private, the budgets are the resources' then
+		if resources is None:
+			resources = TSharedResources(vram_budget, prefetch_budget)
+		self._resources = resources
+		resources.attach(self)
+		self.destroyed.connect(lambda _=None, r=resources, v=self: r.detach(v))
+		resources.decoded.connect(self.__slot_decoded)
+		resources.previewed.connect(self.__slot_previewed)
 
-		# vertices
-		# 3 position | 2 texture coord
-		vertex = [
-			 1.0,  1.0, 0.0, 1.0, 1.0,  # top right
-			 1.0, -1.0, 0.0, 1.0, 0.0,  # bottom right
-			-1.0, -1.0, 0.0, 0.0, 0.0,  # bottom left
-			-1.0,  1.0, 0.0, 0.0, 1.0   # top left
-		]
-		self._vertex = array('f', vertex)
-
-		# opengl data related
-		self._program = QOpenGLShaderProgram()
-		self._program_bg = QOpenGLShaderProgram()
+		# decoding
+		# only the newest request is uploaded, older ones are dropped
+		self._wanted = None
+		self._prefetch = frozenset()
+		self._inflight = resources.inflight
+		self._pending = None
+		self._pool = QThreadPool.globalInstance()
+		self._images = resources.images
+
+		# quad
+		self._indices = QUAD_INDICES
+
+		# opengl data related, programs and buffers come from the resources
+		self._program = None
+		self._program_bg = None
 		self._vao = QOpenGLVertexArrayObject()
-		self._vbo = QOpenGLBuffer(QOpenGLBuffer.VertexBuffer)
+		self._vbo = None
+		self._ibo = None
+		self._count = len(self._indices)
+		# uniforms are uploaded in paintGL only after a change
+		self._dirty = True
 		self._texture = None
 		self._texture_size = (1, 1)
+		# fit to window scale, zoom on top of it and pan offset in clip space
+		self._fit = (1.0, 1.0)
+		self._scale = (1.0, 1.0)
+		self._zoom = 1.0
+		self._pan = (0.0, 0.0)
+		self._drag = None
+		# nearest filtering once a texel is larger than a pixel
+		self._mag_filter = GL_LINEAR
+		self._textures = resources.textures
+		# key of the cached texture shown, pinned while it is
+		self._shown = None
+		# current texture is not in the cache (icons)
+		self._texture_owned = False
+		self._texture_nbytes = 0
+		self._max_texture_size = TILED_LIMIT
+		self._compressed_formats = frozenset()
+		# pixel unpack buffer for streaming uploads, 0 when not available
+		self._pbo = 0
+		self._source = source_uniforms(SOURCE_RGBA)
+		self._flip = 0.0
+
+		# tiles of the current image when it is too large for one texture
+		self._tile_source = None
+		self._tile_key = None
+		self._tiles = TTextureCache(TILE_BUDGET)
+		self._tiles_wanted = frozenset()
+		self._tiles_inflight = set()
+		self._tiles_pending = []
 		self._location = ()
 
+		# key of the file version a reload replaces
+		self._reload = None
+
+		# a/b comparison, the second texture is owned and never cached
+		self._wanted_b = None
+		self._pending_b = None
+		self._texture_b = None
+		self._texture_b_nbytes = 0
+		self._source_b = source_uniforms(SOURCE_RGBA)
+		self._flip_b = 0.0
+		self._compare = COMPARE_OFF
+		# split position, normalized image x
+		self._split = 0.5
+		self._flicker_b = False
+		self._flicker = QTimer(self)
+		self._flicker.setInterval(FLICKER_INTERVAL)
+		self._flicker.timeout.connect(self.__slot_flicker)
+		self._metrics_key = None
+
+		# shown mip level, array layer and cube face, binding and texture
+		# parameters only
+		self._mip = 0
+		self._layer = 0
+		self._face = 0
+		self._cube = False
+		self._image_size = (1, 1)
+		self._surfaces = ()
+		self._base_texels = None
+
+		# exposure in stops, display gamma and tonemap, uniforms only
+		self._exposure = 0.0
+		self._gamma = DEFAULT_GAMMA
+		self._tonemap = TONEMAP_NONE
+		self._linear = False
+
+		# pixel inspector, reads the retained source of the current image, a
+		# copy of the shown surface of a mapped one read off the gui thread
+		self._texels = None
+		self._texels_source = None
+		self._texels_copy = None
+		self._held = (None, 0)
+		self._texel = None
+		self.setMouseTracking(True)
+
 		self._colors_default = (
 			QColor.fromRgbF(0.65, 0.65, 0.65, 1.0),
 			QColor.fromRgbF(0.90, 0.90, 0.90, 1.0)
@@ -81,79 +674,30 @@ class TGLViewport(QOpenGLWidget, QOpenGLFunctions):
 			0, 0, 0, 0
 		)
 
+		# render statistics overlay
+		self._overlay = False
+		self._queries = ()
+		self._query_frame = 0
+		self._query_count = 0
+		self._stats_cpu = 0.0
+		self._stats_gpu = 0.0
+		self._stats_upload = 0.0
+
 	def initializeGL(self):
 		# Set up the rendering context, define display lists etc.
+		profile.begin("initializeGL")
 		self.initializeOpenGLFunctions()
+		self.context().aboutToBeDestroyed.connect(self.__cleanup)
+		self._max_texture_size = min(TILED_LIMIT, int(GL.glGetIntegerv(GL.GL_MAX_TEXTURE_SIZE)))
+		self._compressed_formats = supported_formats(lambda e: self.context().hasExtension(e.encode()))
+		if not self.context().isOpenGLES() and self.context().format().majorVersion() >= 3:
+			self._pbo = int(GL.glGenBuffers(1))
 		self.glClearColor(0.2, 0.0, 0.2, 0.0)
 		self.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
 
-		# shader code (OpenGL ES)
-		# texture
-		vs_source_es = """
-		attribute highp vec3 Pos;
-		attribute highp vec2 UV;
-		uniform highp vec2 Scale;
-		varying highp vec2 oUV;
-		void main() {
-			gl_Position = vec4(Pos * vec3(Scale, 1.0), 1.0);
-			oUV = UV;
-		}
-		"""
-		ps_source_es = """
-		varying highp vec2 oUV;
-		uniform sampler2D Texture;
-		uniform highp mat4 Channels;
-		uniform highp vec4 Add;
-		void main() {
-			gl_FragColor = texture2D(Texture, oUV * vec2(1.0, -1.0)) * Channels;
-			gl_FragColor.a += (1.0 - Channels[3][3]);
-		}
-		"""
-		# background
-		vs_grid_es = """
-		attribute highp vec3 Pos;
-		void main() {
-			gl_Position = vec4(Pos, 1.0);
-		}
-		"""
-		ps_grid_es = """
-		uniform highp vec4 Color1;
-		uniform highp vec4 Color2;
-		uniform highp vec4 Height;
-		void main() {
-			highp vec2 a = floor((Height.xy - gl_FragCoord.xy) / 64.0);
-			highp float even = mod(a.x + a.y, 2.0);
-			highp vec3 c = mix(Color1.rgb, Color2.rgb, even);
-			gl_FragColor = vec4(c, 1);
-		}
-		"""
-
-		# program - texture
-		# shader
-		vs = self.__create_shader(QOpenGLShader.Vertex, vs_source_es)
-		fs = self.__create_shader(QOpenGLShader.Fragment, ps_source_es)
-		# program
-		self._program = QOpenGLShaderProgram(self.context())
-		self._program.addShader(vs)
-		self._program.addShader(fs)
-		# attribute location
-		self._program.bindAttributeLocation("Pos", 0)
-		self._program.bindAttributeLocation("UV", 1)
-		# link program
-		r = self._program.link()
-
-		# program - background
-		# shader
-		vs = self.__create_shader(QOpenGLShader.Vertex, vs_grid_es)
-		fs = self.__create_shader(QOpenGLShader.Fragment, ps_grid_es)
-		# program
-		self._program_bg = QOpenGLShaderProgram(self.context())
-		self._program_bg.addShader(vs)
-		self._program_bg.addShader(fs)
-		# attribute location
-		self._program_bg.bindAttributeLocation("Pos", 0)
-		# link program
-		r = self._program_bg.link()
+		# programs and quad buffers, compiled and filled by the first viewport
+		self._program, self._program_bg, self._vbo, self._ibo = self._resources.acquire(
+			self.context(), self.get_gl_info())
 
 		# uniform locations
 		self._location = (
@@ -162,70 +706,271 @@ class TGLViewport(QOpenGLWidget, QOpenGLFunctions):
 			self._program_bg.uniformLocation("Color1"),
 			self._program_bg.uniformLocation("Color2"),
 			self._program_bg.uniformLocation("Height"),
+			self._program.uniformLocation("Tile"),
+			self._program.uniformLocation("Source"),
+			self._program.uniformLocation("Add"),
+			self._program.uniformLocation("Flip"),
+			self._program.uniformLocation("TextureB"),
+			self._program.uniformLocation("SourceB"),
+			self._program.uniformLocation("AddB"),
+			self._program.uniformLocation("FlipB"),
+			self._program.uniformLocation("Compare"),
+			self._program.uniformLocation("Tone"),
+			self._program.uniformLocation("Layout"),
+			self._program.uniformLocation("Cube"),
 		)
 
-		# vao
+		# vao, keeps the buffers and the attribute layout, not shared
 		r = self._vao.create()
 		r = self._vao.bind()
-		# vbo
-		r = self._vbo.create()
-		self._vbo.setUsagePattern(QOpenGLBuffer.StaticDraw)
 		r = self._vbo.bind()
+		r = self._ibo.bind()
 		sz_float = ctypes.sizeof(ctypes.c_float)
-		self._vbo.allocate(self._vertex.tobytes(), sz_float * len(self._vertex))
+		# 3 position | 2 texture coord
+		self._program.setAttributeBuffer(0, GL.GL_FLOAT, 0, 3, 5 * sz_float)
+		self._program.enableAttributeArray(0)
+		self._program.setAttributeBuffer(1, GL.GL_FLOAT, 3 * sz_float, 2, 5 * sz_float)
+		self._program.enableAttributeArray(1)
 		self._vao.release()
+		self._vbo.release()
+		self._ibo.release()
+		self._dirty = True
+
+		# gpu timer, two queries so the previous frame can be read without waiting
+		queries = (QOpenGLTimerQuery(self), QOpenGLTimerQuery(self))
+		if all(q.create() for q in queries):
+			self._queries = queries
+		profile.end("initializeGL")
 		# texture
-		self.set_texture(r"C:")
+		if self._wanted is None and self._pending is None:
+			self.set_texture(r"C:")
+
+	def __cleanup(self):
+		self.makeCurrent()
+		if self._texture_owned:
+			self._texture.destroy()
+		self._texture = None
+		self._texture_owned = False
+		self._texture_nbytes = 0
+		if self._texture_b is not None:
+			self._texture_b.destroy()
+			self._texture_b = None
+			self._texture_b_nbytes = 0
+		if self._shown is not None:
+			self._textures.unpin(self._shown)
+			self._shown = None
+		self._tiles.clear()
+		self._images.hold(self, None, 0)
+		for query in self._queries:
+			query.destroy()
+		self._queries = ()
+		if self._pbo:
+			GL.glDeleteBuffers(1, [self._pbo])
+			self._pbo = 0
+		self._vao.destroy()
+		self._resources.release()
+		self._program = self._program_bg = self._vbo = self._ibo = None
+		self.doneCurrent()
 
 	def resizeGL(self, width, height):
 		self.__update_scale(width, height)
 		self._height = QVector4D(0, self.height(), 0, 0)
+		self._dirty = True
 		self.glViewport(0, 0, width, height)
 
 	def paintGL(self):
-		SZ_FLOAT = ctypes.sizeof(ctypes.c_float)
+		if self._overlay:
+			start = perf_counter()
+			query = self.__begin_query()
+
+		# upload the last decoded image
+		uploaded = self._pending is not None or self._pending_b is not None or self._tiles_pending
+		if self._pending is not None:
+			self.__upload(self._pending)
+			if profile.enabled and self._pending.key is not None:
+				profile.mark("first image uploaded")
+				profile.report()
+			self._pending = None
+		if self._pending_b is not None:
+			self.__upload_b(self._pending_b)
+			self._pending_b = None
+		if self._tiles_pending:
+			self.__upload_tiles()
+		if uploaded:
+			self.__memory_changed()
 
 		# draw the scene
 		self.glClear(GL.GL_COLOR_BUFFER_BIT)
 
 		self._vao.bind()
+		# the programs are shared, another viewport may have set them since
+		if self._dirty or self._resources.uniforms is not self:
+			self.__update_uniforms()
 
 		# background
 		self._program_bg.bind()
-		self._program.setAttributeBuffer(0, GL.GL_FLOAT, 0, 3, 5 * SZ_FLOAT)
-		self._program.enableAttributeArray(0)
-		self._program.setUniformValue(self._location[2], self._u_colors[0])
-		self._program.setUniformValue(self._location[3], self._u_colors[1])
-		self._program.setUniformValue(self._location[4], self._height)
-		self.glDrawElements(GL.GL_TRIANGLES, len(self._indices), GL.GL_UNSIGNED_INT, self._indices.tobytes())
+		GL.glDrawElements(GL.GL_TRIANGLES, self._count, GL.GL_UNSIGNED_INT, None)
 
 		# texture
-		if self._texture is None:
-			return
+		if self._texture is not None:
+			self.glEnable(GL.GL_BLEND)
+			self._program.bind()
+			if self._compare != COMPARE_OFF and self._texture_b is not None:
+				self._texture_b.bind(1)
+				GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, self._mag_filter)
+				self.glActiveTexture(GL.GL_TEXTURE0)
+			self.__bind_texture()
+			GL.glDrawElements(GL.GL_TRIANGLES, self._count, GL.GL_UNSIGNED_INT, None)
+			# sharper tiles over the overview
+			if self._tile_source is not None and not self._mip:
+				self.__draw_tiles()
+			self.glDisable(GL.GL_BLEND)
+		self._vao.release()
 
-		self.glEnable(GL.GL_BLEND)
+		if self._overlay:
+			if query is not None:
+				query.end()
+			self._stats_cpu = (perf_counter() - start) * 1000.0
+			self.__draw_overlay()
+		if profile.enabled:
+			profile.mark("first frame")
+
+	def __bind_texture(self):
+		# the shown layer is bound, the shown mip is its base level
+		texture, target = self._texture, GL_TEXTURE_2D
+		if isinstance(texture, TLayeredTexture):
+			texture = texture.textures[min(self._layer, len(texture.textures) - 1)]
+			if self._cube:
+				target = GL_TEXTURE_CUBE_MAP
+		texture.bind(2 if target == GL_TEXTURE_CUBE_MAP else 0)
+		GL.glTexParameteri(target, GL.GL_TEXTURE_MAG_FILTER, self._mag_filter)
+		GL.glTexParameteri(target, GL.GL_TEXTURE_BASE_LEVEL, self._mip)
+		if target == GL_TEXTURE_CUBE_MAP:
+			self.glActiveTexture(GL.GL_TEXTURE0)
+
+	def __update_uniforms(self):
+		self._resources.uniforms = self
+		self._program_bg.bind()
+		self._program_bg.setUniformValue(self._location[2], self._u_colors[0])
+		self._program_bg.setUniformValue(self._location[3], self._u_colors[1])
+		self._program_bg.setUniformValue(self._location[4], self._height)
 		self._program.bind()
-		self._program.setAttributeBuffer(1, GL.GL_FLOAT, 3 * SZ_FLOAT, 2, 5 * SZ_FLOAT)
-		self._program.enableAttributeArray(1)
-		self._program.setUniformValue(self._location[0], *self._scale)
+		self._program.setUniformValue(self._location[0], *self._scale, *self._pan)
 		self._program.setUniformValue(self._location[1], self._u_channels)
-		self._texture.bind()
-		self.glDrawElements(GL.GL_TRIANGLES, len(self._indices), GL.GL_UNSIGNED_INT, self._indices.tobytes())
-		self.glDisable(GL.GL_BLEND)
+		self._program.setUniformValue(self._location[5], 0.0, 0.0, 1.0, 1.0)
+		self._program.setUniformValue(self._location[6], self._source[0])
+		self._program.setUniformValue(self._location[7], self._source[1])
+		self._program.setUniformValue(self._location[8], self._flip)
+		self._program.setUniformValue(self._location[9], 1)
+		self._program.setUniformValue(self._location[10], self._source_b[0])
+		self._program.setUniformValue(self._location[11], self._source_b[1])
+		self._program.setUniformValue(self._location[12], self._flip_b)
+		mode, gain = COMPARE_SHADER[self._compare if self._texture_b is not None else COMPARE_OFF]
+		if self._compare == COMPARE_FLICKER and self._flicker_b:
+			mode = 2.0
+		self._program.setUniformValue(self._location[13], mode, self._split, gain, 0.0)
+		self._program.setUniformValue(
+			self._location[14], *tone_values(self._exposure, self._gamma, self._tonemap, self._linear))
+		layout = 0.0 if not self._cube else 2.0 if self._face == FACE_CROSS else 1.0
+		self._program.setUniformValue(self._location[15], layout, float(self._face), 0.0, 0.0)
+		self._program.setUniformValue(self._location[16], 2)
+		self._dirty = False
 
-	@staticmethod
-	def __create_shader(type_: QOpenGLShader.ShaderType, source):
-		shader = QOpenGLShader(type_)
-		r = shader.compileSourceCode(source)
-		if not r:
-			print(shader.log())
-		return shader
+	def __begin_query(self):
+		# reads the query of the previous frame, then reuses it
+		if not self._queries:
+			return None
+		self._query_frame ^= 1
+		query = self._queries[self._query_frame]
+		if self._query_count >= 2 and query.isResultAvailable():
+			self._stats_gpu = query.waitForResult() / 1000000.0
+		self._query_count += 1
+		query.begin()
+		return query
+
+	def __draw_overlay(self):
+		# QPainter changes the gl state, restore what initializeGL set
+		painter = QPainter(self)
+		painter.setPen(Qt.white)
+		text = "cpu {:.2f} ms | gpu {} | upload {:.1f} ms | {}".format(
+			self._stats_cpu,
+			"{:.2f} ms".format(self._stats_gpu) if self._queries else "n/a",
+			self._stats_upload,
+			program_cache)
+		painter.fillRect(0, 0, painter.fontMetrics().width(text) + 8, painter.fontMetrics().height() + 4, QColor(0, 0, 0, 160))
+		painter.drawText(4, painter.fontMetrics().ascent() + 2, text)
+		painter.end()
+		self.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+
+	def set_overlay(self, enabled):
+		self._overlay = enabled
+		self.update()
+
+	def overlay(self):
+		return self._overlay
+
+	def __visible_rect(self):
+		# part of the image inside the viewport, normalized
+		sx, sy = self._scale
+		ox, oy = self._pan
+		u0, u1 = max(0.0, (sx - 1.0 - ox) / (2.0 * sx)), min(1.0, (sx + 1.0 - ox) / (2.0 * sx))
+		v0, v1 = max(0.0, (sy - 1.0 + oy) / (2.0 * sy)), min(1.0, (sy + 1.0 + oy) / (2.0 * sy))
+		return u0, v0, u1, v1
+
+	def __draw_tiles(self):
+		source = self._tile_source
+		level = source.level(self._scale[0] * self.width(), self._texture.width())
+		wanted = []
+		if level is not None:
+			w, h = source.size
+			for tx, ty in source.visible(level, *self.__visible_rect()):
+				key = (self._tile_key, level, tx, ty)
+				cached = self._tiles.get(key)
+				if cached is None:
+					wanted.append(key)
+					continue
+				x0, y0, x1, y1 = source.rect(level, tx, ty)
+				self._program.setUniformValue(self._location[5], x0 / w, y0 / h, (x1 - x0) / w, (y1 - y0) / h)
+				# tiles are always stored top to bottom
+				self._program.setUniformValue(self._location[8], 0.0)
+				cached[0].bind()
+				GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, self._mag_filter)
+				GL.glDrawElements(GL.GL_TRIANGLES, self._count, GL.GL_UNSIGNED_INT, None)
+			# back to the whole image for the next frame
+			self._program.setUniformValue(self._location[5], 0.0, 0.0, 1.0, 1.0)
+			self._program.setUniformValue(self._location[8], self._flip)
+		# page in the missing tiles, queued ones that went out of view are dropped
+		self._tiles_wanted = frozenset(wanted)
+		for key in wanted:
+			if key not in self._tiles_inflight:
+				self._tiles_inflight.add(key)
+				task = TTileTask(source, key, self.__is_tile_wanted)
+				task.signals.decoded.connect(self.__slot_tile)
+				self._pool.start(task)
+
+	def __is_tile_wanted(self, key):
+		# called from the pool threads
+		return key in self._tiles_wanted
+
+	def __slot_tile(self, key, image):
+		self._tiles_inflight.discard(key)
+		if image is not None and key[0] == self._tile_key:
+			self._tiles_pending.append((key, image))
+			self.update()
+
+	def __upload_tiles(self):
+		for key, image in self._tiles_pending:
+			if key[0] == self._tile_key and key not in self._tiles:
+				texture = create_texture(image, self._pbo)
+				self._tiles.put(key, texture, None, image.nbytes * 4 // 3)
+		self._tiles_pending = []
 
 	def __update_scale(self, width, height):
 		# calc texture scale
+		self._dirty = True
 
 		if self._texture_size[0] < width and self._texture_size[1] < height:
-			self._scale = (
+			self._fit = (
 				self._texture_size[0] / width,
 				self._texture_size[1] / height
 			)
@@ -235,7 +980,121 @@ class TGLViewport(QOpenGLWidget, QOpenGLFunctions):
 			if th > height:
 				th = height
 				tw = th * self._texture_size[0] / self._texture_size[1]
-			self._scale = (tw / width, th / height)
+			self._fit = (tw / width, th / height)
+		self._scale = (self._fit[0] * self._zoom, self._fit[1] * self._zoom)
+		# texels per pixel below one is magnification
+		texels = self._texture_size[0] / max(1.0, self._scale[0] * width)
+		self._mag_filter = GL_NEAREST if texels < 1.0 else GL_LINEAR
+
+	def __set_zoom(self, zoom, x=None, y=None):
+		# zoom keeping the image point under widget position x, y in place
+		w, h = max(1, self.width()), max(1, self.height())
+		fit_width = self._fit[0] * w
+		zoom = max(ZOOM_MIN_WIDTH / max(1.0, fit_width), min(zoom, self._texture_size[0] * ZOOM_MAX_TEXEL / fit_width))
+		if x is None:
+			x, y = w * 0.5, h * 0.5
+		cx, cy = 2.0 * x / w - 1.0, 1.0 - 2.0 * y / h
+		k = zoom / self._zoom
+		self._pan = (cx - (cx - self._pan[0]) * k, cy - (cy - self._pan[1]) * k)
+		self._zoom = zoom
+		self.__update_scale(w, h)
+		self.update()
+
+	def reset_view(self):
+		# fit to window
+		self._zoom = 1.0
+		self._pan = (0.0, 0.0)
+		self.__update_scale(self.width(), self.height())
+		self.update()
+
+	def actual_size(self):
+		# one texel per pixel around the centre of the window
+		self.__set_zoom(self._texture_size[0] / max(1.0, self._fit[0] * self.width()))
+
+	# @override
+	def wheelEvent(self, event):
+		steps = event.angleDelta().y() / 120.0
+		if steps:
+			pos = event.pos()
+			self.__set_zoom(self._zoom * ZOOM_STEP ** steps, pos.x(), pos.y())
+
+	# @override
+	def mousePressEvent(self, event):
+		if event.button() == Qt.LeftButton:
+			self._drag = event.pos()
+			self.setCursor(Qt.ClosedHandCursor)
+		super(TGLViewport, self).mousePressEvent(event)
+
+	# @override
+	def mouseReleaseEvent(self, event):
+		if event.button() == Qt.LeftButton and self._drag is not None:
+			self._drag = None
+			self.unsetCursor()
+		super(TGLViewport, self).mouseReleaseEvent(event)
+
+	# @override
+	def mouseDoubleClickEvent(self, event):
+		self.reset_view()
+
+	def __image_at(self, x, y):
+		# widget position to normalized image position, the inverse of the vertex shader
+		sx, sy = self._scale
+		ox, oy = self._pan
+		u = ((2.0 * x / max(1, self.width()) - 1.0 - ox) / sx + 1.0) * 0.5
+		v = ((2.0 * y / max(1, self.height()) - 1.0 + oy) / sy + 1.0) * 0.5
+		return u, v
+
+	def __texel_at(self, x, y):
+		u, v = self.__image_at(x, y)
+		if not (0.0 <= u < 1.0 and 0.0 <= v < 1.0):
+			return None
+		w, h = self._texels.size if self._texels is not None else self._texture_size
+		return int(u * w), int(v * h)
+
+	# @override
+	def mouseMoveEvent(self, event):
+		super(TGLViewport, self).mouseMoveEvent(event)
+		pos = event.pos()
+		if self._drag is not None:
+			# pan, only the offset uniform changes
+			dx, dy = pos.x() - self._drag.x(), pos.y() - self._drag.y()
+			self._drag = pos
+			self._pan = (
+				self._pan[0] + 2.0 * dx / max(1, self.width()),
+				self._pan[1] - 2.0 * dy / max(1, self.height()))
+			self._dirty = True
+			self.update()
+		elif self._compare == COMPARE_SPLIT and self._texture_b is not None:
+			# the split follows the cursor
+			self._split = self.__image_at(pos.x(), pos.y())[0]
+			self._dirty = True
+			self.update()
+		texel = self.__texel_at(pos.x(), pos.y())
+		if texel == self._texel:
+			return
+		self._texel = texel
+		if texel is None:
+			self.pixelChanged.emit("")
+		elif self._texels is None:
+			self.pixelChanged.emit(f"{texel[0]}, {texel[1]} ")
+		else:
+			try:
+				values = self._texels.read(*texel)
+			except struct.error:
+				# the file was cut short since, a reload follows
+				self.pixelChanged.emit(f"{texel[0]}, {texel[1]} ")
+				return
+			if self._texels.float:
+				text = " ".join(f"{n} {values[i]:.6g}" for n, i in self._texels.channels)
+			else:
+				text = " ".join(f"{n} {values[i]}" for n, i in self._texels.channels)
+			self.pixelChanged.emit(f"{texel[0]}, {texel[1]}: {text} ")
+
+	# @override
+	def leaveEvent(self, event):
+		super(TGLViewport, self).leaveEvent(event)
+		self._texel = None
+		self.pixelChanged.emit("")
 
 	def get_gl_info(self):
 		self.makeCurrent()
@@ -252,82 +1111,440 @@ class TGLViewport(QOpenGLWidget, QOpenGLFunctions):
 		)
 		return info
 
-	def set_channels(self, r, g, b, a):
-		r, g, b, a = float(r), float(g), float(b), float(a)
-		s = r + g + b
-		if s > 1.1:
-			self._u_channels = QMatrix4x4(
-				r, 0, 0, 0,
-				0, g, 0, 0,
-				0, 0, b, 0,
-				0, 0, 0, a
-			)
-		elif s < 0.1:
-			self._u_channels = QMatrix4x4(
-				0, 0, 0, 0,
-				0, 0, 0, 0,
-				0, 0, 0, 0,
-				a, a, a, 0
-			)
-		elif a:
-			self._u_channels = QMatrix4x4(
-				r, 0, 0, 0,
-				0, g, 0, 0,
-				0, 0, b, 0,
-				0, 0, 0, a
-			)
-		else:
-			self._u_channels = QMatrix4x4(
-				r, r, r, 0,
-				g, g, g, 0,
-				b, b, b, 0,
-				0, 0, 0, a
+	def memory_usage(self, shared=True):
+		# TMemoryUsage for the status bar and for debugging, the caches every
+		# window shares and what the viewport holds besides them, or that
+		# alone without shared; the shown image counts as cpu until its
+		# pixels are released, the compared one until its upload
+		pending = self._pending_b.nbytes if self._pending_b is not None else 0
+		items = {
+			"cpu_shown": self._images.held(self),
+			"cpu_pending": pending,
+			"gpu_tiles": self._tiles.used,
+			"gpu_tile_count": len(self._tiles),
+			"gpu_uncached": self._texture_nbytes + self._texture_b_nbytes,
+		}
+		usage = TMemoryUsage(
+			pending, self._tiles.used + self._texture_nbytes + self._texture_b_nbytes, 0, self._tiles.budget, items)
+		if shared:
+			usage.add(self._resources.memory_usage())
+		return usage
 
-			)
+	def set_memory_budget(self, cpu_budget, gpu_budget):
+		# bytes of decoded images and of cached textures, older ones are
+		# dropped at once when the budgets shrink
+		self._images.budget = cpu_budget
+		self._images.evict()
+		self.set_vram_budget(gpu_budget)
+
+	def __memory_changed(self):
+		self.memoryChanged.emit(str(self.memory_usage()))
+
+	def set_channels(self, r, g, b, a):
+		self._u_channels = channels_matrix(r, g, b, a)
 		# redraw
+		self._dirty = True
+		self.update()
+
+	def set_tone(self, exposure, gamma, tonemap):
+		# only the Tone uniform changes, the pixels are not touched
+		self._exposure = exposure
+		self._gamma = gamma
+		self._tonemap = tonemap
+		self._dirty = True
 		self.update()
 
 	def set_texture(self, filename):
-		# load image
 		p = Path(filename)
 		suffix = p.suffix[1:].upper()
-		try:
-			if p.is_file() and suffix in self._supported_images:
-				pim = Image.open(filename)
-				img = ImageQt(pim)
-				self.info = f"{pim.format} - {pim.size} - {pim.mode} "
-			else:
-				ico = QFileIconProvider().icon(QFileInfo(filename))
-				pix = ico.pixmap(256, 256)
-				img = pix.toImage()
-				self.info = "not an image "
-		except UnidentifiedImageError as e:
-			print("UnidentifiedImageError:\n", e, flush=True)
+		if p.is_file() and suffix in self._supported_images:
+			key = texture_key(filename)
+			self._wanted = key
+			data = self._images.get(key)
+			cached = self._textures.get(key)
+			if data is None and cached is not None and not cached[1].tiled:
+				data = cached[1]
+			if data is not None:
+				# no decode, and no upload if the texture is still on the gpu
+				self.unsetCursor()
+				self.__set_pending(data)
+				return
+			if cached is not None:
+				# overview at once, tiles need the source decoded again
+				self.__set_pending(cached[1])
+			# decode in the thread pool, keep the current texture until done,
+			# a new file shows a preview first, a reloaded one stays as it was
+			self.__set_info("loading... ")
+			self.setCursor(Qt.BusyCursor)
+			if key not in self._inflight:
+				self.__decode(filename, key, 1, cached is None and self._reload is None)
+		else:
+			# icons are pixmaps, they must stay on the gui thread
+			self._wanted = None
+			ico = QFileIconProvider().icon(QFileInfo(filename))
+			pix = ico.pixmap(256, 256)
+			self.unsetCursor()
+			self.__set_pending(TImageData(filename, pix.toImage(), "not an image "))
+
+	def prefetch(self, filenames):
+		# decode files in the background so set_texture finds them ready
+		# earlier prefetch requests that did not start are dropped
+		files = []
+		for filename in filenames:
+			try:
+				files.append((filename, texture_key(filename)))
+			except OSError:
+				pass
+		self._prefetch = frozenset(key for _, key in files)
+		for filename, key in files:
+			if key in self._textures or key in self._images or key in self._inflight:
+				continue
+			self.__decode(filename, key, 0)
+
+	def __decode(self, filename, key, priority, progressive=False):
+		# every viewport gets the result, one decode serves all that want it
+		self._inflight.add(key)
+		task = TDecodeTask(
+			filename, key, self._resources.is_wanted, self._max_texture_size, self._compressed_formats,
+			progressive, self._resources.thumbnails() if progressive else None)
+		task.signals.decoded.connect(self._resources.decoded)
+		task.signals.previewed.connect(self._resources.previewed)
+		self._pool.start(task, priority)
+
+	def wants(self, key):
+		# called from the pool threads
+		return key == self._wanted or key in self._prefetch or key == self._wanted_b
+
+	def __slot_decoded(self, key, data):
+		self._inflight.discard(key)
+		if data is None:
+			return
+		if data.loaded and (key in self._prefetch or data.tiled) and not data.mapped:
+			# tiled sources are kept so they survive a gpu cache hit
+			self._images.put(key, data)
+			self.__memory_changed()
+		if key == self._wanted_b:
+			self.__set_pending_b(data)
+		if key != self._wanted:
+			return
+		self.unsetCursor()
+		if not data.loaded:
+			self.__set_info(data.info)
 			return
+		self.__set_pending(data)
 
-		self._texture_size = img.width(), img.height()
+	def __slot_previewed(self, key, data):
+		# only while the full decode of the shown file is still running,
+		# uploaded like an icon, outside of the caches
+		if key != self._wanted or key not in self._inflight:
+			return
+		self.__set_pending(data)
+
+	def __set_pending(self, data):
+		self._pending = data
+		self._source = source_uniforms(data.source)
+		self._flip = 1.0 if data.flip else 0.0
+		self._linear = data.linear
+		self._tile_source = data.tiles
+		self._tile_key = data.key if data.tiles is not None else None
+		self._tiles_wanted = frozenset()
+		# the selected surface carries over where the new image has it
+		self._image_size = data.size
+		self._cube = data.cube
+		self._mip = min(self._mip, data.levels - 1)
+		self._layer = min(self._layer, data.layers - 1)
+		# the inspector reads mapped files without holding them open
+		self._surfaces = tuple(s.detached() if isinstance(s, TPixels) else None for s in data.surfaces)
+		texels = data.texels
+		self._base_texels = texels.detached() if texels is not None else None
+		# all of it until the upload, a mapped file is mapped again for free
+		self.__update_texels()
+		self.__hold(data.key, 0 if data.mapped else data.nbytes)
+		self.__update_layout()
+		self.__set_info(data.info)
+		self.imageChanged.emit(data)
+		self.__compare_metrics()
+		# upload happens in paintGL where the context is current
+		self.update()
+
+	def set_surface(self, mip, layer, face):
+		# mip level, array layer and cube face or FACE_CROSS to show
+		self._mip, self._layer, self._face = mip, layer, face
+		self.__update_texels()
+		self.__hold(*self._held)
+		self.__update_layout()
+		self.update()
+
+	def surface(self):
+		return self._mip, self._layer, self._face
+
+	def __update_layout(self):
+		# the cross is four faces wide and three high
+		w, h = self._image_size
+		size = (w * 4, h * 3) if self._cube and self._face == FACE_CROSS else (w, h)
+		if size != self._texture_size:
+			self._zoom = 1.0
+			self._pan = (0.0, 0.0)
+		self._texture_size = size
 		self.__update_scale(self.width(), self.height())
 
-		# create texture
-		self.makeCurrent()
-		self._texture = QOpenGLTexture(QOpenGLTexture.Target2D)
-		self._texture.create()
-		self._texture.bind()
-		self._texture.setMinMagFilters(QOpenGLTexture.LinearMipMapLinear, QOpenGLTexture.Linear)
-		self._texture.setWrapMode(QOpenGLTexture.DirectionS, QOpenGLTexture.Repeat)
-		self._texture.setWrapMode(QOpenGLTexture.DirectionT, QOpenGLTexture.Repeat)
-		self._texture.setData(img)
-		self._texture.release()
+	def __update_texels(self):
+		# inspector source of the shown surface and level, none for the cross
+		# or for levels made on the gpu
+		self._texel = None
+		pixels = self._base_texels
+		if self._surfaces:
+			index = self._layer * 6 + min(self._face, 5) if self._cube else self._layer
+			pixels = self._surfaces[index] if index < len(self._surfaces) else None
+			if not isinstance(pixels, TPixels) or (self._cube and self._face == FACE_CROSS):
+				pixels = None
+		if pixels is not None and self._mip:
+			pixels = pixels.mips[self._mip - 1] if self._mip <= len(pixels.mips) else None
+		self._texels_source = pixels
+		self._texels_copy = None
+		if pixels is not None and pixels.data is None:
+			# mapped, read once in the pool instead of the file per mouse move
+			self._texels = None
+			task = TTexelsTask(pixels, self.__is_texels_wanted)
+			task.signals.decoded.connect(self.__slot_texels)
+			self._pool.start(task)
+		else:
+			self._texels = TTexelReader(pixels) if pixels is not None else None
 
-		# redraw
+	def __is_texels_wanted(self, pixels):
+		# called from the pool threads
+		return pixels is self._texels_source
+
+	def __slot_texels(self, source, pixels):
+		if pixels is None or source is not self._texels_source:
+			return
+		self._texel = None
+		self._texels_copy = pixels
+		self._texels = TTexelReader(pixels)
+		self.__hold(*self._held)
+
+	def __hold(self, key, nbytes):
+		# what the shown image keeps outside of the cache, with the copy the
+		# inspector reads
+		self._held = (key, nbytes)
+		if self._texels_copy is not None:
+			nbytes += self._texels_copy.nbytes
+		self._images.hold(self, key, nbytes)
+
+	def __set_info(self, info):
+		self.info = info
+		self.infoChanged.emit(info)
+
+	def __upload(self, data):
+		start = perf_counter()
+		cached = self._textures.get(data.key) if data.key is not None else None
+		nbytes = None
+		# the file changed on disk, the old version goes away
+		old = self.__take_reloaded(data)
+		if cached is not None:
+			texture = cached[0]
+		elif old is not None and data.storage is not None and old[1].storage == data.storage:
+			# same size and format, rewrite the storage of the old texture
+			texture = old[0]
+			update_texture(texture, data.pixels, self._pbo)
+			nbytes = old[2]
+			old = None
+		else:
+			# cached textures must outlive this viewport's context
+			shared = data.key is not None and self._resources.begin_upload()
+			if data.surfaces:
+				texture = create_layered_texture(data.surfaces, data.cube, self._pbo)
+			elif data.compressed is not None:
+				texture = create_compressed_texture(data.compressed)
+			elif data.pixels is not None:
+				texture = create_texture(data.pixels, self._pbo)
+			else:
+				texture = create_texture(data.image)
+			if shared:
+				self._resources.end_upload(self)
+		if nbytes is None:
+			nbytes = texture_nbytes(data, texture)
+		if cached is None:
+			self._stats_upload = (perf_counter() - start) * 1000.0
+
+		# release the previous texture unless the cache owns it
+		if self._texture_owned and self._texture is not texture:
+			self._texture.destroy()
+		self._texture = texture
+		self._texture_owned = data.key is None
+		self._texture_nbytes = nbytes if self._texture_owned else 0
+		# pinned before the put below can evict anything
+		if data.key is not None:
+			self._textures.pin(data.key)
+		if self._shown is not None:
+			self._textures.unpin(self._shown)
+		self._shown = data.key
+		if data.key is not None and cached is None:
+			# the gpu copy is enough from now on
+			self._textures.put(data.key, texture, data.header(), nbytes)
+		if data.key is not None and not data.tiled:
+			# so is it for a prefetched neighbour, tiled sources stay for the tiles
+			self._images.discard(data.key)
+		# what stays is the tile source or the inspector's decoded pixels
+		if data.tiled:
+			held = data.nbytes
+		else:
+			texels = self._base_texels
+			held = texels.nbytes if texels is not None and texels.data is not None else 0
+		self.__hold(data.key, held)
+		if old is not None:
+			old[0].destroy()
+
+	def set_compare(self, filename):
+		# second image drawn against the current one, None ends the comparison
+		self._metrics_key = None
+		if filename is None:
+			self._wanted_b = None
+			self._pending_b = None
+			if self._texture_b is not None:
+				self.makeCurrent()
+				self._texture_b.destroy()
+				self._texture_b = None
+				self._texture_b_nbytes = 0
+				self.doneCurrent()
+				self.__memory_changed()
+			self.compareChanged.emit("")
+			self._dirty = True
+			self.update()
+			return
+		key = texture_key(filename)
+		self._wanted_b = key
+		data = self._images.get(key)
+		if data is not None:
+			self.__set_pending_b(data)
+			return
+		self.compareChanged.emit("loading... ")
+		if key not in self._inflight:
+			self.__decode(filename, key, 1)
+
+	def set_compare_mode(self, mode):
+		self._compare = mode
+		self._flicker_b = False
+		if mode == COMPARE_FLICKER:
+			self._flicker.start()
+		else:
+			self._flicker.stop()
+		self._dirty = True
+		self.update()
+
+	def compare_mode(self):
+		return self._compare
+
+	def __slot_flicker(self):
+		self._flicker_b = not self._flicker_b
+		self._dirty = True
+		self.update()
+
+	def __set_pending_b(self, data):
+		if not data.loaded:
+			self.compareChanged.emit(data.info)
+			return
+		# the overview of a tiled image stands for all of it
+		self._pending_b = data
+		self._source_b = source_uniforms(data.source)
+		self._flip_b = 1.0 if data.flip else 0.0
+		self._dirty = True
+		self.__compare_metrics()
 		self.update()
 
+	def __upload_b(self, data):
+		if self._texture_b is not None:
+			self._texture_b.destroy()
+		if data.compressed is not None:
+			self._texture_b = create_compressed_texture(data.compressed)
+		elif data.pixels is not None:
+			self._texture_b = create_texture(data.pixels, self._pbo)
+		else:
+			self._texture_b = create_texture(data.image)
+		self._texture_b_nbytes = texture_nbytes(data, self._texture_b)
+
+	def __compare_metrics(self):
+		# psnr and max error of the shown pair, both files are decoded again
+		# at full resolution in the pool and compared with numpy
+		if self._wanted is None or self._wanted_b is None:
+			return
+		key = (self._wanted, self._wanted_b)
+		if key == self._metrics_key:
+			return
+		self._metrics_key = key
+		self.compareChanged.emit("comparing... ")
+		task = TCompareTask(self._wanted[0], self._wanted_b[0], key, self.__is_metrics_wanted)
+		task.signals.compared.connect(self.__slot_compared)
+		# behind the decodes
+		self._pool.start(task, -1)
+
+	def __is_metrics_wanted(self, key):
+		# called from the pool threads
+		return key == self._metrics_key
+
+	def __slot_compared(self, key, result):
+		if key == self._metrics_key and result is not None:
+			self.compareChanged.emit(str(result))
+
+	def __take_reloaded(self, data):
+		# cache entry of the replaced file version, tiles of it are dropped
+		if data.key is None:
+			return None
+		old_key, self._reload = self._reload, None
+		if old_key is None or old_key == data.key or old_key[0] != data.key[0]:
+			return None
+		self._images.discard(old_key)
+		if self._textures.pins(old_key) > (old_key == self._shown):
+			# still on screen in another viewport, evicted once it is not
+			self._tiles.clear()
+			return None
+		self._tiles.clear()
+		old = self._textures.take(old_key)
+		if old is not None and old[0] is self._texture:
+			# replaced below, must not be destroyed twice
+			self._texture_owned = False
+		return old
+
+	def reload(self, filename):
+		# shown file changed on disk, the old texture stays up until the
+		# new version is decoded
+		if self._wanted is None or self._wanted[0] != str(Path(filename).resolve()):
+			return
+		try:
+			if texture_key(filename) == self._wanted:
+				return
+		except OSError:
+			return
+		self._reload = self._wanted
+		self.set_texture(filename)
+
+	def forget(self, filename):
+		# drops the cached versions of a file that changed on disk
+		path = str(Path(filename).resolve())
+		self._images.discard_file(path)
+		keys = [
+			key for key in self._textures.keys()
+			if key[0] == path and key != self._wanted and not self._textures.pins(key)]
+		if keys:
+			self.makeCurrent()
+			for key in keys:
+				self._textures.discard(key)
+			self.doneCurrent()
+
+	def set_vram_budget(self, budget):
+		self._textures.budget = budget
+		self.makeCurrent()
+		self._textures.evict()
+		self.doneCurrent()
+		self.__memory_changed()
+
 	def set_colors(self, checkerboard, color1, color2):
 		if checkerboard:
 			self._u_colors = self._colors_default
 		else:
 			self._u_colors = (color1, color2)
 
+		self._dirty = True
 		self.update()
 
 
@@ -346,19 +1563,43 @@ class TRightClickButton(QPushButton):
 
 
 class TViewerWindow(QMainWindow):
-	def __init__(self, parent=None):
+	def __init__(self, parent=None, vram_budget=VRAM_BUDGET, prefetch_budget=PREFETCH_BUDGET, resources=None):
 		super(TViewerWindow, self).__init__(parent)
 		self.__set_title("")
 		self.resize(600, 600)
 
 		self._filename = ""
+		# sibling images of the current file
+		self._files = []
+		self._index = -1
+		self._step = 1
+
+		# the shown file and its prefetched neighbours are reloaded on change,
+		# bursts of writes are collected until RELOAD_DELAY passes quietly
+		self._watcher = QFileSystemWatcher(self)
+		self._watcher.fileChanged.connect(self.__slot_file_changed)
+		self._changed = set()
+		self._reload_timer = QTimer(self)
+		self._reload_timer.setSingleShot(True)
+		self._reload_timer.setInterval(RELOAD_DELAY)
+		self._reload_timer.timeout.connect(self.__slot_reload)
 
 		# file info
 		self._info = QLabel(self)
+		# texel under the cursor
+		self._pixel = QLabel(self)
+		# a/b metrics
+		self._compare_info = QLabel(self)
+		# cpu and gpu memory of the viewport
+		self._memory = QLabel(self)
+		self._memory.setStatusTip("Decoded images and textures held, against their budgets")
 		# status bar
 		self.status = QStatusBar(self)
 		self.status.setSizeGripEnabled(True)
-		self.status.insertPermanentWidget(0, self._info)
+		self.status.insertPermanentWidget(0, self._compare_info)
+		self.status.insertPermanentWidget(1, self._pixel)
+		self.status.insertPermanentWidget(2, self._info)
+		self.status.insertPermanentWidget(3, self._memory)
 		self.setStatusBar(self.status)
 		# central widget
 		window = QWidget(self)
@@ -417,31 +1658,214 @@ class TViewerWindow(QMainWindow):
 		button.setStatusTip("Pick solid background color")
 		button.clicked.connect(self.__slot_solid_color)
 		layout_2.addWidget(button)
+		layout_2.addSpacing(32)
+		layout_2.addWidget(QLabel(" Folder: "))
+		button = QPushButton("<")
+		button.setFixedWidth(24)
+		button.setStatusTip("Previous image in folder (Left, PgUp)")
+		button.clicked.connect(self.__slot_previous)
+		layout_2.addWidget(button)
+		button = QPushButton(">")
+		button.setFixedWidth(24)
+		button.setStatusTip("Next image in folder (Right, PgDown)")
+		button.clicked.connect(self.__slot_next)
+		layout_2.addWidget(button)
+		button = QPushButton("Grid")
+		button.setStatusTip("Show folder thumbnails (F4)")
+		button.clicked.connect(self.__slot_grid)
+		layout_2.addWidget(button)
+		button = QPushButton("Stats")
+		button.setStatusTip("Show channel statistics (F5)")
+		button.clicked.connect(self.__slot_stats)
+		layout_2.addWidget(button)
+		layout_2.addSpacing(32)
+		layout_2.addWidget(QLabel(" Compare: "))
+		button = QPushButton("B...")
+		button.setStatusTip("Pick an image to compare with (Right click to clear)")
+		button.clicked.connect(self.__slot_compare_open)
+		button.setContextMenuPolicy(Qt.CustomContextMenu)
+		button.customContextMenuRequested.connect(self.__slot_compare_clear)
+		layout_2.addWidget(button)
+		self._compare_mode = QComboBox(self)
+		self._compare_mode.addItems(COMPARE_NAMES)
+		self._compare_mode.setStatusTip("Comparison mode (C), the split follows the cursor")
+		self._compare_mode.currentIndexChanged.connect(self.__slot_compare_mode)
+		layout_2.addWidget(self._compare_mode)
+		layout_2.addSpacing(32)
+		layout_2.addWidget(QLabel(" Exposure: "))
+		self._exposure = QDoubleSpinBox(self)
+		self._exposure.setRange(-20.0, 20.0)
+		self._exposure.setSingleStep(0.25)
+		self._exposure.setSuffix(" EV")
+		self._exposure.setStatusTip("Exposure in stops ([ and ])")
+		self._exposure.valueChanged.connect(self.__slot_tone)
+		layout_2.addWidget(self._exposure)
+		self._gamma = QDoubleSpinBox(self)
+		self._gamma.setRange(0.2, 5.0)
+		self._gamma.setSingleStep(0.1)
+		self._gamma.setValue(DEFAULT_GAMMA)
+		self._gamma.setPrefix("gamma ")
+		self._gamma.setStatusTip("Display gamma of linear images")
+		self._gamma.valueChanged.connect(self.__slot_tone)
+		layout_2.addWidget(self._gamma)
+		self._tonemap = QComboBox(self)
+		self._tonemap.addItems(TONEMAP_NAMES)
+		self._tonemap.setStatusTip("Tonemap operator")
+		self._tonemap.currentIndexChanged.connect(self.__slot_tone)
+		layout_2.addWidget(self._tonemap)
+		layout_2.addSpacing(32)
+		layout_2.addWidget(QLabel(" Surface: "))
+		self._mip = QSpinBox(self)
+		self._mip.setPrefix("mip ")
+		self._mip.setStatusTip("Mip level (, and .)")
+		self._mip.valueChanged.connect(self.__slot_surface)
+		layout_2.addWidget(self._mip)
+		self._layer = QSpinBox(self)
+		self._layer.setPrefix("layer ")
+		self._layer.setStatusTip("Array layer")
+		self._layer.valueChanged.connect(self.__slot_surface)
+		layout_2.addWidget(self._layer)
+		self._face = QComboBox(self)
+		self._face.addItems(CUBE_FACES + ("Cross",))
+		self._face.setStatusTip("Cube face, or all of them unfolded")
+		self._face.currentIndexChanged.connect(self.__slot_surface)
+		layout_2.addWidget(self._face)
+
+		for key in (Qt.Key_Left, Qt.Key_PageUp, Qt.Key_Backspace):
+			QShortcut(QKeySequence(key), self, self.__slot_previous)
+		for key in (Qt.Key_Right, Qt.Key_PageDown, Qt.Key_Space):
+			QShortcut(QKeySequence(key), self, self.__slot_next)
+		QShortcut(QKeySequence(Qt.Key_Home), self, self.__slot_first)
+		QShortcut(QKeySequence(Qt.Key_End), self, self.__slot_last)
+		QShortcut(QKeySequence(Qt.Key_F3), self, self.__slot_overlay)
+		QShortcut(QKeySequence(Qt.Key_F4), self, self.__slot_grid)
+		QShortcut(QKeySequence(Qt.Key_F5), self, self.__slot_stats)
+		QShortcut(QKeySequence(Qt.Key_0), self, self.__slot_fit)
+		QShortcut(QKeySequence(Qt.Key_1), self, self.__slot_actual_size)
+		QShortcut(QKeySequence(Qt.Key_C), self, self.__slot_compare_next)
+		QShortcut(QKeySequence(Qt.Key_BracketLeft), self, lambda: self._exposure.stepBy(-2))
+		QShortcut(QKeySequence(Qt.Key_BracketRight), self, lambda: self._exposure.stepBy(2))
+		QShortcut(QKeySequence(Qt.Key_Comma), self, lambda: self._mip.stepBy(-1))
+		QShortcut(QKeySequence(Qt.Key_Period), self, lambda: self._mip.stepBy(1))
 
 		layout_2.addStretch()
 		layout.addLayout(layout_2)
 
 		# image viewer
-		view = TGLViewport(self)
+		view = TGLViewport(self, vram_budget, prefetch_budget, resources)
 		self._viewport = view
 		# view.doubleClicked.connect(self.__slot_action_open)
 		view.setContextMenuPolicy(Qt.DefaultContextMenu)
-		view.setStatusTip("Use context menu or double click to open")
+		view.setStatusTip("Wheel to zoom, drag to pan, double click or 0 to fit, 1 for actual size")
+		view.infoChanged.connect(self._info.setText)
+		view.pixelChanged.connect(self._pixel.setText)
+		view.compareChanged.connect(self._compare_info.setText)
+		view.memoryChanged.connect(self._memory.setText)
 		layout.addWidget(view)
 
 		layout.setStretch(1, 1)
 		layout.setSpacing(0)
 
+		# folder thumbnails, the grid and its cache are made when first shown
+		self._grid = None
+		self._dock = QDockWidget("Folder", self)
+		self.addDockWidget(Qt.LeftDockWidgetArea, self._dock)
+		self._dock.hide()
+
+		# channel statistics
+		self._stats = TStatsPanel(self)
+		view.imageChanged.connect(self._stats.set_image)
+		view.imageChanged.connect(self.__slot_image)
+		self._stats_dock = QDockWidget("Statistics", self)
+		self._stats_dock.setWidget(self._stats)
+		self.addDockWidget(Qt.RightDockWidgetArea, self._stats_dock)
+		self._stats_dock.hide()
+		self._stats_dock.visibilityChanged.connect(self._stats.set_active)
+
 	# @override
 	def contextMenuEvent(self, event):
 		if self.childAt(event.pos()) == self._viewport:
 			self._menu.popup_for_file(self._filename, event.globalPos())
 
+	def viewport(self):
+		return self._viewport
+
 	def view(self, filename):
 		self._filename = filename
 		self.__set_title(filename)
+		# returns at once, the status bar follows the viewport info
 		self._viewport.set_texture(filename)
-		self._info.setText(self._viewport.info)
+
+		path = Path(filename)
+		if not self._files or Path(self._files[0]).parent != path.parent:
+			self._files = folder_images(filename)
+			if self._grid is not None:
+				self._grid.set_files(self._files)
+		names = [Path(f).name for f in self._files]
+		self._index = names.index(path.name) if path.name in names else -1
+		if self._index >= 0 and self._grid is not None:
+			self._grid.select(self._files[self._index])
+		self.__prefetch()
+
+	def __prefetch(self):
+		# nearest neighbours first, the stepping direction first
+		files = []
+		if self._index >= 0:
+			for d in range(1, PREFETCH_NEIGHBOURS + 1):
+				for i in (self._index + d * self._step, self._index - d * self._step):
+					if 0 <= i < len(self._files):
+						files.append(self._files[i])
+			self._viewport.prefetch(files)
+		self.__watch([self._filename] + files)
+
+	def __watch(self, files):
+		files = set(f for f in files if os.path.isfile(f))
+		watched = set(self._watcher.files())
+		if watched - files:
+			self._watcher.removePaths(list(watched - files))
+		if files - watched:
+			self._watcher.addPaths(list(files - watched))
+
+	def __slot_file_changed(self, path):
+		# restarted by every write, fires once the file is quiet
+		self._changed.add(path)
+		self._reload_timer.start()
+
+	def __slot_reload(self):
+		changed, self._changed = self._changed, set()
+		for path in changed:
+			# saved by replacing the file, the watcher lost it
+			if os.path.isfile(path) and path not in self._watcher.files():
+				self._watcher.addPath(path)
+			if Path(path) == Path(self._filename):
+				self._viewport.reload(path)
+			else:
+				self._viewport.forget(path)
+		# changed neighbours are decoded again
+		self.__prefetch()
+
+	def __go(self, index):
+		if not self._files:
+			return
+		index = max(0, min(index, len(self._files) - 1))
+		if index != self._index:
+			self.view(self._files[index])
+
+	def __slot_previous(self):
+		self._step = -1
+		self.__go(self._index - 1 if self._index >= 0 else len(self._files) - 1)
+
+	def __slot_next(self):
+		self._step = 1
+		self.__go(self._index + 1)
+
+	def __slot_first(self):
+		self._step = 1
+		self.__go(0)
+
+	def __slot_last(self):
+		self._step = -1
+		self.__go(len(self._files) - 1)
 
 	def __set_title(self, title):
 		if title != "":
@@ -466,6 +1890,69 @@ class TViewerWindow(QMainWindow):
 		self._btn_a.setChecked(self.sender() == self._btn_a)
 		self.__slot_channels()
 
+	def __slot_grid(self):
+		if self._grid is None:
+			from thumbgrid import TThumbnailGrid
+			self._grid = TThumbnailGrid(self, cache_root=THUMBNAIL_CACHE)
+			self._grid.fileActivated.connect(self.view)
+			self._grid.set_files(self._files)
+			if self._index >= 0:
+				self._grid.select(self._files[self._index])
+			self._dock.setWidget(self._grid)
+		self._dock.setVisible(not self._dock.isVisible())
+
+	def __slot_fit(self):
+		self._viewport.reset_view()
+
+	def __slot_actual_size(self):
+		self._viewport.actual_size()
+
+	def __slot_stats(self):
+		self._stats_dock.setVisible(not self._stats_dock.isVisible())
+
+	def __slot_compare_open(self):
+		filename, _ = QFileDialog.getOpenFileName(
+			self, "Compare with", os.path.dirname(self._filename),
+			"Images ({})".format(" ".join("*." + s.lower() for s in SUPPORTED_IMAGES)))
+		if filename:
+			self._viewport.set_compare(filename)
+			if self._compare_mode.currentIndex() == COMPARE_OFF:
+				self._compare_mode.setCurrentIndex(COMPARE_SPLIT)
+
+	def __slot_compare_clear(self, pos):
+		self._viewport.set_compare(None)
+		self._compare_mode.setCurrentIndex(COMPARE_OFF)
+
+	def __slot_compare_mode(self, index):
+		self._viewport.set_compare_mode(index)
+
+	def __slot_compare_next(self):
+		self._compare_mode.setCurrentIndex((self._compare_mode.currentIndex() + 1) % len(COMPARE_NAMES))
+
+	def __slot_tone(self, _=None):
+		self._viewport.set_tone(self._exposure.value(), self._gamma.value(), self._tonemap.currentIndex())
+
+	def __slot_image(self, data):
+		# selectors follow the levels and layers of the shown image
+		mip, layer, face = self._viewport.surface()
+		for widget in (self._mip, self._layer, self._face):
+			widget.blockSignals(True)
+		self._mip.setMaximum(data.levels - 1)
+		self._mip.setValue(mip)
+		self._layer.setMaximum(data.layers - 1)
+		self._layer.setValue(layer)
+		self._layer.setEnabled(data.layers > 1)
+		self._face.setCurrentIndex(face)
+		self._face.setEnabled(data.cube)
+		for widget in (self._mip, self._layer, self._face):
+			widget.blockSignals(False)
+
+	def __slot_surface(self, _=None):
+		self._viewport.set_surface(self._mip.value(), self._layer.value(), self._face.currentIndex())
+
+	def __slot_overlay(self):
+		self._viewport.set_overlay(not self._viewport.overlay())
+
 	def __slot_checkerboard(self):
 		self._viewport.set_colors(True, None, None)
 
@@ -475,10 +1962,165 @@ class TViewerWindow(QMainWindow):
 			self._viewport.set_colors(False, color, color)
 
 
-if __name__ == '__main__':
-	# Create the Qt Application
-	app = QApplication(sys.argv)
-	# must be called before the OpenGLWidget or its parent window gets shown
+class TResidentServer(QObject):
+	# files sent by later launches, command and paths
+	filesReceived = Signal(str, list)
+
+	def __init__(self, parent=None):
+		super(TResidentServer, self).__init__(parent)
+		self._server = QtNetwork.QLocalServer(self)
+		self._server.newConnection.connect(self.__slot_connection)
+		self._buffers = {}
+
+	def listen(self):
+		# False when another viewer is already listening
+		name = server_name()
+		if self._server.listen(name):
+			return True
+		# a socket file left behind by a crashed viewer
+		if self._server.serverError() == QtNetwork.QAbstractSocket.AddressInUseError and not self.__alive(name):
+			QtNetwork.QLocalServer.removeServer(name)
+			return self._server.listen(name)
+		return False
+
+	@staticmethod
+	def __alive(name):
+		# an empty open message does nothing on the other side
+		return forward([])
+
+	def __slot_connection(self):
+		while self._server.hasPendingConnections():
+			connection = self._server.nextPendingConnection()
+			self._buffers[connection] = b""
+			connection.readyRead.connect(lambda c=connection: self.__read(c))
+			connection.disconnected.connect(lambda c=connection: self.__done(c))
+
+	def __read(self, connection):
+		self._buffers[connection] += bytes(connection.readAll())
+
+	def __done(self, connection):
+		self.__read(connection)
+		command, paths = parse_message(self._buffers.pop(connection, b""))
+		connection.deleteLater()
+		if command is not None and paths:
+			self.filesReceived.emit(command, paths)
+
+
+class TViewerApplication(QObject):
+	# windows of the process, the resident server opens files in them
+	def __init__(self, resident=False, vram_budget=VRAM_BUDGET, prefetch_budget=PREFETCH_BUDGET):
+		super(TViewerApplication, self).__init__()
+		self._windows = []
+		# caches and gl objects of every window, a window opened on a shown
+		# file neither decodes nor uploads it again
+		self._resources = TSharedResources(vram_budget, prefetch_budget)
+		# after the first window is up, QtNetwork is not needed to show it
+		self._server = None
+		QTimer.singleShot(0, self.__listen)
+		self._tray = None
+		if resident:
+			# no window keeps the process alive, the tray icon ends it
+			QApplication.setQuitOnLastWindowClosed(False)
+			if QSystemTrayIcon.isSystemTrayAvailable():
+				self._tray = QSystemTrayIcon(QIcon(join(dirname(realpath(__file__)), "app.ico")), self)
+				menu = QMenu()
+				menu.addAction("Quit", QApplication.quit)
+				self._tray.setContextMenu(menu)
+				self._tray.setToolTip("Texture Viewer")
+				self._tray.show()
+
+	def open_window(self, filename=None):
+		form = TViewerWindow(None, resources=self._resources)
+		form.setAttribute(Qt.WA_DeleteOnClose)
+		form.destroyed.connect(lambda _=None, f=form: self._windows.remove(f))
+		self._windows.append(form)
+		form.show()
+		if filename is not None:
+			form.view(filename)
+		return form
+
+	def memory_usage(self):
+		# debugging, TMemoryUsage of the process, the shared caches once
+		usage = self._resources.memory_usage()
+		for form in self._windows:
+			usage.add(form.viewport().memory_usage(shared=False))
+		return usage
+
+	def open_files(self, paths, new_window=False):
+		# the first file replaces the active window's image, the others
+		# and all of them with new_window get windows of their own
+		for i, path in enumerate(paths):
+			form = None
+			if i == 0 and not new_window:
+				form = QApplication.activeWindow() if QApplication.activeWindow() in self._windows else None
+				if form is None and self._windows:
+					form = self._windows[-1]
+			if form is None:
+				form = self.open_window(path)
+			else:
+				form.view(path)
+			form.showNormal()
+			form.raise_()
+			form.activateWindow()
+
+	def __listen(self):
+		profile.begin("resident server")
+		self._server = TResidentServer(self)
+		self._server.filesReceived.connect(self.__slot_files)
+		self._server.listen()
+		profile.end("resident server")
+
+	def __slot_files(self, command, paths):
+		self.open_files(paths, command == COMMAND_NEW)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Texture viewer")
+	parser.add_argument("files", nargs="*", help="image to open")
+	parser.add_argument("--new-window", action="store_true", help="open the files in new windows")
+	parser.add_argument(
+		"--resident", action="store_true", help="keep running without windows and serve later launches")
+	parser.add_argument(
+		"--thumbnails", nargs=2, metavar=("SRC", "DST"),
+		help="render thumbnails of the images under SRC into DST and exit")
+	parser.add_argument("--size", type=int, default=256, help="thumbnail size")
+	parser.add_argument("--format", choices=("png", "jpg"), default="png", help="thumbnail format")
+	parser.add_argument("--no-channels", action="store_true", help="skip the r, g, b, a splits")
+	parser.add_argument(
+		"--diff", nargs=2, metavar=("A", "B"),
+		help="compare the images A and B have in common, print a json report and exit")
+	parser.add_argument("--report", default=None, help="json report file of --diff")
+	parser.add_argument("--diff-images", default=None, metavar="DIR", help="amplified difference images of --diff")
+	parser.add_argument(
+		"--threshold", type=float, default=0.0, help="largest normalized error of an unchanged --diff pair")
+	parser.add_argument("--jobs", type=int, default=None, help="worker processes")
+	parser.add_argument("--no-cache", action="store_true", help="ignore the persistent thumbnail cache")
+	parser.add_argument(
+		"--vram-budget", type=int, default=VRAM_BUDGET // (1024 * 1024), metavar="MB",
+		help="video memory of the cached textures, shared by all windows")
+	parser.add_argument(
+		"--cpu-budget", type=int, default=PREFETCH_BUDGET // (1024 * 1024), metavar="MB",
+		help="memory of the decoded images, prefetched and shown, of all windows")
+	parser.add_argument(
+		"--profile-startup", action="store_true",
+		help="print the time spent in imports and startup phases once the first image is shown")
+	args = parser.parse_args(argv)
+	if args.profile_startup:
+		profile.enable()
+	if args.thumbnails:
+		# headless, no QApplication in this process
+		from thumbnails import make_thumbnails
+		return 1 if make_thumbnails(
+			*args.thumbnails, size=args.size, fmt=args.format, channels=not args.no_channels,
+			jobs=args.jobs, cache_root=None if args.no_cache else THUMBNAIL_CACHE) else 0
+	if args.diff:
+		from batchdiff import diff_trees
+		return 1 if diff_trees(
+			*args.diff, report=args.report, diff_dir=args.diff_images,
+			threshold=args.threshold, jobs=args.jobs) else 0
+
+	# must be called before the QApplication, the global share context is
+	# made with it and the OpenGLWidget contexts must match it
 	# set default OpenGL surface format
 	glformat = QSurfaceFormat()
 	glformat.setDepthBufferSize(24)
@@ -486,10 +2128,25 @@ if __name__ == '__main__':
 	glformat.setVersion(3, 1)
 	glformat.setProfile(QSurfaceFormat.CoreProfile)
 	QSurfaceFormat.setDefaultFormat(glformat)
+	# the viewports of all windows share programs, buffers and textures
+	QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+	# Create the Qt Application
+	profile.begin("QApplication")
+	app = QApplication(sys.argv[:1])
+	profile.end("QApplication")
 	# Create and show the form
-	form = TViewerWindow()
-	form.show()
-	sample = join(dirname(realpath(__file__)), "rgba.tga")
-	form.view(sample)
+	profile.begin("first window")
+	viewer = TViewerApplication(args.resident, args.vram_budget * 1024 * 1024, args.cpu_budget * 1024 * 1024)
+	if args.files:
+		viewer.open_files(args.files, True)
+	elif not args.resident:
+		viewer.open_window(join(dirname(realpath(__file__)), "rgba.tga"))
+	profile.end("first window")
 	# Run the main Qt loop
-	sys.exit(app.exec_())
+	return app.exec_()
+
+
+if __name__ == '__main__':
+	import multiprocessing
+	multiprocessing.freeze_support()
+	sys.exit(main())
@@ -0,0 +1,292 @@
+# persistent thumbnail cache
+# a SQLite index plus one encoded image file per thumbnail, shared by the
+# viewer and the batch thumbnailer, safe to use from several processes
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from os.path import join, dirname
+from startup import user_cache_dir
+
+
+THUMBNAIL_CACHE = user_cache_dir("thumbnails")
+THUMBNAIL_CACHE_BUDGET = 1024 * 1024 * 1024
+# evicted down to this fraction of the budget, so puts don't evict every time
+EVICT_TO = 0.9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbs (
+	path TEXT NOT NULL,
+	size INTEGER NOT NULL,
+	mtime INTEGER NOT NULL,
+	hash TEXT,
+	resolution INTEGER NOT NULL,
+	variant TEXT NOT NULL,
+	blob TEXT NOT NULL,
+	nbytes INTEGER NOT NULL,
+	atime REAL NOT NULL,
+	info TEXT,
+	stats TEXT,
+	PRIMARY KEY (path, resolution, variant)
+);
+CREATE INDEX IF NOT EXISTS thumbs_hash ON thumbs (hash, resolution, variant);
+CREATE INDEX IF NOT EXISTS thumbs_atime ON thumbs (atime);
+CREATE INDEX IF NOT EXISTS thumbs_blob ON thumbs (blob);
+"""
+
+
+class TThumbnail:
+	def __init__(self, filename, data, info, stats):
+		# data is the encoded image as stored, stats a TImageStats.summary()
+		self.filename = filename
+		self.data = data
+		self.info = info
+		self.stats = stats
+
+
+def file_key(filename):
+	# path, size and mtime, the cheap identity that needs only a stat
+	path = Path(filename).resolve()
+	st = path.stat()
+	return str(path), st.st_size, st.st_mtime_ns
+
+
+def content_hash(filename):
+	h = hashlib.blake2b(digest_size=20)
+	with open(filename, "rb") as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b""):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+class TThumbnailCache:
+	def __init__(self, root=THUMBNAIL_CACHE, budget=THUMBNAIL_CACHE_BUDGET, hashed=False):
+		# hashed: look up renamed or copied files by content before a miss,
+		# costs a full read of the source on a path miss
+		self.root = root
+		self.budget = budget
+		self.hashed = hashed
+		self.hits = 0
+		self.misses = 0
+		# set when the folder or index can not be written, every lookup
+		# misses and nothing is stored from then on
+		self.disabled = False
+		# one connection per cache, the lock serialises the pool threads;
+		# other processes are serialised by SQLite itself
+		self._lock = threading.Lock()
+		self._db = None
+		# running size of the blobs, counted once and then kept up to date by
+		# the puts of this process, recounted whenever it crosses the budget
+		self._nbytes = None
+
+	def __connect(self):
+		# with the lock held, the folder and index are made on first use
+		if self._db is None and not self.disabled:
+			try:
+				os.makedirs(self.root, exist_ok=True)
+				db = sqlite3.connect(
+					join(self.root, "index.db"), timeout=30.0, isolation_level=None, check_same_thread=False)
+				db.execute("PRAGMA journal_mode=WAL")
+				db.execute("PRAGMA synchronous=NORMAL")
+				db.executescript(SCHEMA)
+				self._db = db
+			except (OSError, sqlite3.Error) as e:
+				print(f"thumbnail cache disabled, {type(e).__name__}: {e}", flush=True)
+				self.disabled = True
+		return self._db
+
+	def close(self):
+		with self._lock:
+			if self._db is not None:
+				self._db.close()
+				self._db = None
+			self.disabled = True
+
+	def __blob_path(self, blob):
+		return join(self.root, blob[:2], blob)
+
+	def get(self, filename, resolution, variant=""):
+		# TThumbnail or None, the source file is only stat'ed
+		try:
+			path, size, mtime = file_key(filename)
+		except OSError:
+			return None
+		with self._lock:
+			if self.__connect() is None:
+				return None
+			row = self._db.execute(
+				"SELECT size, mtime, blob, info, stats FROM thumbs WHERE path=? AND resolution=? AND variant=?",
+				(path, resolution, variant)).fetchone()
+			if row is not None and (row[0], row[1]) != (size, mtime):
+				row = None
+		if row is None and self.hashed:
+			row = self.__get_by_hash(path, size, mtime, resolution, variant)
+		data = self.__read(row[2]) if row is not None else None
+		if data is None:
+			self.misses += 1
+			return None
+		with self._lock:
+			self._db.execute(
+				"UPDATE thumbs SET atime=? WHERE path=? AND resolution=? AND variant=?",
+				(time.time(), path, resolution, variant))
+		self.hits += 1
+		return TThumbnail(path, data, row[3], json.loads(row[4]) if row[4] else {})
+
+	def __get_by_hash(self, path, size, mtime, resolution, variant):
+		try:
+			digest = content_hash(path)
+		except OSError:
+			return None
+		with self._lock:
+			row = self._db.execute(
+				"SELECT size, mtime, blob, info, stats, nbytes FROM thumbs"
+				" WHERE hash=? AND resolution=? AND variant=? LIMIT 1",
+				(digest, resolution, variant)).fetchone()
+			if row is None:
+				return None
+			# same content under a new path, share the blob
+			self._db.execute(
+				"INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+				(path, size, mtime, digest, resolution, variant, row[2], row[5], time.time(), row[3], row[4]))
+		return row
+
+	def __read(self, blob):
+		# another process may have evicted it since the lookup
+		try:
+			with open(self.__blob_path(blob), "rb") as f:
+				return f.read()
+		except OSError:
+			return None
+
+	def put(self, filename, resolution, data, info="", stats=None, variant="", ext="png", digest=None):
+		# data is the encoded thumbnail, digest the content hash if known
+		try:
+			path, size, mtime = file_key(filename)
+		except OSError:
+			return
+		with self._lock:
+			if self.__connect() is None:
+				return
+		if digest is None and self.hashed:
+			digest = content_hash(path)
+		name = digest or hashlib.blake2b(f"{path}|{size}|{mtime}".encode(), digest_size=20).hexdigest()
+		blob = f"{name}_{resolution}{variant}.{ext}"
+		# write then rename, readers never see a partial file
+		blob_path = self.__blob_path(blob)
+		temp = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+		try:
+			os.makedirs(dirname(blob_path), exist_ok=True)
+			with open(temp, "wb") as f:
+				f.write(data)
+			os.replace(temp, blob_path)
+		except OSError as e:
+			# full disk or lost permissions, the thumbnail is just not kept
+			print(f"{type(e).__name__}:\n", e, flush=True)
+			return
+		with self._lock:
+			if self._nbytes is None:
+				self._nbytes = self.__nbytes()
+			old = self._db.execute(
+				"SELECT blob, nbytes FROM thumbs WHERE path=? AND resolution=? AND variant=?",
+				(path, resolution, variant)).fetchone()
+			shared = self._db.execute("SELECT nbytes FROM thumbs WHERE blob=? LIMIT 1", (blob,)).fetchone()
+			self._db.execute(
+				"INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+				(path, size, mtime, digest, resolution, variant, blob, len(data), time.time(),
+					info, json.dumps(stats) if stats else None))
+			self._nbytes += len(data) - (shared[0] if shared is not None else 0)
+			if old is not None and old[0] != blob and self.__unlink_unused([old[0]]):
+				self._nbytes -= old[1]
+			over = self._nbytes > self.budget
+		if over:
+			self.evict()
+
+	def info(self, filename):
+		# info string and stats of any cached resolution, None when stale
+		try:
+			path, size, mtime = file_key(filename)
+		except OSError:
+			return None
+		with self._lock:
+			if self.__connect() is None:
+				return None
+			row = self._db.execute(
+				"SELECT info, stats FROM thumbs WHERE path=? AND size=? AND mtime=? LIMIT 1",
+				(path, size, mtime)).fetchone()
+		if row is None:
+			return None
+		return row[0], json.loads(row[1]) if row[1] else {}
+
+	def nbytes(self):
+		with self._lock:
+			if self.__connect() is None:
+				return 0
+			return self.__nbytes()
+
+	def __nbytes(self):
+		# blobs shared by several rows are counted once
+		row = self._db.execute("SELECT SUM(n) FROM (SELECT MAX(nbytes) AS n FROM thumbs GROUP BY blob)").fetchone()
+		return row[0] or 0
+
+	def stats(self):
+		entries = files = nbytes = 0
+		with self._lock:
+			if self.__connect() is not None:
+				entries, = self._db.execute("SELECT COUNT(*) FROM thumbs").fetchone()
+				files, = self._db.execute("SELECT COUNT(DISTINCT path) FROM thumbs").fetchone()
+				nbytes = self.__nbytes()
+		return {
+			"entries": entries, "files": files, "bytes": nbytes, "budget": self.budget,
+			"hits": self.hits, "misses": self.misses,
+		}
+
+	def evict(self):
+		# least recently used blobs first, down to EVICT_TO of the budget
+		with self._lock:
+			if self.__connect() is None:
+				return
+			# other processes share the index, their puts count too
+			total = self._nbytes = self.__nbytes()
+			if total <= self.budget:
+				return
+			# one writer at a time, a concurrent evict sees the result
+			self._db.execute("BEGIN IMMEDIATE")
+			try:
+				blobs = []
+				for blob, nbytes in self._db.execute(
+						"SELECT blob, MAX(nbytes) FROM thumbs GROUP BY blob ORDER BY MAX(atime)").fetchall():
+					if total <= self.budget * EVICT_TO:
+						break
+					blobs.append(blob)
+					total -= nbytes
+				self._db.executemany("DELETE FROM thumbs WHERE blob=?", [(b,) for b in blobs])
+				self._db.execute("COMMIT")
+				self._nbytes = total
+			except BaseException:
+				self._db.execute("ROLLBACK")
+				raise
+			self.__unlink_unused(blobs)
+
+	def __unlink_unused(self, blobs):
+		# blobs no row refers to any more, returns those
+		unused = []
+		for blob in blobs:
+			if self._db.execute("SELECT 1 FROM thumbs WHERE blob=? LIMIT 1", (blob,)).fetchone() is None:
+				unused.append(blob)
+				try:
+					os.remove(self.__blob_path(blob))
+				except OSError:
+					pass
+		return unused
+
+	def clear(self):
+		with self._lock:
+			if self.__connect() is None:
+				return
+			blobs = [r[0] for r in self._db.execute("SELECT DISTINCT blob FROM thumbs").fetchall()]
+			self._db.execute("DELETE FROM thumbs")
+			self.__unlink_unused(blobs)
+			self._nbytes = 0
@@ -0,0 +1,257 @@
+# thumbnail grid of a folder
+# a virtualised list view, thumbnails are made on a pool only for the cells
+# the view asks for and dropped from the queue once they scroll away
+from collections import OrderedDict
+from pathlib import Path
+from PySide2.QtCore import Qt
+from PySide2.QtCore import QSize
+from PySide2.QtCore import Signal
+from PySide2.QtCore import QObject
+from PySide2.QtCore import QRunnable
+from PySide2.QtCore import QThreadPool
+from PySide2.QtCore import QByteArray
+from PySide2.QtCore import QBuffer
+from PySide2.QtCore import QAbstractListModel
+from PySide2.QtCore import QModelIndex
+from PySide2.QtGui import QImage
+from PySide2.QtGui import QPixmap
+from PySide2.QtGui import QColor
+from PySide2.QtWidgets import QListView
+from PySide2.QtWidgets import QAbstractItemView
+from startup import lazy_import, open_image
+# Pillow, loaded with the first thumbnail
+Image = lazy_import("PIL.Image")
+from thumbcache import TThumbnailCache
+from hdrimage import FLOAT_READERS, read_float, preview
+from imagestats import FLOAT_NAMES, pil_stats, float_stats
+
+
+GRID_THUMBNAIL_SIZE = 128
+# thumbnails kept as pixmaps, a few screens worth
+GRID_CACHE_ITEMS = 2000
+# rows around the visible ones that are still worth finishing
+GRID_MARGIN = 16
+
+
+def thumbnail_image(filename, size):
+	# small QImage straight from Pillow, draft lets jpeg decode at a fraction;
+	# with the info string and the statistics summary the cache keeps
+	if Path(filename).suffix.upper() in FLOAT_READERS:
+		image = read_float(filename)
+		a = image.array
+		info = f"{image.name} - {image.size} - {FLOAT_NAMES[a.shape[2]]};{a.itemsize * 8}F "
+		stats = float_stats(a)
+		rgb = preview(a, size)
+		h, w = rgb.shape[:2]
+		return QImage(rgb.tobytes(), w, h, w * 3, QImage.Format_RGB888).copy(), info, stats.summary()
+	with open_image(filename) as pim:
+		info = f"{pim.format} - {pim.size} - {pim.mode} "
+		full = pim.size
+		pim.draft("RGB", (size, size))
+		# of the draft, a jpeg is already reduced here
+		stats = pil_stats(pim)
+		stats.overview = pim.size != full
+		if pim.mode in ("I;16", "I;16B", "I;16L", "I"):
+			pim = pim.convert("I").point(lambda v: v / 256.0).convert("L")
+		elif pim.mode == "F":
+			pim = pim.point(lambda v: v * 255.0).convert("L")
+		pim.thumbnail((size, size), Image.BILINEAR)
+		pim = pim.convert("RGBA")
+		data = pim.tobytes()
+		return QImage(data, pim.size[0], pim.size[1], QImage.Format_RGBA8888).copy(), info, stats.summary()
+
+
+def encode_png(image):
+	data = QByteArray()
+	buffer = QBuffer(data)
+	buffer.open(QBuffer.WriteOnly)
+	image.save(buffer, "PNG")
+	buffer.close()
+	return bytes(data)
+
+
+class TThumbnailSignals(QObject):
+	# row key, QImage or None when cancelled or failed
+	loaded = Signal(object, object)
+
+
+class TThumbnailTask(QRunnable):
+	def __init__(self, filename, key, size, cache, is_wanted):
+		super(TThumbnailTask, self).__init__()
+		self.signals = TThumbnailSignals()
+		self._filename = filename
+		self._key = key
+		self._size = size
+		self._cache = cache
+		self._is_wanted = is_wanted
+
+	def run(self):
+		image = None
+		# scrolled away while waiting in the queue
+		if self._is_wanted(self._key):
+			try:
+				image = self.__load()
+			except Exception as e:
+				print(f"{type(e).__name__}:\n", e, flush=True)
+		self.signals.loaded.emit(self._key, image)
+
+	def __load(self):
+		if self._cache is not None:
+			thumbnail = self._cache.get(self._filename, self._size)
+			if thumbnail is not None:
+				return QImage.fromData(thumbnail.data)
+		image, info, stats = thumbnail_image(self._filename, self._size)
+		if self._cache is not None and not image.isNull():
+			self._cache.put(self._filename, self._size, encode_png(image), info, stats)
+		return image
+
+
+class TThumbnailModel(QAbstractListModel):
+	def __init__(self, parent=None, size=GRID_THUMBNAIL_SIZE, cache_root=None):
+		super(TThumbnailModel, self).__init__(parent)
+		self._files = []
+		self._size = size
+		# key is (generation, row), a new folder makes every queued task stale
+		self._generation = 0
+		self._visible = (0, -1)
+		self._pixmaps = OrderedDict()
+		self._inflight = set()
+		self._cache = TThumbnailCache(cache_root) if cache_root else None
+		# own pool, thumbnails must not hold up the viewport decode
+		self._pool = QThreadPool(self)
+		self._pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() - 1))
+		self._placeholder = QPixmap(size, size)
+		self._placeholder.fill(QColor(0, 0, 0, 0))
+
+	def set_files(self, files):
+		self.beginResetModel()
+		self._files = list(files)
+		self._generation += 1
+		self._pixmaps.clear()
+		self._inflight.clear()
+		self._visible = (0, -1)
+		self.endResetModel()
+		# queued tasks of the previous folder are not started at all
+		self._pool.clear()
+
+	def files(self):
+		return self._files
+
+	def set_visible(self, first, last):
+		self._visible = (first, last)
+
+	def filename(self, index):
+		return self._files[index.row()]
+
+	def rowCount(self, parent=QModelIndex()):
+		return 0 if parent.isValid() else len(self._files)
+
+	def data(self, index, role=Qt.DisplayRole):
+		if not index.isValid():
+			return None
+		row = index.row()
+		if role == Qt.DisplayRole:
+			return Path(self._files[row]).name
+		if role == Qt.ToolTipRole:
+			return self._files[row]
+		if role == Qt.DecorationRole:
+			# only visible cells are asked for, so this is the lazy load
+			key = (self._generation, row)
+			pixmap = self._pixmaps.get(key)
+			if pixmap is not None:
+				self._pixmaps.move_to_end(key)
+				return pixmap
+			if key not in self._inflight:
+				self.__load(key)
+			return self._placeholder
+		return None
+
+	def __load(self, key):
+		self._inflight.add(key)
+		task = TThumbnailTask(self._files[key[1]], key, self._size, self._cache, self.__is_wanted)
+		task.signals.loaded.connect(self.__slot_loaded, Qt.QueuedConnection)
+		self._pool.start(task)
+
+	def __is_wanted(self, key):
+		# called from pool threads, reads only immutable tuples
+		generation, row = key
+		first, last = self._visible
+		return generation == self._generation and first - GRID_MARGIN <= row <= last + GRID_MARGIN
+
+	def __slot_loaded(self, key, image):
+		self._inflight.discard(key)
+		if key[0] != self._generation:
+			return
+		if image is None:
+			# cancelled, asked for again if it scrolls back in
+			if not self.__is_wanted(key):
+				return
+			image = QImage()
+		self._pixmaps[key] = QPixmap.fromImage(image) if not image.isNull() else self._placeholder
+		while len(self._pixmaps) > GRID_CACHE_ITEMS:
+			self._pixmaps.popitem(last=False)
+		index = self.index(key[1])
+		self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class TThumbnailGrid(QListView):
+	# emitted with the filename of a cell made current or activated
+	fileActivated = Signal(str)
+
+	def __init__(self, parent=None, size=GRID_THUMBNAIL_SIZE, cache_root=None):
+		super(TThumbnailGrid, self).__init__(parent)
+		self._model = TThumbnailModel(self, size, cache_root)
+		self.setModel(self._model)
+		self.setViewMode(QListView.IconMode)
+		self.setMovement(QListView.Static)
+		self.setResizeMode(QListView.Adjust)
+		self.setSelectionMode(QAbstractItemView.SingleSelection)
+		self.setIconSize(QSize(size, size))
+		self.setGridSize(QSize(size + 16, size + 32))
+		self.setWordWrap(False)
+		# same sized cells and batched layout keep 10k+ rows cheap
+		self.setUniformItemSizes(True)
+		self.setLayoutMode(QListView.Batched)
+		self.setBatchSize(256)
+		# a click or the arrow keys move the current cell, enter or a double
+		# click activate it; each file is emitted once, not for both
+		self._activated = None
+		self.activated.connect(self.__slot_activated)
+		self.selectionModel().currentChanged.connect(self.__slot_activated)
+		self.verticalScrollBar().valueChanged.connect(self.__update_visible)
+
+	def set_files(self, files):
+		if files != self._model.files():
+			self._model.set_files(files)
+			self.__update_visible()
+
+	def select(self, filename):
+		files = self._model.files()
+		if filename in files:
+			# shown already, moving the current cell does not emit it back
+			self._activated = filename
+			index = self._model.index(files.index(filename))
+			self.setCurrentIndex(index)
+			self.scrollTo(index)
+
+	def resizeEvent(self, event):
+		super(TThumbnailGrid, self).resizeEvent(event)
+		self.__update_visible()
+
+	def __update_visible(self):
+		# row range under the viewport, decode requests outside it go stale
+		# from the grid, indexAt misses between cells
+		rect = self.viewport().rect()
+		grid = self.gridSize()
+		columns = max(1, rect.width() // grid.width())
+		first = self.verticalScrollBar().value() // grid.height() * columns
+		last = first + (rect.height() // grid.height() + 2) * columns - 1
+		self._model.set_visible(first, last)
+
+	def __slot_activated(self, index):
+		if not index.isValid():
+			return
+		filename = self._model.filename(index)
+		if filename != self._activated:
+			self._activated = filename
+			self.fileActivated.emit(filename)
@@ -0,0 +1,256 @@
+# batch thumbnails and channel splits
+# every worker process owns an offscreen context and draws with the viewer
+# shaders, so thumbnails look exactly like the viewport
+import os
+import sys
+import ctypes
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from PySide2.QtCore import Qt
+from PySide2.QtCore import QCoreApplication
+from PySide2.QtCore import QBuffer
+from PySide2.QtCore import QByteArray
+from PySide2.QtGui import QGuiApplication
+from PySide2.QtGui import QSurfaceFormat
+from PySide2.QtGui import QOffscreenSurface
+from PySide2.QtGui import QOpenGLContext
+from PySide2.QtGui import QOpenGLFramebufferObject
+from PySide2.QtGui import QOpenGLVertexArrayObject
+from PySide2.QtGui import QOpenGLBuffer
+from PySide2.QtGui import QColor
+from PySide2.QtGui import QVector4D
+from PySide2.QtGui import QImage
+from OpenGL import GL
+from dds import supported_formats
+from thumbcache import TThumbnailCache, THUMBNAIL_CACHE
+from imagestats import image_stats
+# decoders and gl helpers only, the workers never load the viewer's widgets
+from imagedecode import SUPPORTED_IMAGES, OVERVIEW_SIZE, decode_image
+from gltexture import QUAD_INDICES, QUAD_VERTICES, VS_TEXTURE, FS_TEXTURE, VS_GRID, FS_GRID
+from gltexture import channels_matrix, create_program, create_texture, create_compressed_texture
+from gltexture import tone_values, source_uniforms, DEFAULT_GAMMA, TONEMAP_REINHARD
+
+
+THUMBNAIL_SIZE = 256
+# suffix, channel toggles
+VARIANTS = (
+	("", (1, 1, 1, 1)),
+	("_r", (1, 0, 0, 0)),
+	("_g", (0, 1, 0, 0)),
+	("_b", (0, 0, 1, 0)),
+	("_a", (0, 0, 0, 1)),
+)
+
+# renderer and cache of the worker process
+_renderer = None
+_cache = None
+
+
+class TThumbnailRenderer:
+	def __init__(self):
+		# no window system, the software rasterizer is enough for thumbnails
+		self._surface = QOffscreenSurface()
+		self._surface.setFormat(QSurfaceFormat.defaultFormat())
+		self._surface.create()
+		self._context = QOpenGLContext()
+		self._context.setFormat(QSurfaceFormat.defaultFormat())
+		if not self._context.create():
+			raise RuntimeError("OpenGL context creation failed")
+		self._context.makeCurrent(self._surface)
+		self._compressed_formats = supported_formats(lambda e: self._context.hasExtension(e.encode()))
+		self._max_texture_size = int(GL.glGetIntegerv(GL.GL_MAX_TEXTURE_SIZE))
+
+		self._program = create_program(self._context, VS_TEXTURE, FS_TEXTURE, ("Pos", "UV"))
+		self._program_bg = create_program(self._context, VS_GRID, FS_GRID, ("Pos",))
+		self._program_bg.bind()
+		self._program_bg.setUniformValue("Color1", QColor.fromRgbF(0.65, 0.65, 0.65, 1.0))
+		self._program_bg.setUniformValue("Color2", QColor.fromRgbF(0.90, 0.90, 0.90, 1.0))
+
+		# same quad as the viewport
+		self._vao = QOpenGLVertexArrayObject()
+		self._vao.create()
+		self._vao.bind()
+		self._vbo = QOpenGLBuffer(QOpenGLBuffer.VertexBuffer)
+		self._vbo.create()
+		self._vbo.bind()
+		sz_float = ctypes.sizeof(ctypes.c_float)
+		self._vbo.allocate(QUAD_VERTICES.tobytes(), sz_float * len(QUAD_VERTICES))
+		self._ibo = QOpenGLBuffer(QOpenGLBuffer.IndexBuffer)
+		self._ibo.create()
+		self._ibo.bind()
+		self._ibo.allocate(QUAD_INDICES.tobytes(), QUAD_INDICES.itemsize * len(QUAD_INDICES))
+		self._program.bind()
+		# units of the samplers that are never used here, a samplerCube left on
+		# unit 0 next to the sampler2D fails every draw
+		self._program.setUniformValue("TextureB", 1)
+		self._program.setUniformValue("Cube", 2)
+		self._program.setAttributeBuffer(0, GL.GL_FLOAT, 0, 3, 5 * sz_float)
+		self._program.enableAttributeArray(0)
+		self._program.setAttributeBuffer(1, GL.GL_FLOAT, 3 * sz_float, 2, 5 * sz_float)
+		self._program.enableAttributeArray(1)
+		self._vao.release()
+
+	def render(self, filename, size, variants):
+		# returns the decoded header and a QImage per variant,
+		# aspect fitted into size x size
+		data = decode_image(
+			filename, max_size=min(self._max_texture_size, OVERVIEW_SIZE),
+			compressed_formats=self._compressed_formats)
+		if data is None:
+			return None, []
+		w, h = data.size
+		k = size / max(w, h)
+		fbo = QOpenGLFramebufferObject(max(1, round(w * k)), max(1, round(h * k)))
+		fbo.bind()
+		GL.glViewport(0, 0, fbo.width(), fbo.height())
+
+		if data.compressed is not None:
+			texture = create_compressed_texture(data.compressed)
+		elif data.pixels is not None:
+			texture = create_texture(data.pixels)
+		else:
+			texture = create_texture(data.image)
+
+		self._program_bg.bind()
+		self._program_bg.setUniformValue("Height", QVector4D(0, fbo.height(), 0, 0))
+		self._program.bind()
+		self._program.setUniformValue("Scale", 1.0, 1.0, 0.0, 0.0)
+		self._program.setUniformValue("Tile", 0.0, 0.0, 1.0, 1.0)
+		source, add = source_uniforms(data.source)
+		self._program.setUniformValue("Source", source)
+		self._program.setUniformValue("Add", add)
+		self._program.setUniformValue("Flip", 1.0 if data.flip else 0.0)
+		# floats are tonemapped, 8-bit images pass through
+		tonemap = TONEMAP_REINHARD if data.linear else 0
+		self._program.setUniformValue("Tone", *tone_values(0.0, DEFAULT_GAMMA, tonemap, data.linear))
+
+		images = []
+		self._vao.bind()
+		for channels in variants:
+			GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+			self._program_bg.bind()
+			GL.glDrawElements(GL.GL_TRIANGLES, len(QUAD_INDICES), GL.GL_UNSIGNED_INT, None)
+			GL.glEnable(GL.GL_BLEND)
+			GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+			self._program.bind()
+			self._program.setUniformValue("Channels", channels_matrix(*channels))
+			texture.bind()
+			GL.glDrawElements(GL.GL_TRIANGLES, len(QUAD_INDICES), GL.GL_UNSIGNED_INT, None)
+			GL.glDisable(GL.GL_BLEND)
+			# opaque, jpeg has no alpha and the checkerboard is already under it
+			images.append(fbo.toImage().convertToFormat(QImage.Format_RGB32))
+		self._vao.release()
+		texture.destroy()
+		fbo.release()
+		return data.header(), images
+
+
+def encode_image(image, fmt="PNG"):
+	data = QByteArray()
+	buffer = QBuffer(data)
+	buffer.open(QBuffer.WriteOnly)
+	image.save(buffer, fmt)
+	buffer.close()
+	return bytes(data)
+
+
+def _init_worker(cache_root):
+	global _renderer, _cache
+	# offscreen platform and software gl, the workers never open a window
+	os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+	if sys.platform.startswith("linux"):
+		os.environ.setdefault("LIBGL_ALWAYS_SOFTWARE", "1")
+	QCoreApplication.setAttribute(Qt.AA_UseSoftwareOpenGL)
+	glformat = QSurfaceFormat()
+	glformat.setVersion(3, 1)
+	glformat.setProfile(QSurfaceFormat.CoreProfile)
+	QSurfaceFormat.setDefaultFormat(glformat)
+	# kept alive for the lifetime of the process
+	_init_worker.app = QGuiApplication([sys.argv[0]])
+	_renderer = TThumbnailRenderer()
+	if cache_root:
+		_cache = TThumbnailCache(cache_root)
+
+
+def _thumbnail(job):
+	# runs in a worker, returns (filename, outputs, error)
+	filename, output, size, fmt, channels = job
+	variants = VARIANTS if channels else VARIANTS[:1]
+	try:
+		images = _cached(filename, size, variants)
+		if images is None:
+			data, images = _renderer.render(filename, size, [v[1] for v in variants])
+			if _cache is not None and data is not None:
+				stats = _stats(filename, data)
+				for (suffix, _), image in zip(variants, images):
+					_cache.put(filename, size, encode_image(image), data.info, stats, suffix)
+		outputs = []
+		for (suffix, _), image in zip(variants, images):
+			path = f"{output}{suffix}.{fmt}"
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			if not image.save(path, fmt.upper(), 90 if fmt == "jpg" else -1):
+				raise IOError(f"can't write {path}")
+			outputs.append(path)
+		return filename, outputs, None
+	except Exception as e:
+		return filename, [], str(e)
+
+
+def _stats(filename, data):
+	# summary kept with the thumbnails, of the overview for a tiled image
+	try:
+		stats = image_stats(filename, data.pixels)
+	except Exception as e:
+		print(f"{filename}: no statistics, {type(e).__name__}: {e}", file=sys.stderr)
+		return None
+	stats.overview = data.tiled
+	return stats.summary()
+
+
+def _cached(filename, size, variants):
+	# all variants from the cache or None, the source is not opened
+	if _cache is None:
+		return None
+	images = []
+	for suffix, _ in variants:
+		thumbnail = _cache.get(filename, size, suffix)
+		if thumbnail is None:
+			return None
+		images.append(QImage.fromData(thumbnail.data))
+	return images
+
+
+def find_images(src):
+	# supported images under src, a single file is returned as it is
+	src = Path(src)
+	if src.is_file():
+		return [src]
+	suffixes = {"." + s for s in SUPPORTED_IMAGES}
+	images = []
+	for root, _, files in os.walk(src):
+		images.extend(Path(root, f) for f in sorted(files) if Path(f).suffix.upper() in suffixes)
+	return images
+
+
+def make_thumbnails(
+		src, dst, size=THUMBNAIL_SIZE, fmt="png", channels=True, jobs=None, cache_root=THUMBNAIL_CACHE):
+	# mirrors the tree of src into dst, returns the number of failed images;
+	# cache_root None renders everything again
+	src_root = Path(src) if Path(src).is_dir() else Path(src).parent
+	images = find_images(src)
+	tasks = [
+		(str(f), str(Path(dst, f.relative_to(src_root).with_suffix(""))), size, fmt, channels)
+		for f in images
+	]
+	failed = 0
+	jobs = jobs or os.cpu_count() or 1
+	with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(cache_root,)) as pool:
+		# chunks keep the per file overhead of the pool low
+		chunksize = max(1, len(tasks) // (jobs * 4))
+		for filename, outputs, error in pool.map(_thumbnail, tasks, chunksize=chunksize):
+			if error is None and outputs:
+				print(f"{filename} -> {len(outputs)} file(s)")
+			else:
+				failed += 1
+				print(f"{filename}: {error or 'unsupported'}", file=sys.stderr)
+	return failed